@@ -0,0 +1,119 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Packed store holding all decoded clips of a dataset in one memory-mapped int16 array."""
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from cache import (
+    READ_CHUNK_SIZE,
+    begin_entry,
+    decode_audio,
+    encode_audio,
+    end_entry,
+    is_complete,
+    read_index,
+)
+
+WRITE_BATCH_SIZE = 1024
+
+
+class PackedAudioStore:
+    """Stores every clip of a dataset as one row of a contiguous [clips, samples] int16 array.
+
+    Clips are padded or cropped to desired_samples when packed, so the row index is the
+    offset index. The audio uses the int16 layout of DatasetCache and the paths are kept in the
+    index of the entry, which marks it as complete. Reading a partition gathers the rows of
+    each chunk from the memory-mapped array instead of opening and decoding one wav file per
+    clip.
+
+    Args:
+        data_dir: Directory of the dataset, the store is kept inside of it.
+        desired_samples: Number of samples per clip.
+    """
+
+    def __init__(self, data_dir, desired_samples):
+        self.data_dir = str(data_dir)
+        self.desired_samples = desired_samples
+        self.path = os.path.join(self.data_dir, f".packed_audio_{desired_samples}")
+        self._audio = None
+        self._rows = None
+
+    def contains(self, paths):
+        """Whether all given wav paths are part of the store."""
+        if not is_complete(self.path):
+            return False
+        self._open()
+        return all(self._relative(path) in self._rows for path in paths)
+
+    def pack(self, paths, dataset):
+        """Writes the decoded clips to the store.
+
+        Args:
+            paths: Wav paths in the order of the dataset.
+            dataset: TF dataset of decoded audio in range [-1, 1], one clip per path.
+        """
+        tmp = begin_entry(self.path)
+
+        print(f"Packing {len(paths)} clips to {self.path}...")
+        audio = np.lib.format.open_memmap(
+            os.path.join(tmp, "audio.npy"),
+            mode="w+",
+            dtype=np.int16,
+            shape=(len(paths), self.desired_samples),
+        )
+        start = 0
+        for batch in dataset.batch(WRITE_BATCH_SIZE):
+            batch = encode_audio(tf.reshape(batch, [-1, self.desired_samples])).numpy()
+            audio[start : start + len(batch)] = batch
+            start += len(batch)
+        audio.flush()
+        del audio
+
+        relative = [self._relative(path) for path in paths]
+        # A store missing clips is replaced by one holding all of them.
+        end_entry(tmp, self.path, {"num_samples": len(paths), "paths": relative}, replace=True)
+        self._audio = None
+        self._rows = None
+
+    def load(self, paths, labels, silence_index):
+        """Returns a TF dataset of (audio, label) equal to the output of AudioProcessor.load_files.
+
+        Args:
+            paths: Wav paths of the partition in order.
+            labels: Label index of every path.
+            silence_index: Label index whose audio is replaced by zeros.
+        """
+        self._open()
+        rows = np.array([self._rows[self._relative(path)] for path in paths], dtype=np.int64)
+        # Silence reads no audio, the row past the end is mapped to zeros by the gather.
+        rows[np.array(labels) == silence_index] = len(self._audio)
+        audio = self._audio
+
+        def _gather(chunk_rows):
+            chunk = np.zeros((len(chunk_rows), self.desired_samples), dtype=np.int16)
+            # The rows are read in file order, silence rows past the end stay zero.
+            targets = np.argsort(chunk_rows, kind="stable")
+            targets = targets[chunk_rows[targets] < len(audio)]
+            chunk[targets] = audio[chunk_rows[targets]]
+            return chunk
+
+        def _read_chunk(chunk_rows, chunk_labels):
+            chunk = tf.numpy_function(_gather, [chunk_rows], tf.int16, stateful=False)
+            chunk = decode_audio(chunk, [-1, self.desired_samples, 1])
+            return chunk, chunk_labels
+
+        dataset = tf.data.Dataset.from_tensor_slices((rows, np.array(labels, dtype=np.int32)))
+        dataset = dataset.batch(READ_CHUNK_SIZE)
+        dataset = dataset.map(_read_chunk, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+        return dataset.unbatch()
+
+    def _open(self):
+        if self._audio is None:
+            self._audio = np.load(os.path.join(self.path, "audio.npy"), mmap_mode="r")
+            paths = read_index(self.path)["paths"]
+            self._rows = {path: row for row, path in enumerate(paths)}
+
+    def _relative(self, path):
+        return os.path.relpath(tf.compat.as_str(path), self.data_dir)
@@ -0,0 +1,184 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Persistent on-disk cache for decoded keyword spotting audio and features."""
+
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+CACHE_VERSION = 1
+SHARD_SIZE = 2048  # Clips per shard file.
+READ_CHUNK_SIZE = 256  # Clips handed to tf.data per generator step.
+AUDIO_SCALE = 32768  # decode_wav maps int16 PCM to [-1, 1) by dividing by this.
+INDEX_FILE = "index.json"  # Written last, so it doubles as completion marker of an entry.
+
+
+def encode_audio(audio):
+    """Converts decoded audio in range [-1, 1] to int16 PCM."""
+    return tf.cast(tf.round(tf.multiply(audio, AUDIO_SCALE)), tf.int16)
+
+
+def decode_audio(audio, shape):
+    """Converts int16 PCM back to float clips of load_wav_file, reshaped to shape."""
+    return tf.reshape(tf.divide(tf.cast(audio, tf.float32), AUDIO_SCALE), shape)
+
+
+def is_complete(directory):
+    """Whether the entry in directory was completely written by begin_entry and end_entry."""
+    return (Path(directory) / INDEX_FILE).exists()
+
+
+def begin_entry(target):
+    """Returns a new temporary directory to write the entry for target into."""
+    target = Path(target)
+    tmp = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    return tmp
+
+
+def end_entry(tmp, target, index, replace=False):
+    """Writes the index of an entry and moves it from tmp to target.
+
+    Args:
+        tmp: Directory returned by begin_entry.
+        target: Final directory of the entry.
+        index: JSON serializable description of the entry, read back by read_index.
+        replace: Whether an existing entry is replaced. Otherwise the entry of another process
+            which finished first is kept.
+    """
+    with open(Path(tmp) / INDEX_FILE, "w") as handle:
+        json.dump(index, handle)
+    if replace:
+        shutil.rmtree(target, ignore_errors=True)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Another process finished the same entry first, keep theirs.
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def read_index(directory):
+    """Returns the index written by end_entry."""
+    with open(Path(directory) / INDEX_FILE, "r") as handle:
+        return json.load(handle)
+
+
+def cache_key(split, words_list, model_settings, micro, files):
+    """Derives a stable key identifying one cached dataset partition.
+
+    Args:
+        split: Name of the partition, one of 'training', 'validation' or 'testing'.
+        words_list: List of labels including silence and unknown.
+        model_settings: Dictionary of common model settings.
+        micro: Whether the micro frontend is used for feature generation.
+        files: List of (path, label index) tuples making up the partition.
+
+    Returns:
+        Hex digest string.
+    """
+    files_hash = hashlib.sha1()
+    for path, label in files:
+        files_hash.update(tf.compat.as_bytes(f"{label} {path}\n"))
+    description = {
+        "version": CACHE_VERSION,
+        "split": split,
+        "words": list(words_list),
+        "model_settings": model_settings,
+        "micro": bool(micro),
+        "files": files_hash.hexdigest(),
+    }
+    encoded = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha1(tf.compat.as_bytes(encoded)).hexdigest()
+
+
+class DatasetCache:
+    """Stores one dataset partition as sharded .npy files which are memory-mapped on read.
+
+    Two kinds of entries are kept per partition: the decoded audio as int16 PCM, which is
+    valid for every pipeline, and the final features, which are only valid for pipelines
+    without random augmentation.
+    """
+
+    AUDIO = "audio"
+    FEATURES = "features"
+
+    def __init__(self, cache_dir, split, words_list, model_settings, micro, files):
+        self.split = split
+        self.model_settings = model_settings
+        key = cache_key(split, words_list, model_settings, micro, files)
+        self.path = Path(cache_dir) / f"{split}_{key[:16]}"
+
+    def has_audio(self):
+        return self._is_complete(self.AUDIO)
+
+    def has_features(self):
+        return self._is_complete(self.FEATURES)
+
+    def write_audio(self, dataset):
+        """Decodes the given (audio, label) dataset once and stores it as int16 PCM."""
+
+        def _to_int16(audio, label):
+            return encode_audio(tf.reshape(audio, [-1])), label
+
+        self._write(self.AUDIO, dataset.map(_to_int16, num_parallel_calls=tf.data.AUTOTUNE))
+
+    def write_features(self, dataset):
+        """Stores the given (features, label) dataset as float32 features."""
+        self._write(self.FEATURES, dataset)
+
+    def load_audio(self):
+        """Returns a TF dataset of (audio, label) equal to the output of load_files."""
+        desired_samples = self.model_settings["desired_samples"]
+
+        def _to_float(audio, label):
+            return decode_audio(audio, [desired_samples, 1]), label
+
+        dataset = self._read(self.AUDIO, tf.int16, [desired_samples])
+        return dataset.map(_to_float, num_parallel_calls=tf.data.AUTOTUNE)
+
+    def load_features(self):
+        """Returns a TF dataset of (features, label) equal to the output of create_features."""
+        return self._read(self.FEATURES, tf.float32, [self.model_settings["fingerprint_size"]])
+
+    def _is_complete(self, kind):
+        return is_complete(self.path / kind)
+
+    def _write(self, kind, dataset):
+        target = self.path / kind
+        tmp = begin_entry(target)
+
+        shard_sizes = []
+        print(f"Caching {kind} of {self.split} set to {target}...")
+        for shard_idx, (values, labels) in enumerate(dataset.batch(SHARD_SIZE)):
+            np.save(tmp / f"data_{shard_idx:05d}.npy", values.numpy())
+            np.save(tmp / f"labels_{shard_idx:05d}.npy", labels.numpy())
+            shard_sizes.append(len(labels))
+
+        index = {"num_samples": int(np.sum(shard_sizes)), "shards": shard_sizes}
+        end_entry(tmp, target, index)
+
+    def _read(self, kind, dtype, shape):
+        directory = self.path / kind
+        num_shards = len(read_index(directory)["shards"])
+
+        def _generator():
+            for shard_idx in range(num_shards):
+                values = np.load(directory / f"data_{shard_idx:05d}.npy", mmap_mode="r")
+                labels = np.load(directory / f"labels_{shard_idx:05d}.npy", mmap_mode="r")
+                for start in range(0, len(labels), READ_CHUNK_SIZE):
+                    end = start + READ_CHUNK_SIZE
+                    yield values[start:end], labels[start:end]
+
+        dataset = tf.data.Dataset.from_generator(
+            _generator,
+            output_signature=(
+                tf.TensorSpec(shape=[None, *shape], dtype=dtype),
+                tf.TensorSpec(shape=[None], dtype=tf.int32),
+            ),
+        )
+        return dataset.unbatch()
@@ -139,6 +139,7 @@ def main():
         testing_percentage=FLAGS.testing_percentage,
         model_settings=model_settings,
         micro=FLAGS.micro,
+        cache_dir=FLAGS.cache_dir,
     )
 
     model = models.get_model(model_settings, FLAGS.model_architecture)
@@ -154,7 +155,7 @@ def main():
     )
 
     # Test the newly converted model on the test set.
-    tflite_test(model_settings, audio_processor, FLAGS.tflite_path)
+    tflite_test(model_settings, audio_processor, FLAGS.tflite_path, FLAGS.out)
 
 
 if __name__ == "__main__":
@@ -180,6 +181,14 @@ if __name__ == "__main__":
         Where to download the speech training data to.
         """,
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="""\
+        Where to persist decoded audio and features between runs. Disabled if not set.
+        """,
+    )
     parser.add_argument(
         "--silence_percentage",
         type=float,
@@ -283,6 +292,12 @@ if __name__ == "__main__":
         default="",
         help="Path to TFLite file to use for testing.",
     )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default=None,
+        help="File which should contain the test accuracy of the converted model.",
+    )
     parser.add_argument(
         "--micro",
         dest="micro",
@@ -21,14 +21,10 @@
 
 import os
 import re
-import sys
-import urllib
 from pathlib import Path
-import tarfile
 import hashlib
 import random
 import math
-from tqdm import tqdm
 from enum import Enum
 
 import numpy as np
@@ -38,6 +34,12 @@ from tensorflow.lite.experimental.microfrontend.python.ops import (
     audio_microfrontend_op as frontend_op,
 )
 
+from audio_store import PackedAudioStore
+from cache import DatasetCache
+from dataset_index import DatasetIndex
+from download import download_and_extract
+from micro_frontend import MicroFrontend
+
 try:
     AUTOTUNE = tf.data.AUTOTUNE
 except:
@@ -96,7 +98,7 @@ def calculate_features(
         window_size_ms = (window_size * 1000) / 16000
         window_step_ms = (window_stride * 1000) / 16000
         int16_input = tf.cast(tf.multiply(audio_signal, 32768), tf.int16)
-        reshaped = tf.reshape(int16_input, (16000, 1))
+        reshaped = tf.reshape(int16_input, (-1, 1))
         micro_frontend = frontend_op.audio_microfrontend(
             reshaped,
             sample_rate=16000,
@@ -120,6 +122,56 @@ def calculate_features(
     return features
 
 
+def calculate_features_batch(
+    audio_batch,
+    window_size,
+    window_stride,
+    num_bins,
+):
+    """Returns micro frontend features for a whole batch of audio signals.
+
+    Gives bit-identical results to calculate_features with micro=True, but runs the
+    frontend once per batch through the NumPy implementation in micro_frontend.
+
+    Args:
+        audio_batch: Raw audio signals in range [-1, 1] of shape [batch, samples, 1].
+        window_size: Window size in samples for calculating spectrogram
+        window_stride: Window stride in samples for calculating spectrogram
+        num_bins: The number of frequency bins wanted.
+
+    Returns:
+        Calculated features of shape [batch, slices, num_bins, 1].
+    """
+    frontend = get_micro_frontend(
+        sample_rate=16000,
+        window_size=(window_size * 1000) / 16000,
+        window_step=(window_stride * 1000) / 16000,
+        num_channels=num_bins,
+    )
+    int16_input = tf.cast(tf.multiply(audio_batch, 32768), tf.int16)
+    reshaped = tf.reshape(int16_input, (tf.shape(audio_batch)[0], -1))
+    micro_frontend = tf.numpy_function(
+        lambda audio: frontend(audio)[0],
+        [reshaped],
+        tf.uint16,
+        stateful=False,
+    )
+    micro_frontend = tf.cast(micro_frontend, tf.float32)
+    features = tf.multiply(micro_frontend, (10.0 / 256.0))
+    return tf.expand_dims(features, -1)
+
+
+_MICRO_FRONTENDS = {}
+
+
+def get_micro_frontend(**kwargs):
+    """Returns a shared MicroFrontend for the given settings, tables are only built once."""
+    key = tuple(sorted(kwargs.items()))
+    if key not in _MICRO_FRONTENDS:
+        _MICRO_FRONTENDS[key] = MicroFrontend(**kwargs)
+    return _MICRO_FRONTENDS[key]
+
+
 def which_set(filename, validation_percentage, testing_percentage):
     """Determines which data partition the file should belong to.
 
@@ -142,6 +194,19 @@ def which_set(filename, validation_percentage, testing_percentage):
     Returns:
         String, one of 'training', 'validation', or 'testing'.
     """
+    percentage_hash = set_percentage(filename)
+    return percentage_to_set(percentage_hash, validation_percentage, testing_percentage)
+
+
+def set_percentage(filename):
+    """Returns the hash percentage in [0, 100] which_set uses to assign a file to a set.
+
+    Args:
+        filename: File path of the data sample.
+
+    Returns:
+        Float percentage which only depends on the part of the file name before '_nohash_'.
+    """
     base_name = os.path.basename(filename)
     # We want to ignore anything after '_nohash_' in the file name when
     # deciding which set to put a wav in, so the data set creator has a way of
@@ -155,9 +220,22 @@ def which_set(filename, validation_percentage, testing_percentage):
     # itself, so we do a hash of that and then use that to generate a
     # probability value that we use to assign it.
     hash_name_hashed = hashlib.sha1(tf.compat.as_bytes(hash_name)).hexdigest()
-    percentage_hash = (int(hash_name_hashed, 16) % (MAX_NUM_WAVS_PER_CLASS + 1)) * (
+    return (int(hash_name_hashed, 16) % (MAX_NUM_WAVS_PER_CLASS + 1)) * (
         100.0 / MAX_NUM_WAVS_PER_CLASS
     )
+
+
+def percentage_to_set(percentage_hash, validation_percentage, testing_percentage):
+    """Maps the hash percentage of a file to the name of its data partition.
+
+    Args:
+        percentage_hash: Percentage as returned by set_percentage.
+        validation_percentage: How much of the data set to use for validation.
+        testing_percentage: How much of the data set to use for testing.
+
+    Returns:
+        String, one of 'training', 'validation', or 'testing'.
+    """
     if percentage_hash < validation_percentage:
         result = "validation"
     elif percentage_hash < (testing_percentage + validation_percentage):
@@ -199,13 +277,21 @@ class AudioProcessor:
         model_settings,
         micro=True,
         minimal=False,
+        cache_dir=None,
+        batch_frontend=False,
+        packed_audio=False,
     ):
         self.data_dir = Path(data_dir)
         self.model_settings = model_settings
         self.words_list = prepare_words_list(wanted_words)
         self.micro = micro
+        self.cache_dir = cache_dir
+        self.batch_frontend = batch_frontend
+        self.packed_audio = packed_audio
+        self._packed_store = None
 
         self._tf_datasets = {}
+        self._set_files = {}
         self.background_data = None
         self._set_size = {"training": 0, "validation": 0, "testing": 0}
 
@@ -243,27 +329,31 @@ class AudioProcessor:
             ValueError: If mode is not recognised.
         """
         if mode == AudioProcessor.Modes.TRAINING:
-            dataset = self._tf_datasets["training"]
+            set_index = "training"
         elif mode == AudioProcessor.Modes.VALIDATION:
-            dataset = self._tf_datasets["validation"]
+            set_index = "validation"
         elif mode == AudioProcessor.Modes.TESTING:
-            dataset = self._tf_datasets["testing"]
+            set_index = "testing"
         else:
-            ValueError("Incorrect dataset type given")
+            raise ValueError("Incorrect dataset type given")
 
         use_background = (self.background_data is not None) and (
             mode == AudioProcessor.Modes.TRAINING
         )
+        augmented = time_shift > 0 or (use_background and background_frequency > 0)
+
+        cache = self._get_cache(set_index)
+        if cache is not None and not augmented:
+            # Without augmentation the features are deterministic and can be stored directly.
+            if not cache.has_features():
+                cache.write_features(
+                    self._add_features(self._load_audio(set_index, cache).batch(256))
+                )
+            return cache.load_features()
+
         dataset = (
-            dataset.map(
-                lambda path, label: self.load_files(
-                    path,
-                    label,
-                    self.model_settings,
-                ),
-                num_parallel_calls=AUTOTUNE,
-            )
-            .cache()
+            self._load_audio(set_index, cache)
+            .batch(256)
             .map(
                 lambda audio, label: self.add_shift(
                     audio,
@@ -273,7 +363,6 @@ class AudioProcessor:
                 ),
                 num_parallel_calls=AUTOTUNE,
             )
-            .batch(256)
             .map(
                 lambda audio, label: self.add_background(
                     audio,
@@ -286,20 +375,36 @@ class AudioProcessor:
                 ),
                 num_parallel_calls=AUTOTUNE,
             )
-            .unbatch()
-            .map(
-                lambda audio, label: self.create_features(
+        )
+
+        return self._add_features(dataset)
+
+    def _add_features(self, dataset):
+        """Turns a batched (audio, label) dataset into an unbatched (features, label) dataset.
+
+        Features are computed per batch if the batched micro frontend is enabled and per
+        sample otherwise.
+        """
+        if self.batch_frontend and self.micro:
+            return dataset.map(
+                lambda audio, label: self.create_features_batch(
                     audio,
                     label,
                     self.model_settings,
-                    micro=self.micro,
                 ),
                 num_parallel_calls=AUTOTUNE,
-            )
+            ).unbatch()
+
+        return dataset.unbatch().map(
+            lambda audio, label: self.create_features(
+                audio,
+                label,
+                self.model_settings,
+                micro=self.micro,
+            ),
+            num_parallel_calls=AUTOTUNE,
         )
 
-        return dataset
-
     def set_size(self, mode):
         """Get the number of samples in the requested dataset partition.
 
@@ -321,6 +426,75 @@ class AudioProcessor:
         else:
             ValueError("Incorrect dataset type given")
 
+    def _get_cache(self, set_index):
+        """Returns the persistent cache for a partition or None if caching is disabled."""
+        if self.cache_dir is None:
+            return None
+        return DatasetCache(
+            self.cache_dir,
+            set_index,
+            self.words_list,
+            self.model_settings,
+            self.micro,
+            self._set_files[set_index],
+        )
+
+    def _load_audio(self, set_index, cache=None):
+        """Returns the decoded (audio, label) dataset of a partition.
+
+        Args:
+            set_index: Name of the partition, one of 'training', 'validation' or 'testing'.
+            cache: Optional DatasetCache, audio is decoded only once and then read from disk.
+
+        Returns:
+            TF dataset of decoded audio and labels.
+        """
+        if self.packed_audio:
+            paths, labels = zip(*self._set_files[set_index])
+            dataset = self._get_packed_store().load(paths, labels, SILENCE_INDEX)
+            if cache is None:
+                # Already memory-mapped, an in-memory copy would only cost RAM.
+                return dataset
+        else:
+            dataset = self._tf_datasets[set_index].map(
+                lambda path, label: self.load_files(
+                    path,
+                    label,
+                    self.model_settings,
+                ),
+                num_parallel_calls=AUTOTUNE,
+            )
+            if cache is None:
+                return dataset.cache()
+
+        if not cache.has_audio():
+            cache.write_audio(dataset)
+        return cache.load_audio()
+
+    def _get_packed_store(self):
+        """Returns the packed audio store of the dataset, packing all clips on first use."""
+        if self._packed_store is not None:
+            return self._packed_store
+
+        desired_samples = self.model_settings["desired_samples"]
+        store = PackedAudioStore(self.data_dir, desired_samples)
+        paths = [path for files in self._set_files.values() for path, _ in files]
+        if not store.contains(paths):
+            wav_paths, words, _ = DatasetIndex(self.data_dir, set_percentage).scan()
+            wav_paths = [
+                path
+                for path, word in zip(wav_paths, words)
+                if word.lower() != BACKGROUND_NOISE_DIR_NAME
+            ]
+            dataset = tf.data.Dataset.from_tensor_slices(wav_paths).map(
+                lambda path: load_wav_file(path, desired_samples=desired_samples)[0],
+                num_parallel_calls=AUTOTUNE,
+            )
+            store.pack(wav_paths, dataset)
+
+        self._packed_store = store
+        return store
+
     @staticmethod
     def load_files(
         path,
@@ -343,28 +517,41 @@ class AudioProcessor:
         model_settings,
         time_shift_samples,
     ):
-        desired_samples = model_settings["desired_samples"]
+        """Shifts every clip of a batch by its own random amount, padding gaps with zeros.
 
-        # Shift samples start position and pad any gaps with zeros.
-        if time_shift_samples > 0:
-            time_shift_amount = tf.random.uniform(
-                shape=(),
-                minval=-time_shift_samples,
-                maxval=time_shift_samples,
-                dtype=tf.int32,
-            )
-        else:
-            time_shift_amount = 0
-        if time_shift_amount > 0:
-            time_shift_padding = [[time_shift_amount, 0], [0, 0]]
-            time_shift_offset = [0, 0]
-        else:
-            time_shift_padding = [[0, -time_shift_amount], [0, 0]]
-            time_shift_offset = [-time_shift_amount, 0]
+        Args:
+            audio: Batch of clips of shape [batch, samples, 1].
+            label: Batch of labels.
+            model_settings: Dictionary of common model settings.
+            time_shift_samples: Shifts are drawn uniformly from [-time_shift_samples,
+                time_shift_samples).
 
-        padded_foreground = tf.pad(audio, time_shift_padding, mode="CONSTANT")
-        sliced_foreground = tf.slice(padded_foreground, time_shift_offset, [desired_samples, -1])
-        return sliced_foreground, label
+        Returns:
+            Tuple of the shifted audio and the labels.
+        """
+        if time_shift_samples <= 0:
+            return audio, label
+
+        desired_samples = model_settings["desired_samples"]
+        batch_size = tf.shape(audio)[0]
+        time_shift_amount = tf.random.uniform(
+            shape=(batch_size, 1),
+            minval=-time_shift_samples,
+            maxval=time_shift_samples,
+            dtype=tf.int32,
+        )
+        # Zero pad every clip on both sides, then read one window per clip with a single gather.
+        # A positive shift delays the clip, so the window starts earlier in the padded clip.
+        padded_length = desired_samples + 2 * time_shift_samples
+        padded = tf.pad(audio[..., 0], [[0, 0], [time_shift_samples, time_shift_samples]])
+        window_start = (
+            tf.range(batch_size)[:, tf.newaxis] * padded_length
+            + time_shift_samples
+            - time_shift_amount
+        )
+        indices = window_start + tf.range(desired_samples)[tf.newaxis, :]
+        shifted = tf.gather(tf.reshape(padded, [-1]), indices)[..., tf.newaxis]
+        return shifted, label
 
     @staticmethod
     def add_background(
@@ -376,32 +563,55 @@ class AudioProcessor:
         use_background,
         background_data,
     ):
+        """Mixes independent background noise into every clip of a batch.
+
+        Each row draws its own noise file, offset, volume and whether noise is added at all.
+        The noise segments are read with one gather from the concatenated noise files.
+
+        Args:
+            audio: Batch of clips of shape [batch, samples, 1].
+            label: Batch of labels.
+            model_settings: Dictionary of common model settings.
+            background_frequency: How many of the samples have background noise mixed in.
+            background_volume_range: How loud the background noise should be, between 0 and 1.
+            use_background: Whether to mix in noise at all.
+            background_data: Ragged tensor with one row of PCM samples per noise file.
+
+        Returns:
+            Tuple of the mixed audio and the labels.
+        """
+        if not use_background:
+            return tf.clip_by_value(audio, -1.0, 1.0), label
+
         desired_samples = model_settings["desired_samples"]
+        batch_size = tf.shape(audio)[0]
 
-        if use_background:
-            background_index = tf.random.uniform(
-                shape=(), maxval=background_data.shape[0], dtype=tf.int32
-            )
-            background_sample = background_data[background_index]
-            background_offset = tf.random.uniform(
-                shape=(),
-                maxval=len(background_sample) - desired_samples,
-                dtype=tf.int32,
-            )
-            background_clipped = background_sample[
-                background_offset : (background_offset + desired_samples)
-            ]
-            background_reshaped = tf.reshape(background_clipped, [desired_samples, 1])
-            if tf.random.uniform(shape=(), maxval=1) < background_frequency:
-                background_volume = tf.random.uniform(shape=(), maxval=background_volume_range)
-            else:
-                background_volume = tf.constant(0, dtype="float32")
-        else:
-            background_reshaped = np.zeros([desired_samples, 1], dtype=np.float32)
-            background_volume = tf.constant(0, dtype="float32")
+        background_index = tf.random.uniform(
+            shape=(batch_size,), maxval=background_data.shape[0], dtype=tf.int32
+        )
+        row_splits = tf.cast(background_data.row_splits, tf.int32)
+        background_start = tf.gather(row_splits, background_index)
+        num_offsets = tf.gather(row_splits[1:] - row_splits[:-1], background_index)
+        num_offsets = num_offsets - desired_samples
+        # Uniform integer offset in [0, num_offsets) of the drawn file for every row.
+        background_offset = tf.cast(
+            tf.random.uniform(shape=(batch_size,)) * tf.cast(num_offsets, tf.float32), tf.int32
+        )
+        background_offset = tf.minimum(background_offset, num_offsets - 1)
+        indices = (background_start + background_offset)[:, tf.newaxis] + tf.range(desired_samples)
+        background_clipped = tf.gather(background_data.values, indices)[..., tf.newaxis]
+
+        enabled = tf.random.uniform(shape=(batch_size,), maxval=1) < background_frequency
+        background_volume = tf.where(
+            enabled,
+            tf.random.uniform(shape=(batch_size,), maxval=background_volume_range),
+            tf.zeros((batch_size,)),
+        )
 
         # Mix in background noise.
-        background_mul = tf.multiply(background_reshaped, background_volume)
+        background_mul = tf.multiply(
+            background_clipped, background_volume[:, tf.newaxis, tf.newaxis]
+        )
         background_add = tf.add(background_mul, audio)
         background_clamp = tf.clip_by_value(background_add, -1.0, 1.0)
 
@@ -428,63 +638,33 @@ class AudioProcessor:
 
         return features, label
 
+    @staticmethod
+    def create_features_batch(
+        audio,
+        label,
+        model_settings,
+    ):
+        features = calculate_features_batch(
+            audio,
+            model_settings["window_size_samples"],
+            model_settings["window_stride_samples"],
+            model_settings["dct_coefficient_count"],
+        )
+        features = tf.reshape(features, [tf.shape(audio)[0], -1])
+
+        return features, label
+
     def _download_and_extract_data(self, data_url, target_directory):
         """Downloads and extracts file to target directory.
 
-        If the file does not already exist download it and then untar into the target directory.
+        If the dataset was not completely extracted yet, fetch the tarball and untar it into
+        the target directory. The data_url may also be a local path to the tarball.
 
         Args:
             data_url: Web link to the tarred data to download.
             target_directory: Directory to download and extract to.
         """
-        target_directory = Path(target_directory)
-
-        filename = data_url.split("/")[-1]
-        filepath = target_directory / filename
-
-        if not target_directory.exists() or (
-            target_directory.exists() and len(os.listdir(target_directory)) == 0
-        ):
-            target_directory.mkdir(exist_ok=True, parents=True)
-
-            def _report_hook(block_num, block_size, total_size):
-                """Function to track download progress in urllib"""
-                read_so_far = block_num * block_size
-                percent = (read_so_far / total_size) * 100.0
-
-                s = f"\rDownloading {filename} {percent:.1f}%"
-
-                sys.stdout.write(s)
-                sys.stdout.flush()
-
-            def my_hook(t):
-                last_b = [0]
-
-                def update_to(b=1, bsize=1, tsize=None):
-                    """
-                    b  : int, optional
-                        Number of blocks transferred so far [default: 1].
-                    bsize  : int, optional
-                        Size of each block (in tqdm units) [default: 1].
-                    tsize  : int, optional
-                        Total size (in tqdm units). If [default: None] remains unchanged.
-                    """
-                    if tsize is not None:
-                        t.total = tsize
-                    t.update((b - last_b[0]) * bsize)
-                    last_b[0] = b
-
-                return update_to
-
-            # filepath, _ = urllib.request.urlretrieve(data_url, filepath, _report_hook)
-            with tqdm(
-                unit="B", unit_scale=True, unit_divisor=1024, miniters=100, desc="Dataset"
-            ) as t:
-                filepath, _ = urllib.request.urlretrieve(data_url, filepath, reporthook=my_hook(t))
-            print()
-
-            print(f"Untarring {filename}...")
-            tarfile.open(filepath, "r:gz").extractall(target_directory)
+        download_and_extract(data_url, target_directory)
 
     def _prepare_datasets(
         self,
@@ -558,6 +738,7 @@ class AudioProcessor:
             # Transform into TF Datasets ready for easier processing later.
             labels, paths = list(zip(*[d.values() for d in data_index[set_index]]))
             labels = [word_to_index[label] for label in labels]
+            self._set_files[set_index] = list(zip(paths, labels))
             self._tf_datasets[set_index] = tf.data.Dataset.from_tensor_slices((list(paths), labels))
 
     def _find_and_sort_wavs(
@@ -586,8 +767,10 @@ class AudioProcessor:
         unknown_index = {"validation": [], "testing": [], "training": []}
         all_words = {}
 
-        for wav_path in tf.io.gfile.glob(str(search_pattern)):
-            word = Path(wav_path).parent.name.lower()
+        # Equal to globbing search_pattern, but only new files are listed and hashed.
+        wav_paths, words, percentages = DatasetIndex(self.data_dir, set_percentage).scan()
+        for wav_path, word, percentage in zip(wav_paths, words, percentages):
+            word = word.lower()
 
             # Treat the '_background_noise_' folder as a special case, since we expect
             # it to contain long audio samples we mix in to improve training.
@@ -595,7 +778,7 @@ class AudioProcessor:
                 continue
 
             all_words[word] = True
-            set_index = which_set(wav_path, validation_percentage, testing_percentage)
+            set_index = percentage_to_set(percentage, validation_percentage, testing_percentage)
             # If it's a known class, store its detail, otherwise add it to the list
             # we'll use to train the unknown label.
             if word in wanted_words_index:
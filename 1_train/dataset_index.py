@@ -0,0 +1,101 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Persistent index of the wav files of a keyword spotting dataset."""
+
+import os
+
+import numpy as np
+
+INDEX_VERSION = 1
+INDEX_FILENAME = ".wav_index.npz"
+
+
+class DatasetIndex:
+    """Lists the `<data_dir>/<word>/*.wav` files together with their split percentage.
+
+    Scanning the dataset and hashing every file name takes several seconds, so the result
+    is stored as a columnar .npz file inside the data directory. A word directory is only
+    listed again if its mtime changed, and only file names not seen before are hashed. The
+    files are returned in directory listing order, the same order as tf.io.gfile.glob.
+
+    Args:
+        data_dir: Directory containing one subdirectory per word.
+        percentage_fn: Function mapping a file path to its split percentage in [0, 100].
+    """
+
+    def __init__(self, data_dir, percentage_fn):
+        self.data_dir = str(data_dir)
+        self.percentage_fn = percentage_fn
+        self.path = os.path.join(self.data_dir, INDEX_FILENAME)
+
+    def scan(self):
+        """Returns the paths, word directory names and split percentages of all wav files."""
+        stored = self._load()
+        entries = {}
+        changed = False
+        for word in os.listdir(self.data_dir):
+            word_dir = os.path.join(self.data_dir, word)
+            if not os.path.isdir(word_dir):
+                continue
+            mtime = os.stat(word_dir).st_mtime_ns
+            if word in stored and stored[word][0] == mtime:
+                entries[word] = stored[word]
+                continue
+
+            changed = True
+            known = {}
+            if word in stored:
+                known = dict(zip(stored[word][1], stored[word][2]))
+            names = [name for name in os.listdir(word_dir) if name.endswith(".wav")]
+            percentages = [
+                known[name] if name in known else self.percentage_fn(os.path.join(word_dir, name))
+                for name in names
+            ]
+            entries[word] = (mtime, names, percentages)
+
+        if changed or entries.keys() != stored.keys():
+            self._save(entries)
+
+        paths, words, percentages = [], [], []
+        for word, (_, names, word_percentages) in entries.items():
+            paths.extend(os.path.join(self.data_dir, word, name) for name in names)
+            words.extend([word] * len(names))
+            percentages.extend(word_percentages)
+        return paths, words, np.array(percentages, dtype=np.float64)
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as index:
+                if int(index["version"]) != INDEX_VERSION:
+                    return {}
+                offsets = index["offsets"]
+                names = index["names"].tolist()
+                percentages = index["percentages"].tolist()
+                return {
+                    str(word): (int(mtime), names[start:end], percentages[start:end])
+                    for word, mtime, start, end in zip(
+                        index["words"], index["mtimes"], offsets[:-1], offsets[1:]
+                    )
+                }
+        except (OSError, KeyError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        names = [name for _, word_names, _ in entries.values() for name in word_names]
+        percentages = [value for _, _, values in entries.values() for value in values]
+        sizes = [len(word_names) for _, word_names, _ in entries.values()]
+        tmp = f"{self.path}.tmp-{os.getpid()}.npz"
+        try:
+            np.savez(
+                tmp,
+                version=INDEX_VERSION,
+                words=np.array(list(entries.keys()), dtype=str),
+                mtimes=np.array([mtime for mtime, _, _ in entries.values()], dtype=np.int64),
+                offsets=np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+                names=np.array(names, dtype=str),
+                percentages=np.array(percentages, dtype=np.float64),
+            )
+            os.replace(tmp, self.path)
+        except OSError:
+            # A read-only dataset is fine, it is just scanned again next time.
+            if os.path.exists(tmp):
+                os.remove(tmp)
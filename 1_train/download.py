@@ -0,0 +1,217 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Resumable download and streaming extraction of the speech commands dataset."""
+
+import os
+import json
+import hashlib
+import tarfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from tqdm import tqdm
+
+COMPLETE_MARKER = ".complete"
+INCOMPLETE_MARKER = ".incomplete"
+CHUNK_SIZE = 1 << 20
+MAX_PENDING_WRITES = 256
+
+# Checksums of known datasets, used if the URL has none.
+KNOWN_SHA256 = {
+    "http://download.tensorflow.org/data/speech_commands_v0.02.tar.gz": (
+        "af14739ee7dc311471de98f5f9d2c9191b18aedfe957f4a6ff791c709868ff58"
+    ),
+}
+
+
+def is_extracted(target_directory):
+    """Whether the dataset in target_directory was completely extracted.
+
+    Directories filled before markers were introduced count as complete unless they
+    contain the marker of an interrupted run.
+    """
+    target_directory = Path(target_directory)
+    if (target_directory / COMPLETE_MARKER).exists():
+        return True
+    if (target_directory / INCOMPLETE_MARKER).exists():
+        return False
+    return target_directory.exists() and len(os.listdir(target_directory)) > 0
+
+
+def download_and_extract(data_url, target_directory):
+    """Fetches the tarball behind data_url and extracts it into target_directory.
+
+    The data_url may be a http(s) URL, a file:// URL or a local path to a tarball. An
+    expected checksum can be appended as fragment, e.g. `...tar.gz#sha256=<hex digest>`,
+    known datasets are checked against KNOWN_SHA256 otherwise. Interrupted downloads are
+    resumed and interrupted extractions are redone.
+
+    Args:
+        data_url: Location of the tarred data.
+        target_directory: Directory to download and extract to.
+    """
+    target_directory = Path(target_directory)
+    if is_extracted(target_directory):
+        return
+
+    target_directory.mkdir(exist_ok=True, parents=True)
+    (target_directory / INCOMPLETE_MARKER).touch()
+
+    url, expected_sha256 = _split_checksum(data_url)
+    expected_sha256 = expected_sha256 or KNOWN_SHA256.get(url)
+    tarball = fetch(url, target_directory)
+    sha256 = _sha256(tarball)
+    if expected_sha256 is not None and sha256 != expected_sha256:
+        if tarball.parent == target_directory:
+            tarball.unlink()
+        raise Exception(f"Checksum mismatch for {url}: expected {expected_sha256}, got {sha256}")
+
+    print(f"Untarring {tarball.name}...")
+    extract(tarball, target_directory)
+
+    with open(target_directory / COMPLETE_MARKER, "w") as handle:
+        json.dump({"source": url, "sha256": sha256}, handle)
+    (target_directory / INCOMPLETE_MARKER).unlink()
+
+
+def fetch(url, directory):
+    """Returns the local path of the tarball, downloading it into directory if needed.
+
+    Downloads go to a `.part` file first and continue where they stopped if the server
+    supports range requests. The ETag, modification time and size of the remote file are
+    stored next to it, a download only continues if they did not change.
+    """
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme in ("", "file"):
+        return Path(urllib.request.url2pathname(parsed.path) if parsed.scheme else url)
+
+    filepath = Path(directory) / parsed.path.split("/")[-1]
+    if filepath.exists():
+        return filepath
+
+    partial = filepath.with_name(filepath.name + ".part")
+    # ETag, modification time and size of the remote file when the download started.
+    validators_path = filepath.with_name(filepath.name + ".part.json")
+    validators = {}
+    if partial.exists() and validators_path.exists():
+        with open(validators_path, "r") as handle:
+            validators = json.load(handle)
+    offset = partial.stat().st_size if validators else 0
+
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        # Servers send the whole file instead of the range if it changed meanwhile.
+        if_range = validators.get("etag") or validators.get("last_modified")
+        if if_range:
+            headers["If-Range"] = if_range
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+    except urllib.error.HTTPError as error:
+        if error.code != 416:
+            raise
+        if validators.get("size") != offset:
+            # The remote file shrank, start over.
+            partial.unlink()
+            validators_path.unlink()
+            return fetch(url, directory)
+        # Range starts at the end of the file, the previous run only missed the rename.
+        os.replace(partial, filepath)
+        validators_path.unlink()
+        return filepath
+
+    with response:
+        current = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        if response.status == 206:
+            size = response.headers.get("Content-Range", "/*").split("/")[-1]
+            current["size"] = int(size) if size != "*" else None
+            if any(
+                None not in (validators.get(name), current[name])
+                and current[name] != validators[name]
+                for name in ["etag", "last_modified", "size"]
+            ):
+                # The remote file changed, the range does not continue the partial file.
+                partial.unlink()
+                validators_path.unlink()
+                return fetch(url, directory)
+        else:
+            offset = 0  # No range support or a changed file, start over.
+            length = response.headers.get("Content-Length")
+            current["size"] = int(length) if length is not None else None
+            with open(validators_path, "w") as handle:
+                json.dump(current, handle)
+
+        total = current["size"] if current["size"] is not None else validators.get("size")
+        with open(partial, "ab" if offset else "wb") as handle, tqdm(
+            total=total,
+            initial=offset,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            miniters=100,
+            desc="Dataset",
+        ) as progress:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                handle.write(chunk)
+                progress.update(len(chunk))
+
+    if total is not None and partial.stat().st_size != total:
+        raise Exception(f"Download of {url} incomplete, rerun to resume")
+    os.replace(partial, filepath)
+    validators_path.unlink()
+    return filepath
+
+
+def extract(tarball, target_directory, num_threads=8):
+    """Extracts a gzipped tarball, writing files in threads while the stream is decompressed.
+
+    Args:
+        tarball: Path of the .tar.gz file.
+        target_directory: Directory to extract to.
+        num_threads: Number of threads writing the extracted files.
+    """
+    target_directory = Path(target_directory).resolve()
+    pending = set()
+    with tarfile.open(tarball, "r|gz") as archive, ThreadPoolExecutor(num_threads) as executor:
+        for member in archive:
+            path = (target_directory / member.name).resolve()
+            if target_directory not in path.parents and path != target_directory:
+                raise Exception(f"Refusing to extract {member.name} outside of the target")
+            if member.isdir():
+                path.mkdir(parents=True, exist_ok=True)
+            elif member.isfile():
+                # The stream can only be read in order, so the content is read here and only
+                # the write is handed to the pool.
+                content = archive.extractfile(member).read()
+                pending.add(executor.submit(_write_file, path, content))
+                if len(pending) >= MAX_PENDING_WRITES:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+        for future in pending:
+            future.result()
+
+
+def _write_file(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as handle:
+        handle.write(content)
+
+
+def _split_checksum(data_url):
+    url, _, fragment = data_url.partition("#")
+    checksum = dict(urllib.parse.parse_qsl(fragment)).get("sha256")
+    return url, checksum.lower() if checksum else None
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
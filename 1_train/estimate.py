@@ -1,4 +1,10 @@
+import sys
+import csv
+import json
+import struct
 import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 import tflite.Model
 
@@ -7,18 +13,56 @@ import numpy as np
 from student.estimate import (
     estimate_rom,
     estimate_ram,
+    plan_arena,
+    plan_memory,
     estimate_conv2d_macs,
     estimate_depthwise_conv2d_macs,
     estimate_fully_connected_macs,
+    estimate_lstm_macs,
+    estimate_pool2d_macs,
+    estimate_elementwise_macs,
+    estimate_reduce_macs,
+    estimate_softmax_macs,
     MyTensor,
     MyLayer,
 )
 
 
+INPLACE_OPS = ["RESHAPE"]  # Operators which can reuse the buffer of their input.
+
 TYPES_MAP = {
     tflite.TensorType.INT8: "int8",
+    tflite.TensorType.INT16: "int16",  # Cell state of quantized LSTMs.
     tflite.TensorType.INT32: "int32",
 }
+
+# Rough cost of the TFLite Micro kernels on the ESP32-C3 (RV32IMC at 160 MHz, no SIMD) as
+# (cycles per MAC, fixed cycles per invocation). The MACs of operators without multiplications
+# are the elementwise operations counted by estimate_macs_per_layer. Measure on the device and
+# pass a table with --cycle_table for precise numbers.
+ESP32C3_CLOCK_MHZ = 160
+ESP32C3_CYCLES = {
+    "CONV_2D": (5.0, 2000),
+    "DEPTHWISE_CONV_2D": (7.0, 2000),
+    "FULLY_CONNECTED": (4.0, 1000),
+    "UNIDIRECTIONAL_SEQUENCE_LSTM": (6.0, 5000),
+    "AVERAGE_POOL_2D": (3.0, 1000),
+    "MAX_POOL_2D": (3.0, 1000),
+    "MEAN": (4.0, 1500),
+    "REDUCE_MAX": (3.0, 1500),
+    "ADD": (30.0, 1000),  # Both inputs are rescaled to a common scale.
+    "SUB": (30.0, 1000),
+    "MUL": (20.0, 1000),
+    "SOFTMAX": (30.0, 1500),
+    "LOGISTIC": (25.0, 1000),
+    "TANH": (25.0, 1000),
+    "RELU": (4.0, 500),
+    "RELU6": (4.0, 500),
+    "QUANTIZE": (20.0, 500),
+    "RESHAPE": (0.0, 500),
+    "STRIDED_SLICE": (0.0, 1000),
+}
+DEFAULT_CYCLES = (10.0, 1500)  # Operators missing from the cycle table.
 # Load tflite flatbuffer to object tree.
 
 
@@ -30,53 +74,216 @@ def load_model(filename):
     return model
 
 
-def get_tensors(m, g):
-    tensors = []
-    for tensor_idx in range(g.TensorsLength()):
-        tensor = g.Tensors(tensor_idx)
-        assert tensor.Type() in [
-            tflite.TensorType.INT8,
-            tflite.TensorType.INT32,
-        ], "Unsupported Tensor type (Needs quantized model)"
-        shape = tensor.ShapeAsNumpy().tolist()
-        name = tensor.Name()
-        dtype = TYPES_MAP[tensor.Type()]
-        buf = m.Buffers(tensor.Buffer())
-        is_const = buf.DataLength() > 0
-        tensors.append(MyTensor(tensor_idx, name, shape, dtype, is_const))
-    return tensors
-
-
-def get_layers(m, g):
-    layers = []
-    for op_idx in range(g.OperatorsLength()):
-        op = g.Operators(op_idx)
-        op_code = m.OperatorCodes(op.OpcodeIndex())
-        op_code_id = op_code.BuiltinCode()
-        name = tflite.opcode2name(op_code_id)
-        inputs = []
-        for input_idx in range(op.InputsLength()):
-            tensor_index = op.Inputs(input_idx)
-            inputs.append(tensor_index)
-        outputs = []
-        for output_idx in range(op.OutputsLength()):
-            tensor_index = op.Outputs(output_idx)
-            outputs.append(tensor_index)
-
-        layers.append(MyLayer(op_idx, name, inputs, outputs))
-    return layers
-
-
-def estimate_macs_per_layer(op, m, graph):
-    op_code = m.OperatorCodes(op.OpcodeIndex())
+BATCH_FIELDS = ["model", "rom", "ram", "macs", "arena", "latency_ms", "error"]
+
+MAX_RANK = 6
+TENSOR_DTYPE = np.dtype(
+    [
+        ("type", np.int8),  # tflite.TensorType
+        ("rank", np.int8),
+        ("shape", np.int32, (MAX_RANK,)),  # Padded with ones.
+        ("is_const", np.bool_),
+        ("is_variable", np.bool_),
+    ]
+)
+OP_DTYPE = np.dtype(
+    [
+        ("opcode", np.int32),  # tflite.BuiltinOperator
+        # Ranges of the inputs and outputs in ModelArrays.op_inputs and ModelArrays.op_outputs.
+        ("inputs_start", np.int32),
+        ("inputs_end", np.int32),
+        ("outputs_start", np.int32),
+        ("outputs_end", np.int32),
+        # Builtin options needed by the MACs estimation, has_options is False if they are missing.
+        ("has_options", np.bool_),
+        ("depth_multiplier", np.int32),  # DEPTHWISE_CONV_2D
+        ("filter_height", np.int32),  # AVERAGE_POOL_2D, MAX_POOL_2D
+        ("filter_width", np.int32),
+        ("time_major", np.bool_),  # UNIDIRECTIONAL_SEQUENCE_LSTM
+    ]
+)
+POOL_OPS = [tflite.BuiltinOperator.AVERAGE_POOL_2D, tflite.BuiltinOperator.MAX_POOL_2D]
+
+
+def read_options(op, options_class):
+    """Returns the builtin options of op as options_class, or None if it has other options."""
+    if op.BuiltinOptionsType() != getattr(tflite.BuiltinOptions, options_class.__name__):
+        return None
+    table = op.BuiltinOptions()
+    options = options_class()
+    options.Init(table.Bytes, table.Pos)
+    return options
+
+
+class ModelArrays:
+    """Tensors and operators of a TFLite model, read from the flatbuffer in a single pass.
+
+    Every access to the flatbuffer goes through the generated accessors and costs several
+    Python calls, so each field is read once and stored in NumPy structured arrays. The
+    ROM, RAM and MACs estimators all work on these arrays.
+
+    Args:
+        m: The TFLite model returned by load_model.
+    """
+
+    def __init__(self, m):
+        assert m.SubgraphsLength() == 1, "Multi-subgraph models are currently not supported"
+        graph = m.Subgraphs(0)
+
+        buffer_lengths = [m.Buffers(idx).DataLength() for idx in range(m.BuffersLength())]
+        num_tensors = graph.TensorsLength()
+        self.tensors = np.zeros(num_tensors, dtype=TENSOR_DTYPE)
+        self.tensors["shape"] = 1
+        self.names = []
+        for tensor_idx in range(num_tensors):
+            tensor = graph.Tensors(tensor_idx)
+            row = self.tensors[tensor_idx]
+            rank = tensor.ShapeLength()
+            assert rank <= MAX_RANK, "Unsupported shape"
+            if rank:
+                row["shape"][:rank] = tensor.ShapeAsNumpy()
+            row["rank"] = rank
+            row["type"] = tensor.Type()
+            row["is_const"] = buffer_lengths[tensor.Buffer()] > 0
+            row["is_variable"] = tensor.IsVariable()
+            self.names.append(tensor.Name())
+        # Quantized LSTMs have empty float intermediates only carrying quantization parameters.
+        is_empty = np.any(self.tensors["shape"] == 0, axis=1)
+        is_supported = np.isin(self.tensors["type"], list(TYPES_MAP))
+        assert np.all(is_supported | is_empty), "Unsupported Tensor type (Needs quantized model)"
+
+        opcodes = [m.OperatorCodes(idx).BuiltinCode() for idx in range(m.OperatorCodesLength())]
+        num_ops = graph.OperatorsLength()
+        self.ops = np.zeros(num_ops, dtype=OP_DTYPE)
+        op_inputs = []
+        op_outputs = []
+        num_inputs = num_outputs = 0
+        for op_idx in range(num_ops):
+            op = graph.Operators(op_idx)
+            inputs = op.InputsAsNumpy() if op.InputsLength() else np.zeros(0, np.int32)
+            outputs = op.OutputsAsNumpy() if op.OutputsLength() else np.zeros(0, np.int32)
+            op_inputs.append(inputs)
+            op_outputs.append(outputs)
+            row = self.ops[op_idx]
+            row["opcode"] = opcodes[op.OpcodeIndex()]
+            row["inputs_start"] = num_inputs
+            row["inputs_end"] = num_inputs + len(inputs)
+            row["outputs_start"] = num_outputs
+            row["outputs_end"] = num_outputs + len(outputs)
+            if row["opcode"] == tflite.BuiltinOperator.DEPTHWISE_CONV_2D:
+                options = read_options(op, tflite.DepthwiseConv2DOptions)
+                if options is not None:
+                    row["depth_multiplier"] = options.DepthMultiplier()
+            elif row["opcode"] in POOL_OPS:
+                options = read_options(op, tflite.Pool2DOptions)
+                if options is not None:
+                    row["filter_height"] = options.FilterHeight()
+                    row["filter_width"] = options.FilterWidth()
+            elif row["opcode"] == tflite.BuiltinOperator.UNIDIRECTIONAL_SEQUENCE_LSTM:
+                options = read_options(op, tflite.UnidirectionalSequenceLSTMOptions)
+                if options is not None:
+                    row["time_major"] = options.TimeMajor()
+            else:
+                options = None
+            row["has_options"] = options is not None
+            num_inputs += len(inputs)
+            num_outputs += len(outputs)
+        # Optional inputs (e.g. LSTM peepholes) are -1 if omitted.
+        self.op_inputs = np.concatenate(op_inputs or [np.zeros(0, np.int32)])
+        self.op_outputs = np.concatenate(op_outputs or [np.zeros(0, np.int32)])
+
+        self.inputs = graph.InputsAsNumpy().tolist()
+        self.outputs = graph.OutputsAsNumpy().tolist()
+        assert np.all(
+            np.isin(
+                self.tensors["type"][self.inputs + self.outputs],
+                [tflite.TensorType.INT8, tflite.TensorType.INT32],
+            )
+        ), "Unsupported Input/Output type (Needs quantized model)"
+        self.variables = np.flatnonzero(self.tensors["is_variable"]).tolist()
+
+        self._my_tensors = None
+        self._my_layers = None
+        self._macs = None
+
+    def shape(self, tensor_idx):
+        """Returns the shape of a tensor as list."""
+        row = self.tensors[tensor_idx]
+        return row["shape"][: row["rank"]].tolist()
+
+    def op_io(self, op_idx):
+        """Returns the input and output tensor indices of an operator, omitted inputs are -1."""
+        row = self.ops[op_idx]
+        return (
+            self.op_inputs[row["inputs_start"] : row["inputs_end"]],
+            self.op_outputs[row["outputs_start"] : row["outputs_end"]],
+        )
+
+    def get_tensors(self):
+        """Returns the tensors as list of MyTensor (see student/estimate.py)."""
+        if self._my_tensors is None:
+            self._my_tensors = [
+                MyTensor(
+                    tensor_idx,
+                    name,
+                    row["shape"][: row["rank"]].tolist(),
+                    TYPES_MAP.get(int(row["type"]), "float32"),
+                    bool(row["is_const"]),
+                )
+                for tensor_idx, (name, row) in enumerate(zip(self.names, self.tensors))
+            ]
+        return self._my_tensors
+
+    def get_layers(self):
+        """Returns the operators as list of MyLayer (see student/estimate.py)."""
+        if self._my_layers is None:
+            self._my_layers = []
+            for op_idx, row in enumerate(self.ops):
+                inputs = self.op_inputs[row["inputs_start"] : row["inputs_end"]]
+                outputs = self.op_outputs[row["outputs_start"] : row["outputs_end"]]
+                self._my_layers.append(
+                    MyLayer(
+                        op_idx,
+                        tflite.opcode2name(int(row["opcode"])),
+                        inputs[inputs >= 0].tolist(),
+                        outputs.tolist(),
+                    )
+                )
+        return self._my_layers
+
+    def get_io(self):
+        """Returns the indices of the model input and output tensors.
+
+        Variable tensors (e.g. LSTM states) keep their value between invocations, so they are
+        returned as inputs and outputs to keep them alive during the whole inference.
+        """
+        return self.inputs + self.variables, self.outputs + self.variables
+
+    def get_macs(self):
+        """Returns the MACs of every operator, see estimate_macs_per_layer."""
+        if self._macs is None:
+            self._macs = np.array(
+                [estimate_macs_per_layer(self, op_idx) for op_idx in range(len(self.ops))],
+                dtype=np.int64,
+            )
+        return self._macs
+
+
+def as_arrays(m):
+    """Parses a TFLite model unless it already is a ModelArrays."""
+    return m if isinstance(m, ModelArrays) else ModelArrays(m)
+
+
+def estimate_macs_per_layer(arrays, op_idx):
+    """Returns the MACs of the operator op_idx of a ModelArrays."""
+    op_row = arrays.ops[op_idx]
+    opcode = int(op_row["opcode"])
+    inputs, outputs = arrays.op_io(op_idx)
     # ignoring types here (assume int8/int32)
-    if op_code.BuiltinCode() == tflite.BuiltinOperator.CONV_2D:
-        in_tensor = graph.Tensors(op.Inputs(0))
-        in_shape = in_tensor.ShapeAsNumpy().tolist()
-        kernel_tensor = graph.Tensors(op.Inputs(1))
-        kernel_shape = kernel_tensor.ShapeAsNumpy().tolist()
-        out_tensor = graph.Tensors(op.Outputs(0))
-        out_shape = out_tensor.ShapeAsNumpy().tolist()
+    if opcode == tflite.BuiltinOperator.CONV_2D:
+        in_shape = arrays.shape(inputs[0])
+        kernel_shape = arrays.shape(inputs[1])
+        out_shape = arrays.shape(outputs[0])
         assert len(in_shape) == 4, "Unsupported shape"  # TODO: allow more shapes
         input_n = in_shape[0]
         input_c = in_shape[3]
@@ -92,24 +299,18 @@ def estimate_macs_per_layer(op, m, graph):
         macs = estimate_conv2d_macs(in_shape, kernel_shape, out_shape)
         return macs
 
-    elif op_code.BuiltinCode() == tflite.BuiltinOperator.DEPTHWISE_CONV_2D:
-        in_tensor = graph.Tensors(op.Inputs(0))
-        in_shape = in_tensor.ShapeAsNumpy().tolist()
-        kernel_tensor = graph.Tensors(op.Inputs(1))
-        kernel_shape = kernel_tensor.ShapeAsNumpy().tolist()
-        out_tensor = graph.Tensors(op.Outputs(0))
-        out_shape = out_tensor.ShapeAsNumpy().tolist()
+    elif opcode == tflite.BuiltinOperator.DEPTHWISE_CONV_2D:
+        in_shape = arrays.shape(inputs[0])
+        kernel_shape = arrays.shape(inputs[1])
+        out_shape = arrays.shape(outputs[0])
         assert len(in_shape) == 4, "Unsupported shape"  # TODO: allow more shapes
         input_n = in_shape[0]
         input_c = in_shape[3]
         assert len(kernel_shape) == 4, "Unsupported shape"  # TODO: allow more shapes
         kernel_n = kernel_shape[0]
         kernel_c = kernel_shape[3]
-        assert op.BuiltinOptionsType() == tflite.BuiltinOptions.DepthwiseConv2DOptions
-        op_options = op.BuiltinOptions()
-        options = tflite.DepthwiseConv2DOptions()
-        options.Init(op_options.Bytes, op_options.Pos)
-        channel_mult = options.DepthMultiplier()
+        assert op_row["has_options"], "Missing DepthwiseConv2DOptions"
+        channel_mult = int(op_row["depth_multiplier"])
         assert len(out_shape) == 4, "Unsupported shape"  # TODO: allow more shapes
         output_n = out_shape[0]
         output_c = out_shape[3]
@@ -123,13 +324,10 @@ def estimate_macs_per_layer(op, m, graph):
         macs = estimate_depthwise_conv2d_macs(in_shape, kernel_shape, out_shape, channel_mult)
         return macs
 
-    elif op_code.BuiltinCode() == tflite.BuiltinOperator.FULLY_CONNECTED:
-        in_tensor = graph.Tensors(op.Inputs(0))
-        in_shape = in_tensor.ShapeAsNumpy().tolist()
-        filter_tensor = graph.Tensors(op.Inputs(1))
-        filter_shape = np.flip(filter_tensor.ShapeAsNumpy()).tolist()
-        out_tensor = graph.Tensors(op.Outputs(0))
-        out_shape = out_tensor.ShapeAsNumpy().tolist()
+    elif opcode == tflite.BuiltinOperator.FULLY_CONNECTED:
+        in_shape = arrays.shape(inputs[0])
+        filter_shape = arrays.shape(inputs[1])[::-1]
+        out_shape = arrays.shape(outputs[0])
         filter_h = filter_shape[0]
         filter_w = filter_shape[1]
         output_h = out_shape[0]
@@ -147,138 +345,340 @@ def estimate_macs_per_layer(op, m, graph):
         macs = estimate_fully_connected_macs(in_shape, filter_shape, out_shape)
         return macs
 
-    elif op_code.BuiltinCode() in [
-        tflite.BuiltinOperator.AVERAGE_POOL_2D,
-        tflite.BuiltinOperator.MAX_POOL_2D,
-        tflite.BuiltinOperator.RESHAPE,
+    elif opcode == tflite.BuiltinOperator.UNIDIRECTIONAL_SEQUENCE_LSTM:
+        in_shape = arrays.shape(inputs[0])
+        assert len(in_shape) == 3, "Unsupported shape"
+        # Input to output gate weights [n_cell, n_input], recurrent weights [n_cell, n_output].
+        n_cell = arrays.shape(inputs[4])[0]
+        n_output = arrays.shape(inputs[8])[1]
+        assert inputs[1] >= 0, "Unsupported LSTM without input gate (CIFG)"
+        assert op_row["has_options"], "Missing UnidirectionalSequenceLSTMOptions"
+        macs = estimate_lstm_macs(
+            in_shape,
+            n_cell,
+            n_output,
+            time_major=bool(op_row["time_major"]),
+            use_peephole=bool(inputs[11] >= 0),
+            use_projection=bool(inputs[16] >= 0),
+        )
+        return macs
+
+    elif opcode in POOL_OPS:
+        out_shape = arrays.shape(outputs[0])
+        assert op_row["has_options"], "Missing Pool2DOptions"
+        return estimate_pool2d_macs(
+            out_shape, int(op_row["filter_height"]), int(op_row["filter_width"])
+        )
+
+    elif opcode in [
+        tflite.BuiltinOperator.MEAN,
+        tflite.BuiltinOperator.SUM,
+        tflite.BuiltinOperator.REDUCE_MAX,
+        tflite.BuiltinOperator.REDUCE_PROD,
+        tflite.BuiltinOperator.REDUCE_ALL,
+    ]:
+        in_shape = arrays.shape(inputs[0])
+        return estimate_reduce_macs(in_shape)
+
+    elif opcode in [
         tflite.BuiltinOperator.SOFTMAX,
-        tflite.BuiltinOperator.MUL,
+        tflite.BuiltinOperator.LOG_SOFTMAX,
+    ]:
+        in_shape = arrays.shape(inputs[0])
+        return estimate_softmax_macs(in_shape)
+
+    elif opcode in [
         tflite.BuiltinOperator.ADD,
-        tflite.BuiltinOperator.REDUCE_MAX,
-        tflite.BuiltinOperator.CONCATENATION,
-        tflite.BuiltinOperator.DEPTH_TO_SPACE,
+        tflite.BuiltinOperator.SUB,
+        tflite.BuiltinOperator.MUL,
+        tflite.BuiltinOperator.DIV,
+        tflite.BuiltinOperator.MAXIMUM,
+        tflite.BuiltinOperator.MINIMUM,
         tflite.BuiltinOperator.FLOOR,
-        tflite.BuiltinOperator.L2_NORMALIZATION,
+        tflite.BuiltinOperator.EXP,
         tflite.BuiltinOperator.LOGISTIC,
+        tflite.BuiltinOperator.TANH,
         tflite.BuiltinOperator.RELU,
+        tflite.BuiltinOperator.RELU6,
+        tflite.BuiltinOperator.L2_NORMALIZATION,
+        tflite.BuiltinOperator.QUANTIZE,
+    ]:
+        out_shape = arrays.shape(outputs[0])
+        return estimate_elementwise_macs(out_shape)
+
+    elif opcode in [
+        tflite.BuiltinOperator.RESHAPE,
+        tflite.BuiltinOperator.CONCATENATION,
+        tflite.BuiltinOperator.DEPTH_TO_SPACE,
         tflite.BuiltinOperator.PAD,
-        tflite.BuiltinOperator.SUB,
-        tflite.BuiltinOperator.DIV,
         tflite.BuiltinOperator.SQUEEZE,
-        tflite.BuiltinOperator.EXP,
-        tflite.BuiltinOperator.LOG_SOFTMAX,
+        tflite.BuiltinOperator.STRIDED_SLICE,
         tflite.BuiltinOperator.TRANSPOSE_CONV,
-        tflite.BuiltinOperator.REDUCE_PROD,
-        tflite.BuiltinOperator.REDUCE_ALL,
-        tflite.BuiltinOperator.QUANTIZE,
-        tflite.BuiltinOperator.MAXIMUM,
-        tflite.BuiltinOperator.MINIMUM,
-        tflite.BuiltinOperator.MEAN,
     ]:
         return 0
     else:
-        name = tflite.opcode2name(op_code.BuiltinCode())
+        name = tflite.opcode2name(opcode)
         assert False, f"Unsupported operator type: {name}"
 
 
 def estimate_model_macs(m):
-    assert m.SubgraphsLength() == 1, "Multi-subgraph models are currently not supported"
-    graph = m.Subgraphs(0)
-    assert graph.InputsLength() == 1, "Multi-input models are currently not supported"
-    input_tensor = graph.Tensors(graph.Inputs(0))
-    assert input_tensor.Type() in [
-        tflite.TensorType.INT8,
-        tflite.TensorType.INT32,
-    ], "Unsupported Input type (Needs quantized model)"
-    output_tensors = []
-    for out_idx in range(graph.OutputsLength()):
-        output_tensor = graph.Tensors(graph.Outputs(0))
-        output_tensors.append(output_tensor)
-    is_quantized = output_tensor.Type() in [
-        tflite.TensorType.INT8,
-        tflite.TensorType.INT32,
-    ]
-    assert is_quantized, "Unsupported Output type (Needs quantized model)"
-    total_macs = 0
-    for op_idx in range(graph.OperatorsLength()):
-        op = graph.Operators(op_idx)
-        num_macs = estimate_macs_per_layer(op, m, graph)
-        total_macs += num_macs
-    return total_macs
+    return int(as_arrays(m).get_macs().sum())
+
+
+def load_cycle_table(path=None):
+    """Returns the ESP32-C3 cycle table, updated with a JSON file mapping operator names to
+    [cycles per MAC, fixed cycles per invocation] if given."""
+    table = dict(ESP32C3_CYCLES)
+    if path is not None:
+        with open(path, "r") as handle:
+            table.update({name: tuple(cycles) for name, cycles in json.load(handle).items()})
+    return table
+
+
+def estimate_model_latency(m, cycle_table=ESP32C3_CYCLES, clock_mhz=ESP32C3_CLOCK_MHZ):
+    """Predicts the inference latency from the MACs of every layer.
+
+    Args:
+        m: The TFLite model or its ModelArrays.
+        cycle_table: Maps operator names to (cycles per MAC, fixed cycles per invocation).
+        clock_mhz: Clock frequency of the target.
+
+    Returns:
+        Tuple of the latency in milliseconds and a list of (layer, cycles) per layer.
+    """
+    arrays = as_arrays(m)
+    cycles = []
+    for layer, num_macs in zip(arrays.get_layers(), arrays.get_macs()):
+        cycles_per_mac, fixed_cycles = cycle_table.get(layer.name, DEFAULT_CYCLES)
+        cycles.append((layer, round(fixed_cycles + cycles_per_mac * num_macs)))
+    total_cycles = sum(layer_cycles for _, layer_cycles in cycles)
+    return total_cycles / (clock_mhz * 1000), cycles
 
 
 def estimate_model_rom(m):
-    assert m.SubgraphsLength() == 1, "Multi-subgraph models are currently not supported"
-    graph = m.Subgraphs(0)
-    assert graph.InputsLength() == 1, "Multi-input model are currently not supported"
-    input_tensor = graph.Tensors(graph.Inputs(0))
-    assert input_tensor.Type() in [
-        tflite.TensorType.INT8,
-        tflite.TensorType.INT32,
-    ], "Unsupported Input type (Needs quantized model)"
-    output_tensors = []
-    for out_idx in range(graph.OutputsLength()):
-        output_tensor = graph.Tensors(graph.Outputs(0))
-        output_tensors.append(output_tensor)
-    is_quantized = output_tensor.Type() in [
-        tflite.TensorType.INT8,
-        tflite.TensorType.INT32,
-    ]
-    assert is_quantized, "Unsupported Output type (Needs quantized model)"
-
-    tensors = get_tensors(m, graph)
-
-    return estimate_rom(tensors)
-
-
-def estimate_model_ram(m):
-    assert m.SubgraphsLength() == 1, "Multi-subgraph models are currently not supported"
-    graph = m.Subgraphs(0)
-    assert graph.InputsLength() == 1, "Multi-input model are currently not supported"
-    input_tensor = graph.Tensors(graph.Inputs(0))
-    assert input_tensor.Type() in [
-        tflite.TensorType.INT8,
-        tflite.TensorType.INT32,
-    ], "Unsupported Input type (Needs quantized model)"
-    output_tensors = []
-    for out_idx in range(graph.OutputsLength()):
-        output_tensor = graph.Tensors(graph.Outputs(0))
-        output_tensors.append(output_tensor)
-    is_quantized = output_tensor.Type() in [
-        tflite.TensorType.INT8,
-        tflite.TensorType.INT32,
-    ]
-    assert is_quantized, "Unsupported Output type (Needs quantized model)"
+    return estimate_rom(as_arrays(m).get_tensors())
+
+
+def estimate_model_ram(m, inplace_ops=()):
+    arrays = as_arrays(m)
+    inputs, outputs = arrays.get_io()
+    return estimate_ram(arrays.get_tensors(), arrays.get_layers(), inputs, outputs, inplace_ops)
+
 
-    tensors = get_tensors(m, graph)
-    layers = get_layers(m, graph)
+def estimate_model_peak(m, inplace_ops=()):
+    """Finds the layer at which the most activation memory is alive.
 
-    return estimate_ram(tensors, layers)
+    Operators are planned in the order of the TFLite subgraph, which is the order the
+    interpreter executes them in. Branches, tensors with multiple consumers and model inputs
+    and outputs are taken into account.
 
+    Returns:
+        Tuple of the MemoryPlan and the layers of the model.
+    """
+    arrays = as_arrays(m)
+    inputs, outputs = arrays.get_io()
+    tensors = arrays.get_tensors()
+    layers = arrays.get_layers()
+    return plan_memory(tensors, layers, inputs, outputs, inplace_ops), layers
 
-def estimate(model_path):
-    m = load_model(model_path)
 
-    estimated_rom = estimate_model_rom(m)
-    estimated_ram = estimate_model_ram(m)
-    estimated_macs = estimate_model_macs(m)
+def estimate_model_arena(m, inplace_ops=()):
+    """Plans the tensor arena greedily by size.
+
+    Returns:
+        Tuple of the arena size in bytes and its fragmentation, the share of the arena not
+        explained by the peak of simultaneously alive tensors.
+    """
+    arrays = as_arrays(m)
+    inputs, outputs = arrays.get_io()
+    tensors = arrays.get_tensors()
+    layers = arrays.get_layers()
+    arena_bytes, _ = plan_arena(tensors, layers, inputs, outputs, inplace_ops)
+    peak_bytes = estimate_ram(tensors, layers, inputs, outputs, inplace_ops)
+    fragmentation = (arena_bytes - peak_bytes) / arena_bytes if arena_bytes else 0.0
+    return arena_bytes, fragmentation
+
+
+def estimate(model_path, inplace_ops=()):
+    arrays = ModelArrays(load_model(model_path))
+
+    estimated_rom = estimate_model_rom(arrays)
+    estimated_ram = estimate_model_ram(arrays, inplace_ops)
+    estimated_macs = estimate_model_macs(arrays)
 
     return estimated_rom, estimated_ram, estimated_macs
 
 
+def estimate_row(model_path, inplace_ops=(), arena=False, cycle_table=None, clock_mhz=None):
+    """Estimates one model for the batch mode.
+
+    Returns:
+        Dict of the estimates, or of the error if the model is not supported.
+    """
+    row = {"model": str(model_path)}
+    try:
+        arrays = ModelArrays(load_model(model_path))
+        row["rom"], row["ram"], row["macs"] = (
+            estimate_model_rom(arrays),
+            estimate_model_ram(arrays, inplace_ops),
+            estimate_model_macs(arrays),
+        )
+        if arena:
+            row["arena"], _ = estimate_model_arena(arrays, inplace_ops)
+        if cycle_table is not None:
+            latency_ms, _ = estimate_model_latency(arrays, cycle_table, clock_mhz)
+            row["latency_ms"] = round(latency_ms, 3)
+    except AssertionError as error:
+        # The estimators only support a subset of the TFLite models.
+        row["error"] = str(error)
+    except (OSError, struct.error) as error:
+        # Damaged files must not stop the other models of the batch.
+        row["error"] = f"Unreadable model: {error!r}"
+    except Exception as error:
+        # Nor must estimator bugs, but they are reported with the exception to be found.
+        row["error"] = f"Estimation failed: {error!r}"
+    return row
+
+
+def estimate_batch(model_paths, num_workers=None, **kwargs):
+    """Estimates many models in parallel processes.
+
+    Args:
+        model_paths: Paths of the TFLite models.
+        num_workers: Number of processes, defaults to the number of cores.
+        **kwargs: Passed to estimate_row.
+
+    Returns:
+        List of the rows of estimate_row in the order of model_paths.
+    """
+    with ProcessPoolExecutor(num_workers) as executor:
+        futures = [executor.submit(estimate_row, path, **kwargs) for path in model_paths]
+        return [future.result() for future in futures]
+
+
+def find_models(paths):
+    """Expands directories to the TFLite models inside of them."""
+    models = []
+    for path in map(Path, paths):
+        models.extend(sorted(path.rglob("*.tflite")) if path.is_dir() else [path])
+    return models
+
+
+def write_rows(rows, out=None, out_format=None):
+    """Writes the batch results as CSV or JSON to a file or stdout."""
+    if out_format is None:
+        out_format = "json" if out is not None and out.endswith(".json") else "csv"
+    handle = open(out, "w", newline="") if out is not None else sys.stdout
+    try:
+        if out_format == "json":
+            json.dump(rows, handle, indent=2)
+            handle.write("\n")
+        else:
+            keys = {key for row in rows for key in row}
+            fieldnames = [field for field in BATCH_FIELDS if field in keys]
+            writer = csv.DictWriter(handle, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if out is not None:
+            handle.close()
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("model")
+    parser.add_argument(
+        "model",
+        nargs="+",
+        help="TFLite model. Several models or directories are estimated in batch mode",
+    )
     parser.add_argument(
         "--out", type=str, default=None, help="File which should contain the determined accuracy"
     )
+    parser.add_argument(
+        "--arena",
+        action="store_true",
+        help="Also plan the tensor arena and report its size and fragmentation",
+    )
+    parser.add_argument(
+        "--inplace_reshape",
+        action="store_true",
+        help="Let RESHAPE outputs share the buffer of their input",
+    )
+    parser.add_argument(
+        "--latency",
+        action="store_true",
+        help="Also predict the inference latency on the ESP32-C3",
+    )
+    parser.add_argument(
+        "--cycle_table",
+        type=str,
+        default=None,
+        help="""\
+        JSON file mapping operator names to [cycles per MAC, fixed cycles per invocation],
+        overriding the built-in ESP32-C3 table. Implies --latency
+        """,
+    )
+    parser.add_argument(
+        "--clock_mhz",
+        type=float,
+        default=ESP32C3_CLOCK_MHZ,
+        help="Clock frequency of the target for --latency",
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default=None,
+        choices=["csv", "json"],
+        help="Output format of the batch mode, defaults to the extension of --out or csv",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help="Number of processes of the batch mode, defaults to the number of cores",
+    )
     args = parser.parse_args()
-
-    estimated_rom, estimated_ram, estimated_macs = estimate(args.model)
+    inplace_ops = INPLACE_OPS if args.inplace_reshape else ()
+    cycle_table = None
+    if args.latency or args.cycle_table:
+        cycle_table = load_cycle_table(args.cycle_table)
+
+    model_paths = find_models(args.model)
+    if len(model_paths) != 1 or Path(args.model[0]).is_dir() or args.format:
+        rows = estimate_batch(
+            model_paths,
+            args.num_workers,
+            inplace_ops=inplace_ops,
+            arena=args.arena,
+            cycle_table=cycle_table,
+            clock_mhz=args.clock_mhz,
+        )
+        write_rows(rows, args.out, args.format)
+        return
+
+    arrays = ModelArrays(load_model(model_paths[0]))
+    estimated_rom = estimate_model_rom(arrays)
+    estimated_ram = estimate_model_ram(arrays, inplace_ops)
+    estimated_macs = estimate_model_macs(arrays)
+    plan, layers = estimate_model_peak(arrays, inplace_ops)
 
     estimations = f"""ROM={estimated_rom}
 RAM={estimated_ram}
 MACS={estimated_macs}
+"""
+    if plan.peak_layer is not None:
+        estimations += f"""PEAK_LAYER={plan.peak_layer} ({layers[plan.peak_layer].name})
+PEAK_TENSORS={",".join(map(str, plan.live_tensors))}
+"""
+    if args.arena:
+        arena_bytes, fragmentation = estimate_model_arena(arrays, inplace_ops)
+        estimations += f"""ARENA={arena_bytes}
+FRAGMENTATION={fragmentation:.4f}
+"""
+    if cycle_table is not None:
+        latency_ms, cycles = estimate_model_latency(arrays, cycle_table, args.clock_mhz)
+        estimations += f"""CYCLES={sum(layer_cycles for _, layer_cycles in cycles)}
+LATENCY_MS={latency_ms:.3f}
 """
 
     # TODO: support float
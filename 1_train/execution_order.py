@@ -0,0 +1,202 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Searches the execution order of a TFLite graph with the lowest peak activation memory.
+
+The converter emits one valid topological order of the operators, but in graphs with
+branches another order can keep fewer tensors alive at the same time. The memory alive while
+an operator runs only depends on the set of operators executed before it, so the search is a
+dynamic program over these sets. It is exact, which is equivalent to trying every ordering,
+unless a step has more than max_states sets; then only the most promising ones are kept.
+"""
+
+import argparse
+
+from estimate import INPLACE_OPS, ModelArrays, load_model
+from student.estimate import buffer_aliases, estimate_ram, tensor_size
+
+MAX_STATES = 2000
+
+
+class OrderSearch:
+    """Memory cost model of one graph for arbitrary execution orders.
+
+    Args:
+        tensors: The tensors of the model (see student/estimate.py).
+        layers: The layers of the model in the converter's order.
+        inputs: Indices of the model input tensors.
+        outputs: Indices of the model output tensors.
+        inplace_ops: Names of layers writing into the buffer of their first input.
+    """
+
+    def __init__(self, tensors, layers, inputs=(), outputs=(), inplace_ops=()):
+        self.tensors = tensors
+        self.layers = layers
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.inplace_ops = list(inplace_ops)
+
+        aliases = buffer_aliases(tensors, layers, inplace_ops)
+        sizes = {tensor.idx: tensor_size(tensor) for tensor in tensors}
+        buffers = sorted(set(aliases.values()))
+        position = {idx: pos for pos, idx in enumerate(buffers)}
+        self.sizes = [sizes[idx] for idx in buffers]
+        # Bit masks of the layers using each buffer.
+        self.users = [0] * len(buffers)
+        self.layer_buffers = [0] * len(layers)
+        producers = {}
+        for layer_pos, layer in enumerate(layers):
+            for idx in layer.inputs + layer.outputs:
+                if idx in aliases:
+                    buffer = position[aliases[idx]]
+                    self.users[buffer] |= 1 << layer_pos
+                    self.layer_buffers[layer_pos] |= 1 << buffer
+            for idx in layer.outputs:
+                producers[idx] = layer_pos
+        self.starts_alive = [False] * len(buffers)
+        self.stays_alive = [False] * len(buffers)
+        for idx in self.inputs:
+            if idx in aliases:
+                self.starts_alive[position[aliases[idx]]] = True
+        for idx in self.outputs:
+            if idx in aliases:
+                self.stays_alive[position[aliases[idx]]] = True
+
+        # Bit masks of the layers producing the inputs of each layer.
+        self.predecessors = [0] * len(layers)
+        for layer_pos, layer in enumerate(layers):
+            for idx in layer.inputs:
+                if idx in producers and producers[idx] != layer_pos:
+                    self.predecessors[layer_pos] |= 1 << producers[idx]
+
+        self.initial = sum(1 << buffer for buffer, alive in enumerate(self.starts_alive) if alive)
+
+    def _size(self, mask):
+        total = 0
+        while mask:
+            lowest = mask & -mask
+            total += self.sizes[lowest.bit_length() - 1]
+            mask ^= lowest
+        return total
+
+    def step(self, layer_pos, executed, resident):
+        """Runs a layer after the layers in the executed bit mask.
+
+        Args:
+            layer_pos: Position of the layer to run.
+            executed: Bit mask of the layers run before.
+            resident: Bit mask of the buffers alive before the layer.
+
+        Returns:
+            Tuple of the bytes alive while the layer runs and the bit mask of the buffers alive
+            after it.
+        """
+        own = self.layer_buffers[layer_pos]
+        step_bytes = self._size(resident | own)
+        executed |= 1 << layer_pos
+        finished = 0
+        mask = own
+        while mask:
+            lowest = mask & -mask
+            buffer = lowest.bit_length() - 1
+            if not self.stays_alive[buffer] and self.users[buffer] & ~executed == 0:
+                finished |= lowest
+            mask ^= lowest
+        return step_bytes, (resident | own) & ~finished
+
+    def peak(self, order):
+        """Peak memory of running the layers in the given order of positions."""
+        executed = 0
+        resident = self.initial
+        peak = 0
+        for layer_pos in order:
+            assert self.predecessors[layer_pos] & ~executed == 0, "Order is not topological"
+            step_bytes, resident = self.step(layer_pos, executed, resident)
+            peak = max(peak, step_bytes)
+            executed |= 1 << layer_pos
+        return peak
+
+    def search(self, max_states=MAX_STATES):
+        """Finds the order of layer positions with the lowest peak memory.
+
+        Returns:
+            Tuple of the order, its peak memory in bytes and whether the result is exact.
+        """
+        # Executed layers -> (peak, order, resident buffers). The resident buffers only depend
+        # on the executed layers, so states reached through different orders are merged.
+        states = {0: (0, (), self.initial)}
+        exact = True
+        for _ in range(len(self.layers)):
+            successors = {}
+            for executed, (peak, order, resident) in states.items():
+                for layer_pos in range(len(self.layers)):
+                    if executed >> layer_pos & 1 or self.predecessors[layer_pos] & ~executed:
+                        continue
+                    state = executed | 1 << layer_pos
+                    step_bytes, state_resident = self.step(layer_pos, executed, resident)
+                    state_peak = max(peak, step_bytes)
+                    if state not in successors or state_peak < successors[state][0]:
+                        successors[state] = (state_peak, order + (layer_pos,), state_resident)
+            if len(successors) > max_states:
+                exact = False
+                best = sorted(
+                    successors.items(),
+                    key=lambda item: (item[1][0], self._size(item[1][2])),
+                )
+                successors = dict(best[:max_states])
+            states = successors
+
+        peak, order, _ = min(states.values(), default=(0, (), 0))
+        # A truncated search can end up worse than the converter's order.
+        converter_peak = self.peak(range(len(self.layers)))
+        if converter_peak <= peak:
+            return tuple(range(len(self.layers))), converter_peak, exact
+        return order, peak, exact
+
+
+def optimize_order(tensors, layers, inputs=(), outputs=(), inplace_ops=(), max_states=MAX_STATES):
+    """Reorders the layers to minimize the peak activation memory.
+
+    Returns:
+        Tuple of the reordered layers, their peak memory in bytes and whether it is optimal.
+    """
+    order, peak, exact = OrderSearch(tensors, layers, inputs, outputs, inplace_ops).search(
+        max_states
+    )
+    return [layers[layer_pos] for layer_pos in order], peak, exact
+
+
+def main():
+    arrays = ModelArrays(load_model(FLAGS.model))
+    inputs, outputs = arrays.get_io()
+    tensors = arrays.get_tensors()
+    layers = arrays.get_layers()
+    inplace_ops = INPLACE_OPS if FLAGS.inplace_reshape else ()
+
+    converter_peak = estimate_ram(tensors, layers, inputs, outputs, inplace_ops)
+    best_layers, best_peak, exact = optimize_order(
+        tensors, layers, inputs, outputs, inplace_ops, FLAGS.max_states
+    )
+
+    print(f"Converter order: {converter_peak} bytes")
+    print(f"Best order: {best_peak} bytes ({'optimal' if exact else 'heuristic'})")
+    print(f"Savings: {converter_peak - best_peak} bytes")
+    for layer in best_layers:
+        print(f"{layer.idx}: {layer.name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model")
+    parser.add_argument(
+        "--inplace_reshape",
+        action="store_true",
+        help="Let RESHAPE outputs share the buffer of their input",
+    )
+    parser.add_argument(
+        "--max_states",
+        type=int,
+        default=MAX_STATES,
+        help="Sets of executed layers kept per step, the search is exact below this limit",
+    )
+
+    FLAGS, _ = parser.parse_known_args()
+    main()
@@ -0,0 +1,346 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Checks whether a model architecture fits the hardware budget before it is trained.
+
+The Keras graph is translated to the tensors and operators the int8 TFLite conversion would
+produce (activations fused into the preceding operator, dropout and batch normalization
+removed), so the estimators of student/estimate.py can be applied without training or
+converting the model.
+"""
+
+import sys
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+import data
+import models
+from student.estimate import (
+    estimate_rom,
+    estimate_ram,
+    estimate_conv2d_macs,
+    estimate_depthwise_conv2d_macs,
+    estimate_fully_connected_macs,
+    estimate_lstm_macs,
+    estimate_pool2d_macs,
+    estimate_elementwise_macs,
+    estimate_reduce_macs,
+    estimate_softmax_macs,
+    MyTensor,
+    MyLayer,
+)
+
+OVER_BUDGET_EXIT_CODE = 3  # Exit code for models over the budget, other errors exit with 1.
+
+FUSED_ACTIVATIONS = [None, "linear", "relu", "relu6"]
+FUSING_OPS = ["CONV_2D", "DEPTHWISE_CONV_2D", "FULLY_CONNECTED"]
+IDENTITY_LAYERS = ["InputLayer", "Dropout", "BatchNormalization", "SpatialDropout2D"]
+POOLING_LAYERS = {
+    "MaxPooling2D": "MAX_POOL_2D",
+    "AveragePooling2D": "AVERAGE_POOL_2D",
+    "GlobalAveragePooling2D": "MEAN",
+    "GlobalMaxPooling2D": "REDUCE_MAX",
+}
+ELEMENTWISE_LAYERS = {
+    "Add": "ADD",
+    "Subtract": "SUB",
+    "Multiply": "MUL",
+    "Maximum": "MAXIMUM",
+    "Minimum": "MINIMUM",
+    "Concatenate": "CONCATENATION",
+}
+ACTIVATION_OPS = {
+    "relu": "RELU",
+    "relu6": "RELU6",
+    "softmax": "SOFTMAX",
+    "sigmoid": "LOGISTIC",
+    "tanh": "TANH",
+}
+
+
+def _activation_macs(name, shape):
+    if name == "softmax":
+        return estimate_softmax_macs(shape)
+    return estimate_elementwise_macs(shape)
+
+
+def get_graph(model):
+    """Translates a Keras model to the int8 TFLite tensors and operators.
+
+    Args:
+        model: Functional tf.keras model with batch size 1 at inference.
+
+    Returns:
+        Tuple of the tensors and layers (see student/estimate.py), the MACs per layer and the
+        indices of the input and output tensors. Like estimate.ModelArrays.get_io, the LSTM states
+        are part of both because they persist between invocations.
+    """
+    tensors = []
+    layers = []
+    macs = []
+    inputs = []
+    states = []  # Variable tensors of LSTMs.
+    produced = {}  # Keras tensor -> TFLite tensor index.
+    producer = {}  # TFLite tensor index -> operator name.
+
+    def _shape(keras_tensor):
+        return [1, *keras_tensor.shape[1:]]
+
+    def _tensor(name, shape, dtype="int8", is_const=False):
+        tensors.append(MyTensor(len(tensors), name, [int(dim) for dim in shape], dtype, is_const))
+        return len(tensors) - 1
+
+    def _op(name, op_inputs, output, layer_macs=0):
+        layers.append(MyLayer(len(layers), name, op_inputs, [output]))
+        macs.append(int(layer_macs))
+        producer[output] = name
+
+    def _activation(layer, output, activation):
+        """Adds a separate operator for activations that cannot be fused."""
+        name = getattr(activation, "__name__", activation)
+        if name in FUSED_ACTIVATIONS:
+            return output
+        assert name in ACTIVATION_OPS, f"Unsupported activation: {name}"
+        result = _tensor(f"{layer.name}/{name}", tensors[output].shape)
+        _op(ACTIVATION_OPS[name], [output], result, _activation_macs(name, tensors[output].shape))
+        return result
+
+    def _lstm(layer, input_idx, out_shape):
+        """Adds a fused UNIDIRECTIONAL_SEQUENCE_LSTM and its persistent states."""
+        assert not layer.go_backwards and not layer.stateful, "Unsupported LSTM options"
+        for activation in [layer.activation, layer.recurrent_activation]:
+            assert activation.__name__ in ["tanh", "sigmoid"], "Unsupported LSTM activation"
+        units = layer.units
+        time, input_size = tensors[input_idx].shape[1:]
+        # Kernels, recurrent kernels and biases are split per gate. The converter always adds
+        # the biases.
+        weights = []
+        for suffix, shape, dtype in [
+            ("kernel", [units, input_size], "int8"),
+            ("recurrent", [units, units], "int8"),
+            ("bias", [units], "int32"),
+        ]:
+            for gate in ["input", "forget", "cell", "output"]:
+                weights.append(_tensor(f"{layer.name}/{gate}_{suffix}", shape, dtype, True))
+        output_state = _tensor(f"{layer.name}/output_state", [1, units], "int8")
+        cell_state = _tensor(f"{layer.name}/cell_state", [1, units], "int16")
+        states.extend([output_state, cell_state])
+        output = _tensor(layer.name, [1, time, units])
+        layer_macs = estimate_lstm_macs(tensors[input_idx].shape, units, units)
+        lstm_inputs = [input_idx, *weights, output_state, cell_state]
+        _op("UNIDIRECTIONAL_SEQUENCE_LSTM", lstm_inputs, output, layer_macs)
+        if not layer.return_sequences:
+            # The converter slices the last time step off the full sequence.
+            slices = [
+                _tensor(f"{layer.name}/{name}", [3], "int32", True)
+                for name in ["begin", "end", "strides"]
+            ]
+            sequence, output = output, _tensor(f"{layer.name}/last", out_shape)
+            _op("STRIDED_SLICE", [sequence, *slices], output)
+        return output
+
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        keras_inputs = tf.nest.flatten(layer.input)
+        keras_output = layer.output
+        if kind == "InputLayer":
+            produced[id(keras_output)] = _tensor(layer.name, _shape(keras_output))
+            inputs.append(produced[id(keras_output)])
+            continue
+        layer_inputs = [produced[id(keras_input)] for keras_input in keras_inputs]
+        in_shape = tensors[layer_inputs[0]].shape
+        out_shape = _shape(keras_output)
+
+        if kind in IDENTITY_LAYERS:
+            output = layer_inputs[0]
+        elif kind in ["Reshape", "Flatten"] or (kind == "TFOpLambda" and layer.symbol == "reshape"):
+            shape = _tensor(f"{layer.name}/shape", [len(out_shape)], "int32", True)
+            output = _tensor(layer.name, out_shape)
+            _op("RESHAPE", [layer_inputs[0], shape], output)
+        elif kind == "Conv2D":
+            kernel_h, kernel_w, kernel_ic, kernel_oc = layer.kernel.shape
+            kernel_shape = [kernel_oc, kernel_h, kernel_w, kernel_ic]
+            weights = [_tensor(f"{layer.name}/kernel", kernel_shape, "int8", True)]
+            if layer.use_bias:
+                weights.append(_tensor(f"{layer.name}/bias", [kernel_oc], "int32", True))
+            output = _tensor(layer.name, out_shape)
+            layer_macs = estimate_conv2d_macs(in_shape, kernel_shape, out_shape)
+            _op("CONV_2D", [layer_inputs[0], *weights], output, layer_macs)
+            output = _activation(layer, output, layer.activation)
+        elif kind == "DepthwiseConv2D":
+            kernel_h, kernel_w, input_c, channel_mult = layer.depthwise_kernel.shape
+            kernel_shape = [1, kernel_h, kernel_w, input_c * channel_mult]
+            weights = [_tensor(f"{layer.name}/kernel", kernel_shape, "int8", True)]
+            if layer.use_bias:
+                weights.append(_tensor(f"{layer.name}/bias", [kernel_shape[3]], "int32", True))
+            output = _tensor(layer.name, out_shape)
+            layer_macs = estimate_depthwise_conv2d_macs(
+                in_shape, kernel_shape, out_shape, channel_mult
+            )
+            _op("DEPTHWISE_CONV_2D", [layer_inputs[0], *weights], output, layer_macs)
+            output = _activation(layer, output, layer.activation)
+        elif kind == "Dense":
+            input_w, units = layer.kernel.shape
+            weights = [_tensor(f"{layer.name}/kernel", [units, input_w], "int8", True)]
+            if layer.use_bias:
+                weights.append(_tensor(f"{layer.name}/bias", [units], "int32", True))
+            output = _tensor(layer.name, out_shape)
+            # Inputs of higher rank are processed as matrix of rows.
+            rows = int(np.prod(in_shape[:-1]))
+            layer_macs = estimate_fully_connected_macs(
+                [rows, input_w], [input_w, units], [rows, units]
+            )
+            _op("FULLY_CONNECTED", [layer_inputs[0], *weights], output, layer_macs)
+            output = _activation(layer, output, layer.activation)
+        elif kind in ["ReLU", "Activation", "Softmax"]:
+            name = {"ReLU": "relu", "Softmax": "softmax"}.get(kind) or layer.activation.__name__
+            if name in FUSED_ACTIVATIONS and producer.get(layer_inputs[0]) in FUSING_OPS:
+                output = layer_inputs[0]  # Fused into the preceding operator.
+            else:
+                assert name in ACTIVATION_OPS, f"Unsupported activation: {name}"
+                output = _tensor(layer.name, out_shape)
+                _op(ACTIVATION_OPS[name], layer_inputs, output, _activation_macs(name, out_shape))
+        elif kind in POOLING_LAYERS:
+            if kind.startswith("Global"):
+                # Reductions take the spatial axes as constant tensor.
+                layer_inputs.append(_tensor(f"{layer.name}/axes", [2], "int32", True))
+                layer_macs = estimate_reduce_macs(in_shape)
+            else:
+                layer_macs = estimate_pool2d_macs(out_shape, *layer.pool_size)
+            output = _tensor(layer.name, out_shape)
+            _op(POOLING_LAYERS[kind], layer_inputs, output, layer_macs)
+        elif kind in ELEMENTWISE_LAYERS:
+            # Concatenations only copy data.
+            layer_macs = estimate_elementwise_macs(out_shape) if kind != "Concatenate" else 0
+            output = _tensor(layer.name, out_shape)
+            _op(ELEMENTWISE_LAYERS[kind], layer_inputs, output, layer_macs)
+        elif kind == "LSTM":
+            output = _lstm(layer, layer_inputs[0], out_shape)
+        else:
+            assert False, f"Unsupported layer type: {kind}"
+        produced[id(keras_output)] = output
+
+    outputs = [produced[id(keras_output)] for keras_output in model.outputs] + states
+    return tensors, layers, macs, inputs + states, outputs
+
+
+def estimate_keras(model):
+    """Returns the estimated ROM, RAM and MACs of the int8 TFLite version of a Keras model."""
+    tensors, layers, macs, inputs, outputs = get_graph(model)
+    return estimate_rom(tensors), estimate_ram(tensors, layers, inputs, outputs), sum(macs)
+
+
+def check_feasibility(model, max_rom=None, max_ram=None, max_macs=None):
+    """Checks a Keras model against the hardware budget.
+
+    Args:
+        model: The untrained Keras model.
+        max_rom: Maximum bytes of weights or None.
+        max_ram: Maximum bytes of activations or None.
+        max_macs: Maximum MACs per inference or None.
+
+    Returns:
+        Tuple of whether the model fits, the (ROM, RAM, MACs) estimates and a list of the
+        violated limits. Models with layers the estimators do not support do not fit.
+    """
+    try:
+        estimates = estimate_keras(model)
+    except AssertionError as error:
+        return False, None, [str(error)]
+
+    violations = []
+    for name, value, limit in zip(["ROM", "RAM", "MACs"], estimates, [max_rom, max_ram, max_macs]):
+        if limit is not None and value > limit:
+            violations.append(f"{name} {value} > {limit}")
+    return len(violations) == 0, estimates, violations
+
+
+def main():
+    model_settings = models.prepare_model_settings(
+        len(data.prepare_words_list(FLAGS.wanted_words.split(","))),
+        FLAGS.sample_rate,
+        FLAGS.clip_duration_ms,
+        FLAGS.window_size_ms,
+        FLAGS.window_stride_ms,
+        FLAGS.dct_coefficient_count,
+    )
+    model = models.get_model(model_settings, FLAGS.model_architecture)
+
+    feasible, estimates, violations = check_feasibility(
+        model, FLAGS.max_rom, FLAGS.max_ram, FLAGS.max_macs
+    )
+    if estimates is None:
+        print(f"Cannot estimate {FLAGS.model_architecture}: {', '.join(violations)}")
+        sys.exit(1)
+    print(f"Estimations:\nROM={estimates[0]}\nRAM={estimates[1]}\nMACS={estimates[2]}")
+    if not feasible:
+        print(f"Rejected {FLAGS.model_architecture}: {', '.join(violations)}")
+        sys.exit(OVER_BUDGET_EXIT_CODE)
+    print(f"{FLAGS.model_architecture} fits the budget.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model_architecture",
+        type=str,
+        default="micro_kws_student",
+        help="What model architecture to check",
+    )
+    parser.add_argument(
+        "--max_rom",
+        type=int,
+        default=None,
+        help="Maximum bytes of weights.",
+    )
+    parser.add_argument(
+        "--max_ram",
+        type=int,
+        default=None,
+        help="Maximum bytes of activations.",
+    )
+    parser.add_argument(
+        "--max_macs",
+        type=int,
+        default=None,
+        help="Maximum MACs per inference.",
+    )
+    parser.add_argument(
+        "--sample_rate",
+        type=int,
+        default=16000,
+        help="Expected sample rate of the wavs",
+    )
+    parser.add_argument(
+        "--clip_duration_ms",
+        type=int,
+        default=1000,
+        help="Expected duration in milliseconds of the wavs",
+    )
+    parser.add_argument(
+        "--window_size_ms",
+        type=float,
+        default=30.0,
+        help="How long each spectrogram timeslice is",
+    )
+    parser.add_argument(
+        "--window_stride_ms",
+        type=float,
+        default=20.0,
+        help="How far to move in time between spectrogram timeslices",
+    )
+    parser.add_argument(
+        "--dct_coefficient_count",
+        type=int,
+        default=40,
+        help="How many bins to use for the MFCC fingerprint",
+    )
+    parser.add_argument(
+        "--wanted_words",
+        type=str,
+        default="yes,no,up,down,left,right,on,off,stop,go",
+        help="Words to use (others will be added to an unknown label)",
+    )
+
+    FLAGS, _ = parser.parse_known_args()
+    main()
@@ -13,8 +13,8 @@
 #
 # Modifications Copyright 2022 Chair of Electronic Design Automation, TUM
 
-from data import load_wav_file, calculate_mfcc
-from test_tflite import tflite_inference
+from data import load_wav_file, calculate_features
+from test_tflite import TFLiteRunner
 
 import tensorflow as tf
 import argparse
@@ -30,7 +30,7 @@ def main():
     window_size_samples = int(FLAGS.sample_rate * FLAGS.window_size_ms / 1000)
     window_stride_samples = int(FLAGS.sample_rate * FLAGS.window_stride_ms / 1000)
     decoded, sample = load_wav_file(FLAGS.wav, FLAGS.sample_rate)
-    x = calculate_mfcc(
+    x = calculate_features(
         decoded,
         sample,
         window_size_samples,
@@ -38,7 +38,7 @@ def main():
         FLAGS.dct_coefficient_count,
     )
     x = tf.reshape(x, [1, -1])
-    predictions = tflite_inference(x, FLAGS.tflite_path)
+    predictions = TFLiteRunner(FLAGS.tflite_path)(x)
 
     # Sort to show labels in order of confidence
     top_k = predictions[0].argsort()[-1:][::-1]
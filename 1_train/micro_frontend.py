@@ -0,0 +1,469 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Batched NumPy reimplementation of the TFLite micro audio frontend.
+
+The TensorFlow `audio_microfrontend` op only accepts a single 1-D clip. This module
+reproduces the same fixed-point pipeline (window, int16 KissFFT, mel filterbank, noise
+reduction, PCAN gain control and log scale) on whole `[batch, samples]` arrays so that
+features can be computed per batch. All stages follow the integer arithmetic of
+`tensorflow/lite/experimental/microfrontend/lib` so the output is bit-identical.
+"""
+
+import math
+
+import numpy as np
+
+WINDOW_BITS = 12
+FILTERBANK_BITS = 12
+NOISE_REDUCTION_BITS = 14
+PCAN_SNR_BITS = 12
+PCAN_OUTPUT_BITS = 6
+WIDE_DYNAMIC_FUNCTION_BITS = 32
+LOG_SCALE_LOG2 = 16
+LOG_SEGMENTS_LOG2 = 7
+LOG_COEFF = 45426
+FFT_SAMP_MAX = 32767
+FFT_FRACBITS = 15
+
+# fmt: off
+LOG_LUT = np.array([
+    0,    224,  442,  654,  861,  1063, 1259, 1450, 1636, 1817, 1992, 2163,
+    2329, 2490, 2646, 2797, 2944, 3087, 3224, 3358, 3487, 3611, 3732, 3848,
+    3960, 4068, 4172, 4272, 4368, 4460, 4549, 4633, 4714, 4791, 4864, 4934,
+    5001, 5063, 5123, 5178, 5231, 5280, 5326, 5368, 5408, 5444, 5477, 5507,
+    5533, 5557, 5578, 5595, 5610, 5622, 5631, 5637, 5640, 5641, 5638, 5633,
+    5626, 5615, 5602, 5586, 5568, 5547, 5524, 5498, 5470, 5439, 5406, 5370,
+    5332, 5291, 5249, 5203, 5156, 5106, 5054, 5000, 4944, 4885, 4825, 4762,
+    4697, 4630, 4561, 4490, 4416, 4341, 4264, 4184, 4103, 4020, 3935, 3848,
+    3759, 3668, 3575, 3481, 3384, 3286, 3186, 3084, 2981, 2875, 2768, 2659,
+    2549, 2437, 2323, 2207, 2090, 1971, 1851, 1729, 1605, 1480, 1353, 1224,
+    1094, 963,  830,  695,  559,  421,  282,  142,  0,    0,
+], dtype=np.int64)
+# fmt: on
+
+
+def _wrap16(x):
+    """Truncates integers to int16 like a C store into a `short`."""
+    return ((x + 0x8000) & 0xFFFF) - 0x8000
+
+
+def _wrap32(x):
+    return ((x + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+def _most_significant_bit(x):
+    """Vectorized MostSignificantBit32/64 from microfrontend/lib/bits.h (0 for 0)."""
+    x = np.asarray(x, dtype=np.uint64)
+    msb = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = (x >> np.uint64(shift)) > 0
+        msb = np.where(mask, msb + shift, msb)
+        x = np.where(mask, x >> np.uint64(shift), x)
+    return msb + (x > 0)
+
+
+# The FFT helpers work on native int16/int32 arrays, so NumPy's wrapping integer arithmetic
+# matches the C stores into `short` and the int32 products of _kiss_fft_guts.h.
+
+
+def _sround(x):
+    return ((x + np.int32(1 << (FFT_FRACBITS - 1))) >> FFT_FRACBITS).astype(np.int16)
+
+
+def _fixdiv(x, div):
+    return _sround(x.astype(np.int32) * np.int32(FFT_SAMP_MAX // div))
+
+
+def _cmul(a_r, a_i, b_r, b_i):
+    a_r = a_r.astype(np.int32)
+    a_i = a_i.astype(np.int32)
+    return _sround(a_r * b_r - a_i * b_i), _sround(a_r * b_i + a_i * b_r)
+
+
+def _half_of(x):
+    return (x >> 1).astype(np.int16)
+
+
+def _float32_to_mel(freq):
+    """FreqToMel of filterbank_util.c, evaluated in double and stored as float."""
+    return np.float32(1127.0 * np.log1p(np.float64(np.float32(freq)) / 700.0))
+
+
+class MicroFrontend:
+    """Computes micro frontend features for batches of int16 audio.
+
+    The constructor arguments mirror the attributes of `audio_microfrontend`. Context
+    stacking (`left_context`, `right_context`, `frame_stride`) is not supported.
+    """
+
+    def __init__(
+        self,
+        sample_rate=16000,
+        window_size=25,
+        window_step=10,
+        num_channels=32,
+        upper_band_limit=7500.0,
+        lower_band_limit=125.0,
+        smoothing_bits=10,
+        even_smoothing=0.025,
+        odd_smoothing=0.06,
+        min_signal_remaining=0.05,
+        enable_pcan=True,
+        pcan_strength=0.95,
+        pcan_offset=80.0,
+        gain_bits=21,
+        enable_log=True,
+        scale_shift=6,
+    ):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.smoothing_bits = smoothing_bits
+        self.enable_pcan = enable_pcan
+        self.enable_log = enable_log
+        self.scale_shift = scale_shift
+
+        self.window_size = int(window_size) * sample_rate // 1000
+        self.window_step = int(window_step) * sample_rate // 1000
+        self.fft_size = 1 << int(math.ceil(math.log2(self.window_size)))
+
+        self._init_window()
+        self._init_fft()
+        self._init_filterbank(lower_band_limit, upper_band_limit)
+        self._init_noise_reduction(even_smoothing, odd_smoothing, min_signal_remaining)
+        self.correction_bits = int(_most_significant_bit(self.fft_size)) - 1 - FILTERBANK_BITS // 2
+        if enable_pcan:
+            self._init_pcan(pcan_strength, pcan_offset, gain_bits)
+
+    def num_frames(self, num_samples):
+        """Number of feature slices produced for a clip of the given length."""
+        if num_samples < self.window_size:
+            return 0
+        return 1 + (num_samples - self.window_size) // self.window_step
+
+    def __call__(self, audio, noise_estimate=None):
+        """Computes the features of a batch of clips.
+
+        Args:
+            audio: Integer array of shape [batch, samples] holding int16 PCM audio.
+            noise_estimate: Optional noise reduction state of shape [batch, num_channels]
+                to continue from, zeros (a freshly reset frontend) if not given.
+
+        Returns:
+            Tuple of the uint16 features of shape [batch, frames, num_channels] and the
+            noise reduction state after the last frame.
+        """
+        audio = np.asarray(audio, dtype=np.int16)
+        batch, num_samples = audio.shape
+        num_frames = self.num_frames(num_samples)
+
+        frames = np.lib.stride_tricks.sliding_window_view(audio, self.window_size, axis=1)
+        frames = frames[:, :: self.window_step][:, :num_frames]
+        filterbank, input_shift = self._spectrum(frames)
+
+        if noise_estimate is None:
+            noise_estimate = np.zeros((batch, self.num_channels), dtype=np.int64)
+        else:
+            noise_estimate = np.asarray(noise_estimate, dtype=np.int64).copy()
+        output = np.empty((batch, num_frames, self.num_channels), dtype=np.uint16)
+        # Noise reduction is recursive over time, everything else is vectorized.
+        for frame_idx in range(num_frames):
+            signal = self._noise_reduction(filterbank[:, frame_idx], noise_estimate)
+            if self.enable_pcan:
+                signal = self._pcan(signal, noise_estimate)
+            output[:, frame_idx] = self._log_scale(signal)
+        return output, noise_estimate
+
+    def _spectrum(self, frames):
+        """Window, FFT and filterbank stages for frames of shape [..., window_size]."""
+        windowed = (frames.astype(np.int32) * self.window_coefficients) >> WINDOW_BITS
+        windowed = windowed.astype(np.int16)
+        # abs() of an int16 leaves -32768 negative, so it never becomes the maximum.
+        max_abs = np.maximum(np.max(np.abs(windowed), axis=-1), 0)
+        input_shift = 15 - _most_significant_bit(max_abs)
+
+        fft_input = np.zeros((*frames.shape[:-1], self.fft_size), dtype=np.int16)
+        fft_input[..., : self.window_size] = np.left_shift(
+            windowed.view(np.uint16).astype(np.int32),
+            input_shift[..., np.newaxis].astype(np.int32),
+        ).astype(np.int16)
+        real, imag = self._fftr(fft_input)
+
+        # Energy is stored in an int32 buffer and accumulated as uint64. All partial sums are
+        # integers below 2**53, so a float64 matrix product is exact and the two's complement
+        # wrap of the uint64 accumulator is recovered by the int64 view.
+        real = real.astype(np.int32)
+        imag = imag.astype(np.int32)
+        energy = (real * real + imag * imag).astype(np.float64)
+        work = energy @ self.filterbank_weights.T
+        work[..., 1:] += energy @ self.filterbank_unweights[:-1].T
+        work = np.rint(work).astype(np.int64).view(np.uint64)
+        filterbank = self._sqrt64(work[..., 1:]) >> input_shift[..., np.newaxis].astype(np.uint64)
+        return filterbank.astype(np.int64), input_shift
+
+    def _noise_reduction(self, signal, estimate):
+        signal_scaled_up = (signal << self.smoothing_bits) & 0xFFFFFFFF
+        one_minus_smoothing = (1 << NOISE_REDUCTION_BITS) - self.smoothing
+        new_estimate = (
+            (signal_scaled_up * self.smoothing + estimate * one_minus_smoothing)
+            >> NOISE_REDUCTION_BITS
+        ) & 0xFFFFFFFF
+        estimate[...] = new_estimate
+        clamped = np.minimum(new_estimate, signal_scaled_up)
+        floor = ((signal * self.min_signal_remaining) >> NOISE_REDUCTION_BITS) & 0xFFFFFFFF
+        subtracted = (signal_scaled_up - clamped) >> self.smoothing_bits
+        return np.maximum(subtracted, floor)
+
+    def _pcan(self, signal, noise_estimate):
+        gain = (self._wide_dynamic_function(noise_estimate) & 0xFFFFFFFF).astype(np.uint64)
+        snr = (signal.astype(np.uint64) * gain) >> np.uint64(self.snr_shift)
+        snr = snr.astype(np.int64) & 0xFFFFFFFF
+        small = snr < (2 << PCAN_SNR_BITS)
+        shrunk_small = ((snr * snr) & 0xFFFFFFFF) >> (2 + 2 * PCAN_SNR_BITS - PCAN_OUTPUT_BITS)
+        shrunk_large = (
+            (snr >> (PCAN_SNR_BITS - PCAN_OUTPUT_BITS)) - (1 << PCAN_OUTPUT_BITS)
+        ) & 0xFFFFFFFF
+        return np.where(small, shrunk_small, shrunk_large)
+
+    def _wide_dynamic_function(self, x):
+        interval = _most_significant_bit(x)
+        offset = np.maximum(4 * interval - 6, 0)
+        lut0 = self.gain_lut[offset]
+        lut1 = self.gain_lut[offset + 1]
+        lut2 = self.gain_lut[offset + 2]
+        frac = np.where(
+            interval < 11,
+            x << np.maximum(11 - interval, 0),
+            x >> np.maximum(interval - 11, 0),
+        )
+        frac = (frac & 0xFFFFFFFF) & 0x3FF
+        result = _wrap32(lut2 * frac) >> 5
+        result = _wrap32(result + _wrap32((lut1 & 0xFFFFFFFF) << 5))
+        result = _wrap32(result * frac)
+        result = _wrap32(result + (1 << 14)) >> 15
+        result = _wrap16(result + lut0)
+        small = np.minimum(x, 2)
+        return np.where(x <= 2, self.gain_lut[small], result)
+
+    def _log_scale(self, signal):
+        if not self.enable_log:
+            return np.minimum(signal, 0xFFFF).astype(np.uint16)
+        if self.correction_bits < 0:
+            value = signal >> -self.correction_bits
+        else:
+            value = (signal << self.correction_bits) & 0xFFFFFFFF
+        valid = value > 1
+        value = np.where(valid, value, 2)
+
+        integer = _most_significant_bit(value) - 1
+        frac = _wrap32(value - (np.int64(1) << integer))
+        frac = np.where(
+            integer < LOG_SCALE_LOG2,
+            frac << np.maximum(LOG_SCALE_LOG2 - integer, 0),
+            frac >> np.maximum(integer - LOG_SCALE_LOG2, 0),
+        )
+        frac = _wrap32(frac)
+        base_seg = (frac & 0xFFFFFFFF) >> (LOG_SCALE_LOG2 - LOG_SEGMENTS_LOG2)
+        c0 = LOG_LUT[base_seg]
+        c1 = LOG_LUT[base_seg + 1]
+        seg_base = ((1 << LOG_SCALE_LOG2) >> LOG_SEGMENTS_LOG2) * base_seg
+        rel_pos = _wrap32((c1 - c0) * (frac - seg_base)) >> LOG_SCALE_LOG2
+        fraction = (frac + c0 + rel_pos) & 0xFFFFFFFF
+        log2 = ((integer << LOG_SCALE_LOG2) + fraction) & 0xFFFFFFFF
+        rounding = (1 << LOG_SCALE_LOG2) // 2
+        loge = ((LOG_COEFF * log2 + rounding) >> LOG_SCALE_LOG2) & 0xFFFFFFFF
+        scaled = (
+            (((loge << self.scale_shift) & 0xFFFFFFFF) + rounding) & 0xFFFFFFFF
+        ) >> LOG_SCALE_LOG2
+
+        value = np.where(valid, scaled, 0)
+        return np.minimum(value, 0xFFFF).astype(np.uint16)
+
+    @staticmethod
+    def _sqrt64(num):
+        """Sqrt64 of filterbank.c: floor square root rounded up if the remainder is large."""
+        num = num.astype(np.uint64)
+        res = np.floor(np.sqrt(num.astype(np.float64))).astype(np.uint64)
+        # Fix up float rounding so that res == isqrt(num).
+        res = np.where(res * res > num, res - np.uint64(1), res)
+        res = np.where((res + np.uint64(1)) * (res + np.uint64(1)) <= num, res + np.uint64(1), res)
+        remainder = num - res * res
+        small = (num >> np.uint64(32)) == 0
+        limit = np.where(small, np.uint64(0xFFFF), np.uint64(0xFFFFFFFF))
+        res = np.where((remainder > res) & (res != limit), res + np.uint64(1), res)
+        return res & np.uint64(0xFFFFFFFF)
+
+    def _fftr(self, timedata):
+        """kiss_fftr for int16 input of shape [..., fft_size], returns the int16 half spectrum."""
+        ncfft = self.fft_size // 2
+        real, imag = self._fft(timedata[..., 0::2], timedata[..., 1::2])
+
+        tdc_r = _fixdiv(real[..., 0], 2)
+        tdc_i = _fixdiv(imag[..., 0], 2)
+        out_r = np.zeros((*timedata.shape[:-1], ncfft + 1), dtype=np.int16)
+        out_i = np.zeros_like(out_r)
+        out_r[..., 0] = tdc_r + tdc_i
+        out_r[..., ncfft] = tdc_r - tdc_i
+
+        # Bins k = 1 .. ncfft / 2 and their mirrors ncfft - k.
+        k = slice(1, ncfft // 2 + 1)
+        mirror = slice(ncfft - 1, ncfft // 2 - 1, -1)
+        fpk_r = _fixdiv(real[..., k], 2)
+        fpk_i = _fixdiv(imag[..., k], 2)
+        fpnk_r = _fixdiv(real[..., mirror], 2)
+        fpnk_i = _fixdiv(-imag[..., mirror], 2)
+        f1k_r, f1k_i = fpk_r + fpnk_r, fpk_i + fpnk_i
+        f2k_r, f2k_i = fpk_r - fpnk_r, fpk_i - fpnk_i
+        tw_r, tw_i = _cmul(f2k_r, f2k_i, self.super_twiddles_r, self.super_twiddles_i)
+
+        f1k_r = f1k_r.astype(np.int32)
+        f1k_i = f1k_i.astype(np.int32)
+        out_r[..., k] = _half_of(f1k_r + tw_r)
+        out_i[..., k] = _half_of(f1k_i + tw_i)
+        # For k == ncfft / 2 these overwrite the values above, as in the C loop.
+        out_r[..., mirror] = _half_of(f1k_r - tw_r)
+        out_i[..., mirror] = _half_of(tw_i - f1k_i)
+        return out_r, out_i
+
+    def _fft(self, real, imag, factors=None, fstride=1):
+        """Decimation in time kf_work, all sub-transforms of a level are done at once."""
+        if factors is None:
+            factors = self.fft_factors
+        p, m = factors[0]
+        if m == 1:
+            out_r, out_i = real, imag
+        else:
+            # Sub-transform q works on the inputs q, q + p, q + 2p, ...
+            sub_shape = (*real.shape[:-1], m, p)
+            out_r, out_i = self._fft(
+                np.swapaxes(real.reshape(sub_shape), -1, -2),
+                np.swapaxes(imag.reshape(sub_shape), -1, -2),
+                factors[1:],
+                fstride * p,
+            )
+            out_r = out_r.reshape(*real.shape[:-1], p * m)
+            out_i = out_i.reshape(*imag.shape[:-1], p * m)
+
+        parts_r = [_fixdiv(out_r[..., q * m : (q + 1) * m], p) for q in range(p)]
+        parts_i = [_fixdiv(out_i[..., q * m : (q + 1) * m], p) for q in range(p)]
+        k = np.arange(m)
+        if p == 2:
+            t_r, t_i = self._twiddle(parts_r[1], parts_i[1], k * fstride)
+            parts_r = [parts_r[0] + t_r, parts_r[0] - t_r]
+            parts_i = [parts_i[0] + t_i, parts_i[0] - t_i]
+        elif p == 4:
+            s0_r, s0_i = self._twiddle(parts_r[1], parts_i[1], k * fstride)
+            s1_r, s1_i = self._twiddle(parts_r[2], parts_i[2], 2 * k * fstride)
+            s2_r, s2_i = self._twiddle(parts_r[3], parts_i[3], 3 * k * fstride)
+            s5_r, s5_i = parts_r[0] - s1_r, parts_i[0] - s1_i
+            f0_r, f0_i = parts_r[0] + s1_r, parts_i[0] + s1_i
+            s3_r, s3_i = s0_r + s2_r, s0_i + s2_i
+            s4_r, s4_i = s0_r - s2_r, s0_i - s2_i
+            parts_r = [f0_r + s3_r, s5_r + s4_i, f0_r - s3_r, s5_r - s4_i]
+            parts_i = [f0_i + s3_i, s5_i - s4_r, f0_i - s3_i, s5_i + s4_r]
+        else:
+            raise ValueError(f"Unsupported FFT radix: {p}")
+        return np.concatenate(parts_r, axis=-1), np.concatenate(parts_i, axis=-1)
+
+    def _twiddle(self, real, imag, index):
+        return _cmul(real, imag, self.twiddles_r[index], self.twiddles_i[index])
+
+    def _init_window(self):
+        arg = np.float32(math.pi * 2.0 / np.float32(self.window_size))
+        i = np.arange(self.window_size, dtype=np.float64)
+        float_value = (0.5 - 0.5 * np.cos(np.float64(arg) * (i + 0.5))).astype(np.float32)
+        scaled = (float_value * np.float32(1 << WINDOW_BITS)).astype(np.float64)
+        self.window_coefficients = np.floor(scaled + 0.5).astype(np.int32)
+
+    def _init_fft(self):
+        ncfft = self.fft_size // 2
+        phase = -2 * math.pi * np.arange(ncfft) / ncfft
+        self.twiddles_r = np.floor(0.5 + FFT_SAMP_MAX * np.cos(phase)).astype(np.int32)
+        self.twiddles_i = np.floor(0.5 + FFT_SAMP_MAX * np.sin(phase)).astype(np.int32)
+
+        phase = -math.pi * ((np.arange(ncfft // 2) + 1) / ncfft + 0.5)
+        self.super_twiddles_r = np.floor(0.5 + FFT_SAMP_MAX * np.cos(phase)).astype(np.int32)
+        self.super_twiddles_i = np.floor(0.5 + FFT_SAMP_MAX * np.sin(phase)).astype(np.int32)
+
+        # kf_factor: powers of 4 first, then 2. Sizes are always powers of two here.
+        factors = []
+        n = ncfft
+        while n > 1:
+            p = 4 if n % 4 == 0 else 2
+            n //= p
+            factors.append((p, n))
+        self.fft_factors = factors
+
+    def _init_filterbank(self, lower_band_limit, upper_band_limit):
+        spectrum_size = self.fft_size // 2 + 1
+        num_channels_plus_1 = self.num_channels + 1
+
+        mel_low = _float32_to_mel(lower_band_limit)
+        mel_hi = _float32_to_mel(upper_band_limit)
+        mel_spacing = np.float32(mel_hi - mel_low) / np.float32(num_channels_plus_1)
+        center_mel_freqs = [
+            np.float32(mel_low + mel_spacing * np.float32(i + 1))
+            for i in range(num_channels_plus_1)
+        ]
+
+        hz_per_sbin = np.float32(0.5 * self.sample_rate / np.float64(np.float32(spectrum_size) - 1))
+        start_index = int(1.5 + np.float64(np.float32(lower_band_limit) / hz_per_sbin))
+
+        # Dense equivalents of the padded weight/unweight tables, padding weights are zero.
+        weights = np.zeros((num_channels_plus_1, spectrum_size), dtype=np.float64)
+        unweights = np.zeros((num_channels_plus_1, spectrum_size), dtype=np.float64)
+        chan_freq_index_start = start_index
+        for chan in range(num_channels_plus_1):
+            freq_index = chan_freq_index_start
+            while _float32_to_mel(np.float32(freq_index) * hz_per_sbin) <= center_mel_freqs[chan]:
+                freq_index += 1
+
+            denom_val = mel_low if chan == 0 else center_mel_freqs[chan - 1]
+            for frequency in range(chan_freq_index_start, freq_index):
+                weight = np.float32(
+                    (center_mel_freqs[chan] - _float32_to_mel(np.float32(frequency) * hz_per_sbin))
+                    / np.float32(center_mel_freqs[chan] - denom_val)
+                )
+                scaled = np.float64(weight * np.float32(1 << FILTERBANK_BITS))
+                weights[chan, frequency] = np.int16(math.floor(scaled + 0.5))
+                unweight = (1.0 - np.float64(weight)) * (1 << FILTERBANK_BITS)
+                unweights[chan, frequency] = np.int16(math.floor(unweight + 0.5))
+            chan_freq_index_start = freq_index
+
+        self.filterbank_weights = weights
+        self.filterbank_unweights = unweights
+
+    def _init_noise_reduction(self, even_smoothing, odd_smoothing, min_signal_remaining):
+        scale = np.float32(1 << NOISE_REDUCTION_BITS)
+        even = int(np.float32(even_smoothing) * scale)
+        odd = int(np.float32(odd_smoothing) * scale)
+        self.smoothing = np.where(np.arange(self.num_channels) % 2 == 0, even, odd).astype(np.int64)
+        self.min_signal_remaining = int(np.float32(min_signal_remaining) * scale)
+
+    def _init_pcan(self, strength, offset, gain_bits):
+        input_bits = self.smoothing_bits - self.correction_bits
+        self.snr_shift = gain_bits - self.correction_bits - PCAN_SNR_BITS
+
+        def _lookup(x):
+            x_as_float = np.float32(np.float32(x) / np.float32(1 << input_bits))
+            gain = np.float32(1 << gain_bits) * np.power(
+                np.float32(x_as_float + np.float32(offset)), np.float32(-strength), dtype=np.float32
+            )
+            if gain > 0x7FFF:
+                return 0x7FFF
+            return int(np.int16(np.float32(gain + np.float32(0.5))))
+
+        lut = np.zeros(4 * WIDE_DYNAMIC_FUNCTION_BITS - 3, dtype=np.int64)
+        lut[0] = _lookup(0)
+        lut[1] = _lookup(1)
+        for interval in range(2, WIDE_DYNAMIC_FUNCTION_BITS + 1):
+            x0 = 1 << (interval - 1)
+            x1 = x0 + (x0 >> 1)
+            x2 = x0 + (x0 - 1) if interval == WIDE_DYNAMIC_FUNCTION_BITS else 2 * x0
+            y0, y1, y2 = _lookup(x0), _lookup(x1), _lookup(x2)
+            diff1 = y1 - y0
+            diff2 = y2 - y0
+            a1 = 4 * diff1 - diff2
+            a2 = diff2 - a1
+            lut[4 * interval - 6] = y0
+            lut[4 * interval - 5] = _wrap16(a1)
+            lut[4 * interval - 4] = _wrap16(a2)
+        self.gain_lut = lut
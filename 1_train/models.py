@@ -16,6 +16,7 @@
 
 import tensorflow as tf
 
+import student.model
 from student.model import create_micro_kws_student_model
 
 
@@ -67,7 +68,9 @@ def get_model(model_settings, model_architecture, model_name="micro_kws"):
 
     Args:
         model_settings: Dictionary of information about the model.
-        model_architecture: String specifying which kind of model to create.
+        model_architecture: String specifying which kind of model to create. Besides the
+            builtin ones, every `create_<name>_model` function of student/model.py can be
+            selected by its name.
 
     Returns:
         A tf.keras Model with the requested architecture.
@@ -80,6 +83,14 @@ def get_model(model_settings, model_architecture, model_name="micro_kws"):
         return create_micro_kws_xs_model(model_settings, model_name=model_name)
     if model_architecture == "micro_kws_student":
         return create_micro_kws_student_model(model_settings, model_name=model_name)
+    create_fn = getattr(student.model, f"create_{model_architecture}_model", None)
+    if create_fn is not None:
+        # Further architectures of student/model.py, e.g. arm_conv -> create_arm_conv_model.
+        model = create_fn(model_settings)
+        if not isinstance(model, tf.keras.Model):
+            raise Exception(f"create_{model_architecture}_model does not return a tf.keras.Model")
+        model._name = model_name
+        return model
     else:
         raise Exception(f"model_architecture argument {model_architecture} not recognized")
 
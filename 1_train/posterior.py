@@ -0,0 +1,173 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Python reference of the posterior handler running on the device.
+
+Follows `PosteriorHandler::Handle` of the micro_kws target: the uint8 model outputs of the
+last `history_length` invocations are summed per class (missing history counts as zero),
+the class with the largest sum (the last one on ties) triggers a detection if its sum
+reaches `trigger_threshold_single * history_length` and the class was not detected within
+the last `suppression_ms`.
+"""
+
+import itertools
+
+import numpy as np
+
+
+def quantize_posteriors(posteriors):
+    """Converts float posteriors in [0, 1] to the uint8 values seen by the device.
+
+    The int8 model output has a scale of 1/256 and a zero point of -128, which the
+    target offsets by 128.
+    """
+    return np.clip(np.round(np.asarray(posteriors) * 256), 0, 255).astype(np.uint8)
+
+
+class PosteriorHandler:
+    """Step-by-step posterior handler, equal to the C++ implementation.
+
+    Args:
+        history_length: Number of past model outputs to consider.
+        trigger_threshold_single: Threshold between 0 and 255 for the moving average.
+        suppression_ms: How long a detected class is blocked from triggering again.
+        category_count: Number of used labels.
+    """
+
+    def __init__(self, history_length, trigger_threshold_single, suppression_ms, category_count):
+        self.history_length = history_length
+        self.trigger_threshold = trigger_threshold_single * history_length
+        self.suppression_ms = suppression_ms
+        self.history = np.zeros((history_length, category_count), dtype=np.uint32)
+        self.suppressed_left = np.zeros(category_count, dtype=np.int64)
+        self.position = 0
+        self.last_time_ms = 0
+
+    def handle(self, new_posteriors, time_ms):
+        """Processes the model output of one invocation.
+
+        Args:
+            new_posteriors: uint8 model outputs of shape [category_count].
+            time_ms: Timestamp of the invocation in milliseconds.
+
+        Returns:
+            Tuple of the top category index and whether a detection was triggered.
+        """
+        elapsed = time_ms - self.last_time_ms
+        self.last_time_ms = time_ms
+        self.suppressed_left = np.maximum(self.suppressed_left - elapsed, 0)
+
+        self.history[self.position] = new_posteriors
+        self.position = (self.position + 1) % self.history_length
+
+        moving_sum = self.history.sum(axis=0)
+        top = len(moving_sum) - 1 - int(np.argmax(moving_sum[::-1]))
+        trigger = moving_sum[top] >= self.trigger_threshold and self.suppressed_left[top] == 0
+        if trigger:
+            self.suppressed_left[top] = self.suppression_ms
+        return top, bool(trigger)
+
+
+def moving_sums(posteriors, history_length):
+    """Per-class sums over the last history_length outputs, shape [steps, categories]."""
+    padded = np.zeros((len(posteriors) + 1, posteriors.shape[1]), dtype=np.int64)
+    np.cumsum(posteriors, axis=0, out=padded[1:])
+    start = np.maximum(np.arange(1, len(posteriors) + 1) - history_length, 0)
+    return padded[1:] - padded[start]
+
+
+def sweep_detections(posteriors, times_ms, history_lengths, thresholds, suppressions_ms):
+    """Replays one posterior stream for every combination of handler parameters at once.
+
+    Args:
+        posteriors: uint8 model outputs of shape [steps, categories].
+        times_ms: Invocation timestamps in milliseconds of shape [steps].
+        history_lengths: History lengths to evaluate.
+        thresholds: Single trigger thresholds to evaluate.
+        suppressions_ms: Suppression times to evaluate.
+
+    Returns:
+        Tuple of the parameter combinations as array of shape [combinations, 3] holding
+        (history_length, threshold, suppression_ms) and the detections as list with one
+        (step indices, category indices) tuple per combination.
+    """
+    posteriors = np.asarray(posteriors, dtype=np.uint8)
+    times_ms = np.asarray(times_ms, dtype=np.int64)
+    combinations = np.array(
+        list(itertools.product(history_lengths, thresholds, suppressions_ms)), dtype=np.int64
+    )
+
+    # Top class and its moving sum only depend on the history length.
+    history_lengths = np.unique(combinations[:, 0])
+    top_classes = np.empty((len(history_lengths), len(posteriors)), dtype=np.int64)
+    top_sums = np.empty((len(history_lengths), len(posteriors)), dtype=np.int64)
+    for idx, history_length in enumerate(history_lengths):
+        sums = moving_sums(posteriors, history_length)
+        top_classes[idx] = sums.shape[1] - 1 - np.argmax(sums[:, ::-1], axis=1)
+        top_sums[idx] = np.max(sums, axis=1)
+    history_index = np.searchsorted(history_lengths, combinations[:, 0])
+    trigger_thresholds = combinations[:, 0] * combinations[:, 1]
+
+    # Suppression is recursive over time, but only steps where any combination reaches its
+    # threshold can change the state.
+    num_combinations = len(combinations)
+    rows = np.arange(num_combinations)
+    last_trigger = np.full((num_combinations, posteriors.shape[1]), np.iinfo(np.int64).min // 2)
+    lowest = np.array(
+        [trigger_thresholds[history_index == idx].min() for idx in range(len(history_lengths))]
+    )
+    detected_steps = [[] for _ in rows]
+    detected_classes = [[] for _ in rows]
+    for step in np.flatnonzero((top_sums >= lowest[:, np.newaxis]).any(axis=0)):
+        classes = top_classes[history_index, step]
+        fire = top_sums[history_index, step] >= trigger_thresholds
+        fire &= times_ms[step] - last_trigger[rows, classes] >= combinations[:, 2]
+        last_trigger[rows[fire], classes[fire]] = times_ms[step]
+        for idx in np.flatnonzero(fire):
+            detected_steps[idx].append(step)
+            detected_classes[idx].append(classes[idx])
+
+    detections = [
+        (np.array(steps, dtype=np.int64), np.array(classes, dtype=np.int64))
+        for steps, classes in zip(detected_steps, detected_classes)
+    ]
+    return combinations, detections
+
+
+def score_detections(
+    detection_times_ms,
+    detection_classes,
+    reference_times_ms,
+    reference_classes,
+    tolerance_ms,
+    ignored_classes=(0, 1),
+):
+    """Matches detections against reference keyword occurrences.
+
+    A reference is hit if a detection of its class lies within tolerance_ms after it.
+    Detections of keyword classes which do not hit any reference are false accepts.
+    Detections of the ignored classes (silence and unknown) are not counted.
+
+    Returns:
+        Tuple of the number of false accepts and the number of missed references.
+    """
+    keep = ~np.isin(detection_classes, ignored_classes)
+    detection_times_ms = detection_times_ms[keep]
+    detection_classes = detection_classes[keep]
+
+    false_accepts = 0
+    misses = 0
+    for category in np.union1d(detection_classes, reference_classes):
+        times = np.sort(detection_times_ms[detection_classes == category])
+        references = np.sort(reference_times_ms[reference_classes == category])
+
+        # First detection at or after each reference.
+        first = np.searchsorted(times, references, side="left")
+        hit = first < len(times)
+        hit[hit] = times[first[hit]] - references[hit] <= tolerance_ms
+        misses += int(np.count_nonzero(~hit))
+
+        # Latest reference at or before each detection.
+        latest = np.searchsorted(references, times, side="right") - 1
+        matched = latest >= 0
+        matched[matched] = times[matched] - references[latest[matched]] <= tolerance_ms
+        false_accepts += int(np.count_nonzero(~matched))
+    return false_accepts, misses
@@ -0,0 +1,260 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Replays recorded posterior streams to tune the posterior handler parameters offline.
+
+Posterior streams are either CSV files with a `time` column in seconds followed by one column
+per label, as written by stream.py, or packet logs recorded with `4_debug/debug.py --record`.
+CSV values are float probabilities or the uint8 values seen by the device, see
+--posterior_type. The references are CSV files with `time` and `label` columns marking the
+keyword occurrences of each recording, relative to its first posterior for packet logs.
+"""
+
+import csv
+import json
+import struct
+import argparse
+
+import numpy as np
+
+from posterior import quantize_posteriors, score_detections, sweep_detections
+
+POSTERIOR_TYPES = ["float", "uint8"]
+# Layout of the packet logs written by 4_debug/packet_log.py, keep both readers in sync: the
+# magic number, the uint32 length of a JSON header, the header, then fixed size records of the
+# float64 host time and the raw payload.
+PACKET_LOG_MAGIC = b"MKWSLOG1"
+
+
+def load_posteriors(path, posterior_type="float"):
+    """Reads a posterior stream from a CSV file or a packet log.
+
+    Args:
+        path: Path of the stream.
+        posterior_type: Type of the CSV values, float probabilities or uint8 device values.
+            Packet logs always hold uint8 values.
+
+    Returns:
+        Tuple of the labels, the timestamps in milliseconds and the uint8 posteriors.
+    """
+    with open(path, "rb") as handle:
+        if handle.read(len(PACKET_LOG_MAGIC)) == PACKET_LOG_MAGIC:
+            return load_packet_log(path)
+
+    assert posterior_type in POSTERIOR_TYPES, f"Unknown posterior type {posterior_type}"
+    with open(path, "r", newline="") as handle:
+        reader = csv.reader(handle)
+        header = next(reader)
+        values = np.array([[float(value) for value in row] for row in reader if row])
+
+    labels = header[1:]
+    values = values.reshape(-1, len(header))
+    times_ms = np.round(values[:, 0] * 1000).astype(np.int64)
+    posteriors = values[:, 1:]
+    if posterior_type == "float":
+        posteriors = quantize_posteriors(posteriors)
+    return labels, times_ms, posteriors.astype(np.uint8)
+
+
+def load_packet_log(path):
+    """Reads the posteriors of a packet log recorded by the debugger.
+
+    Returns:
+        Tuple of the labels, the timestamps in milliseconds since the first packet and the
+        uint8 posteriors.
+    """
+    with open(path, "rb") as handle:
+        if handle.read(len(PACKET_LOG_MAGIC)) != PACKET_LOG_MAGIC:
+            raise ValueError(f"{path} is not a packet log")
+        (header_size,) = struct.unpack("<I", handle.read(4))
+        metadata = json.loads(handle.read(header_size))
+        dtype = np.dtype([("time", "<f8"), ("payload", np.uint8, (metadata["payload_size"],))])
+        data = handle.read()
+    # A record cut off by a crash of the debugger is ignored.
+    records = np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+
+    labels = metadata["standard_labels"] + metadata["category_labels"]
+    # Debug packets start with the int8 features, followed by the posteriors.
+    feature_size = metadata["feature_height"] * metadata["feature_width"]
+    posteriors = np.array(records["payload"][:, feature_size : feature_size + len(labels)])
+    times_ms = np.round((records["time"] - records["time"][:1]) * 1000).astype(np.int64)
+    return labels, times_ms, posteriors
+
+
+def load_references(path, labels):
+    """Reads the keyword occurrences of a recording.
+
+    Returns:
+        Tuple of the timestamps in milliseconds and the label indices.
+    """
+    with open(path, "r", newline="") as handle:
+        rows = list(csv.DictReader(handle))
+
+    times_ms = np.array([round(float(row["time"]) * 1000) for row in rows], dtype=np.int64)
+    classes = np.array([labels.index(row["label"]) for row in rows], dtype=np.int64)
+    return times_ms, classes
+
+
+def replay(
+    posterior_paths,
+    reference_paths,
+    history_lengths,
+    thresholds,
+    suppressions_ms,
+    tolerance_ms,
+    posterior_type="float",
+):
+    """Sweeps all parameter combinations over the given recordings.
+
+    The posterior_type applies to CSV streams, see load_posteriors.
+
+    Returns:
+        List of dicts with the parameters and the resulting metrics of every combination.
+    """
+    combinations = None
+    false_accepts = 0
+    misses = 0
+    num_references = 0
+    duration_ms = 0
+    for posterior_path, reference_path in zip(posterior_paths, reference_paths):
+        labels, times_ms, posteriors = load_posteriors(posterior_path, posterior_type)
+        reference_times_ms, reference_classes = load_references(reference_path, labels)
+
+        combinations, detections = sweep_detections(
+            posteriors, times_ms, history_lengths, thresholds, suppressions_ms
+        )
+        scores = np.array(
+            [
+                score_detections(
+                    times_ms[steps],
+                    classes,
+                    reference_times_ms,
+                    reference_classes,
+                    tolerance_ms,
+                )
+                for steps, classes in detections
+            ]
+        ).reshape(-1, 2)
+        false_accepts = false_accepts + scores[:, 0]
+        misses = misses + scores[:, 1]
+        num_references += len(reference_classes)
+        duration_ms += int(times_ms[-1]) if len(times_ms) else 0
+
+    hours = duration_ms / 3600000
+    results = []
+    for idx, (history_length, threshold, suppression_ms) in enumerate(combinations):
+        results.append(
+            {
+                "history_length": int(history_length),
+                "threshold": int(threshold),
+                "suppression_ms": int(suppression_ms),
+                "false_accepts": int(false_accepts[idx]),
+                "false_accepts_per_hour": false_accepts[idx] / hours if hours else 0.0,
+                "misses": int(misses[idx]),
+                "miss_rate": misses[idx] / num_references if num_references else 0.0,
+            }
+        )
+    return results
+
+
+def main():
+    if len(FLAGS.posteriors) != len(FLAGS.references):
+        raise RuntimeError("Every posterior stream needs exactly one reference file")
+
+    results = replay(
+        FLAGS.posteriors,
+        FLAGS.references,
+        FLAGS.history_lengths,
+        FLAGS.thresholds,
+        FLAGS.suppressions_ms,
+        FLAGS.tolerance_ms,
+        FLAGS.posterior_type,
+    )
+
+    with open(FLAGS.out, "w", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Evaluated {len(results)} parameter combinations, results written to {FLAGS.out}")
+
+    feasible = [
+        result
+        for result in results
+        if result["false_accepts_per_hour"] <= FLAGS.max_false_accepts_per_hour
+    ]
+    print(f"Lowest miss rates with at most {FLAGS.max_false_accepts_per_hour} FA/h:")
+    feasible.sort(key=lambda result: (result["miss_rate"], result["false_accepts_per_hour"]))
+    for result in feasible[:5]:
+        print(
+            f"history_length={result['history_length']} threshold={result['threshold']} "
+            f"suppression_ms={result['suppression_ms']}: "
+            f"FA/h={result['false_accepts_per_hour']:.2f} miss rate={result['miss_rate']:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--posteriors",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Recorded posterior streams (CSV or packet logs of 4_debug/debug.py --record).",
+    )
+    parser.add_argument(
+        "--posterior_type",
+        type=str,
+        default="float",
+        choices=POSTERIOR_TYPES,
+        help="""\
+        Whether the CSV streams hold float probabilities (stream.py) or uint8 device values.
+        Packet logs always hold uint8 values.
+        """,
+    )
+    parser.add_argument(
+        "--references",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Keyword occurrences (CSV with time and label) for each posterior stream.",
+    )
+    parser.add_argument(
+        "--history_lengths",
+        type=int,
+        nargs="+",
+        default=[10, 20, 35, 50],
+        help="History lengths to evaluate.",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=int,
+        nargs="+",
+        default=list(range(80, 240, 10)),
+        help="Single trigger thresholds (0-255) to evaluate.",
+    )
+    parser.add_argument(
+        "--suppressions_ms",
+        type=int,
+        nargs="+",
+        default=[250, 500, 1000, 1500],
+        help="Suppression times to evaluate.",
+    )
+    parser.add_argument(
+        "--tolerance_ms",
+        type=int,
+        default=1500,
+        help="Maximum delay between a keyword occurrence and its detection.",
+    )
+    parser.add_argument(
+        "--max_false_accepts_per_hour",
+        type=float,
+        default=1.0,
+        help="False accept budget used to rank the combinations in the summary.",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="replay.csv",
+        help="CSV file receiving the metrics of all combinations.",
+    )
+
+    FLAGS, _ = parser.parse_known_args()
+    main()
@@ -0,0 +1,269 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Streaming keyword spotting simulation on arbitrarily long recordings.
+
+Mirrors the main loop of `micro_kws` on the device: feature slices are generated
+incrementally from the incoming audio, the latest `spectrogram_length` slices form the
+model input and the model is invoked every `hop_ms` milliseconds.
+"""
+
+import csv
+import time
+import wave
+import argparse
+
+import numpy as np
+
+import data
+import models
+from micro_frontend import MicroFrontend
+from test_tflite import TFLiteRunner
+
+
+class StreamingFrontend:
+    """Feeds chunks of audio through a MicroFrontend without recomputing past slices.
+
+    Samples that do not yet fill a window and the noise estimate are carried over between
+    calls, so the slices equal those of the whole recording processed at once.
+
+    Args:
+        frontend: MicroFrontend used to compute the slices.
+    """
+
+    def __init__(self, frontend):
+        self.frontend = frontend
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._noise_estimate = None
+
+    def process(self, samples):
+        """Returns the uint16 slices of shape [new_slices, num_channels] completed by samples."""
+        pending = np.concatenate([self._pending, np.asarray(samples, dtype=np.int16)])
+        num_slices = self.frontend.num_frames(len(pending))
+        if num_slices == 0:
+            self._pending = pending
+            return np.zeros((0, self.frontend.num_channels), dtype=np.uint16)
+
+        used = (num_slices - 1) * self.frontend.window_step + self.frontend.window_size
+        features, self._noise_estimate = self.frontend(
+            pending[np.newaxis, :used], self._noise_estimate
+        )
+        self._pending = pending[num_slices * self.frontend.window_step :]
+        return features[0]
+
+
+class SliceRingBuffer:
+    """Keeps the latest num_slices feature slices in a ring buffer.
+
+    Every slice is written twice, at its position and one buffer length later, so the
+    current window is always a contiguous view and no slices are moved on insertion.
+
+    Args:
+        num_slices: Number of slices in one model input.
+        num_channels: Number of values per slice.
+    """
+
+    def __init__(self, num_slices, num_channels):
+        self.num_slices = num_slices
+        self._buffer = np.zeros((2 * num_slices, num_channels), dtype=np.uint16)
+        self._position = 0
+        self.count = 0
+
+    def push(self, feature_slice):
+        self._buffer[self._position] = feature_slice
+        self._buffer[self._position + self.num_slices] = feature_slice
+        self._position = (self._position + 1) % self.num_slices
+        self.count += 1
+
+    def window(self):
+        """Returns the latest slices in chronological order, oldest first."""
+        return self._buffer[self._position : self._position + self.num_slices]
+
+
+class StreamingKWS:
+    """Runs a TFLite keyword spotting model on a stream of audio.
+
+    Args:
+        tflite_path: Path to TFLite file to run.
+        model_settings: Dictionary of common model settings.
+        window_size_ms: Duration of the frontend analysis window.
+        window_stride_ms: Stride between two feature slices.
+        hop_ms: Time between two model invocations, rounded to full slices.
+    """
+
+    def __init__(self, tflite_path, model_settings, window_size_ms, window_stride_ms, hop_ms):
+        self.sample_rate = model_settings["sample_rate"]
+        self.frontend = MicroFrontend(
+            sample_rate=self.sample_rate,
+            window_size=window_size_ms,
+            window_step=window_stride_ms,
+            num_channels=model_settings["dct_coefficient_count"],
+        )
+        self.streaming_frontend = StreamingFrontend(self.frontend)
+        self.slices = SliceRingBuffer(
+            model_settings["spectrogram_length"], model_settings["dct_coefficient_count"]
+        )
+        self.runner = TFLiteRunner(tflite_path)
+        self.hop_slices = max(1, int(round(hop_ms / window_stride_ms)))
+
+    def process(self, samples):
+        """Consumes int16 samples and runs the model for every hop that became due.
+
+        Args:
+            samples: Array of int16 PCM samples following the previously processed ones.
+
+        Returns:
+            Tuple of the timestamps in seconds, taken at the end of the newest slice of each
+            input window, and the posteriors of shape [invocations, label_count].
+        """
+        windows = []
+        timestamps = []
+        for feature_slice in self.streaming_frontend.process(samples):
+            self.slices.push(feature_slice)
+            if self.slices.count < self.slices.num_slices:
+                continue
+            if (self.slices.count - self.slices.num_slices) % self.hop_slices:
+                continue
+            windows.append(self.slices.window().reshape(-1))
+            end_sample = (self.slices.count - 1) * self.frontend.window_step
+            timestamps.append((end_sample + self.frontend.window_size) / self.sample_rate)
+
+        if not windows:
+            return np.zeros(0), np.zeros((0, self.runner.output_size), dtype=np.float32)
+
+        # Same scaling as calculate_features applies during training.
+        inputs = np.stack(windows).astype(np.float32) * (10.0 / 256.0)
+        return np.array(timestamps), self.runner(inputs)
+
+
+def read_wav_chunks(wav_path, chunk_samples):
+    """Yields the samples of a mono 16bit PCM wav file in chunks without loading all of it.
+
+    Args:
+        wav_path: Path of the wav file.
+        chunk_samples: Number of samples per chunk.
+
+    Returns:
+        Tuple of the sample rate and a generator of int16 arrays.
+    """
+    handle = wave.open(str(wav_path), "rb")
+    if handle.getnchannels() != 1 or handle.getsampwidth() != 2:
+        handle.close()
+        raise RuntimeError(f"{wav_path} is not a mono 16bit PCM wav file")
+
+    def _chunks():
+        with handle:
+            while True:
+                frames = handle.readframes(chunk_samples)
+                if not frames:
+                    break
+                yield np.frombuffer(frames, dtype="<i2")
+
+    return handle.getframerate(), _chunks()
+
+
+def main():
+    words = data.prepare_words_list(FLAGS.wanted_words.split(","))
+    model_settings = models.prepare_model_settings(
+        len(words),
+        FLAGS.sample_rate,
+        FLAGS.clip_duration_ms,
+        FLAGS.window_size_ms,
+        FLAGS.window_stride_ms,
+        FLAGS.dct_coefficient_count,
+    )
+    streamer = StreamingKWS(
+        FLAGS.tflite_path,
+        model_settings,
+        FLAGS.window_size_ms,
+        FLAGS.window_stride_ms,
+        FLAGS.hop_ms,
+    )
+
+    sample_rate, chunks = read_wav_chunks(FLAGS.wav, int(FLAGS.sample_rate * FLAGS.chunk_ms / 1000))
+    if sample_rate != FLAGS.sample_rate:
+        raise RuntimeError(f"Expected a sample rate of {FLAGS.sample_rate}, got {sample_rate}")
+
+    num_samples = 0
+    processing_time = 0.0
+    with open(FLAGS.out, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["time", *words])
+        for chunk in chunks:
+            start = time.perf_counter()
+            timestamps, posteriors = streamer.process(chunk)
+            processing_time += time.perf_counter() - start
+            num_samples += len(chunk)
+            for timestamp, posterior in zip(timestamps, posteriors):
+                writer.writerow([f"{timestamp:.3f}", *(f"{value:.5f}" for value in posterior)])
+
+    duration = num_samples / FLAGS.sample_rate
+    print(f"Processed {duration:.1f}s of audio in {processing_time:.1f}s")
+    print(f"Real-time factor: {processing_time / max(duration, 1e-9):.4f}")
+    print(f"Posteriors written to {FLAGS.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wav", type=str, default="", help="Recording to run the model on.")
+    parser.add_argument(
+        "--tflite_path",
+        type=str,
+        default="",
+        help="Path to TFLite file to use for inference.",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="posteriors.csv",
+        help="CSV file receiving the timestamped posteriors.",
+    )
+    parser.add_argument(
+        "--hop_ms",
+        type=float,
+        default=100.0,
+        help="Time between two model invocations. Rounded to full feature slices.",
+    )
+    parser.add_argument(
+        "--chunk_ms",
+        type=float,
+        default=1000.0,
+        help="Amount of audio read from the wav file per step.",
+    )
+    parser.add_argument(
+        "--sample_rate",
+        type=int,
+        default=16000,
+        help="Expected sample rate of the wavs",
+    )
+    parser.add_argument(
+        "--clip_duration_ms",
+        type=int,
+        default=1000,
+        help="Expected duration in milliseconds of the wavs",
+    )
+    parser.add_argument(
+        "--window_size_ms",
+        type=float,
+        default=30.0,
+        help="How long each spectrogram timeslice is",
+    )
+    parser.add_argument(
+        "--window_stride_ms",
+        type=float,
+        default=20.0,
+        help="How long each spectrogram timeslice is",
+    )
+    parser.add_argument(
+        "--dct_coefficient_count",
+        type=int,
+        default=40,
+        help="How many bins to use for the MFCC fingerprint",
+    )
+    parser.add_argument(
+        "--wanted_words",
+        type=str,
+        default="yes,no,up,down,left,right,on,off,stop,go",
+        help="Words to use (others will be added to an unknown label)",
+    )
+
+    FLAGS, _ = parser.parse_known_args()
+    main()
@@ -195,6 +195,121 @@ def estimate_fully_connected_macs(
     return macs
 
 
+def estimate_lstm_macs(
+    in_shape: List[int],
+    n_cell: int,
+    n_output: int,
+    time_major: bool = False,
+    use_peephole: bool = False,
+    use_projection: bool = False,
+):
+    """Calculate the estimated number of MACS to execute a unidirectional sequence LSTM layer.
+
+    Arguments
+    ---------
+    in_shape : list
+        The shape of the input tensor [batch_size, time, input_size] ([time, batch_size, input_size] if time_major)
+    n_cell : int
+        The number of cells (rows of the input to gate weights)
+    n_output : int
+        The size of the output and of the recurrent input
+    time_major : bool
+        Whether the time is the first axis of the input
+    use_peephole : bool
+        Whether the gates also depend on the cell state
+    use_projection : bool
+        Whether the output is projected from n_cell to n_output
+
+    Returns
+    -------
+    macs : int
+        Estimated number of MAC operations for the given LSTM layer
+
+    Assumptions
+    -----------
+    - Every time step multiplies the input and the previous output with the weights of the input, forget, cell and output gates
+    - The cell update (f * c + i * g) and the output (o * tanh(c)) count as one MAC per cell and product
+    """
+    time, batch_size = (in_shape[0], in_shape[1]) if time_major else (in_shape[1], in_shape[0])
+    n_input = in_shape[2]
+    assert batch_size == 1  # Inference -> batch_size=1
+
+    step_macs = 4 * n_cell * (n_input + n_output) + 3 * n_cell
+    if use_peephole:
+        step_macs += 3 * n_cell
+    if use_projection:
+        step_macs += n_cell * n_output
+    return time * step_macs
+
+
+def estimate_pool2d_macs(out_shape: List[int], filter_h: int, filter_w: int):
+    """Calculate the estimated number of operations to execute an average or max pooling layer.
+
+    Arguments
+    ---------
+    out_shape : list
+        The shape of the NHWC output tensor [batch_size, output_h, output_w, output_c]
+    filter_h : int
+        The height of the pooling window
+    filter_w : int
+        The width of the pooling window
+
+    Returns
+    -------
+    macs : int
+        One addition or comparison per output element and window position
+    """
+    return math.prod(out_shape) * filter_h * filter_w
+
+
+def estimate_elementwise_macs(out_shape: List[int]):
+    """Calculate the estimated number of operations to execute an elementwise layer (e.g. ADD, MUL, RELU).
+
+    Arguments
+    ---------
+    out_shape : list
+        The shape of the output tensor
+
+    Returns
+    -------
+    macs : int
+        One operation per output element
+    """
+    return math.prod(out_shape)
+
+
+def estimate_reduce_macs(in_shape: List[int]):
+    """Calculate the estimated number of operations to execute a reduction layer (e.g. MEAN, REDUCE_MAX).
+
+    Arguments
+    ---------
+    in_shape : list
+        The shape of the input tensor
+
+    Returns
+    -------
+    macs : int
+        One addition or comparison per input element
+    """
+    return math.prod(in_shape)
+
+
+def estimate_softmax_macs(in_shape: List[int]):
+    """Calculate the estimated number of operations to execute a softmax layer.
+
+    Arguments
+    ---------
+    in_shape : list
+        The shape of the input tensor
+
+    Returns
+    -------
+    macs : int
+        Three operations per element: finding the maximum, exponentiating and summing, normalizing
+    """
+    return 3 * math.prod(in_shape)
+
+
 def estimate_rom(tensors: List[MyTensor]):
     """Calculate the estimated number of bytes required to store model weights in ROM.
 
@@ -228,7 +343,13 @@ def estimate_rom(tensors: List[MyTensor]):
 
     return rom_bytes
 
-def estimate_ram(tensors: List[MyTensor], layers: List[MyLayer]):
+def estimate_ram(
+    tensors: List[MyTensor],
+    layers: List[MyLayer],
+    inputs: List[int] = (),
+    outputs: List[int] = (),
+    inplace_ops: List[str] = (),
+):
     """Calculate the estimated number of bytes required to store model tensors in RAM.
 
     Arguments
@@ -237,6 +358,12 @@ def estimate_ram(tensors: List[MyTensor], layers: List[MyLayer]):
         The tensors of the processed model (see definition of MyTensor type above)
     layers : list
         The layers of the processed model (see definition of MyLayer type above)
+    inputs : list
+        Indices of the model input tensors, alive from the first layer on
+    outputs : list
+        Indices of the model output tensors, alive until the last layer
+    inplace_ops : list
+        Names of layers writing their output into the buffer of their first input (e.g. RESHAPE)
 
     Returns
     -------
@@ -245,41 +372,188 @@ def estimate_ram(tensors: List[MyTensor], layers: List[MyLayer]):
 
     Assumptions
     -----------
-    - Only fully-sequential model architectures are considered (e.g. no branches/parallel paths are allowed)
+    - The layers are given in execution order, branches/parallel paths are allowed
     - Only intermediate tensors (activations) are considered for RAM usage (no temporary workspace buffers are used in the layers)
     - During the operation of a single layer, all of its input and output tensors have to be available
-    - In-place operations are not allowed (e.g. the input and output buffer of a layer can not be the same)
+    - In-place operations are only allowed for the layers listed in inplace_ops
     - The input and output tensors of the whole model can also be considered for memory planning
 
     """
     ram_bytes = 0
 
     ### ENTER STUDENT CODE BELOW ###
-    # Gready by size algorithm
-    
-    # Initialize variables
-    memory_pool = {}    # Dictionary to simulate buffer allocation
-    peak_ram = 0        # Track peak RAM usage
+    ram_bytes = plan_memory(tensors, layers, inputs, outputs, inplace_ops).peak_bytes
+    ### ENTER STUDENT CODE ABOVE ###
 
-    # Iterate through the layers
-    for layer_nb in range(len(layers)):
-        current_ram = 0
+    return ram_bytes
 
-        for idx in layers[layer_nb].inputs + layers[layer_nb].outputs:
-            in_ram_tensors = [t for t in tensors if ((t.idx == idx) and (not t.is_const))] 
-            if len(in_ram_tensors) != 0:
-                for tensor in in_ram_tensors:
-                    if tensor.idx not in memory_pool:
-                        memory_pool[tensor.idx] = tensor_size(tensor)
-                        current_ram += memory_pool[tensor.idx]
 
-        peak_ram = max(peak_ram, sum(memory_pool.values())) 
+MemoryPlan = collections.namedtuple("MemoryPlan", ("peak_bytes", "peak_layer", "live_tensors"))
 
-        # Free memory for tensors no longer used
-        used_indices = {idx for l in layers[layer_nb+1:] for idx in l.inputs + l.outputs}
-        memory_pool = {idx: size for idx, size in memory_pool.items() if idx in used_indices}
 
-    ram_bytes = peak_ram
-    ### ENTER STUDENT CODE ABOVE ###
+def buffer_aliases(tensors: List[MyTensor], layers: List[MyLayer], inplace_ops: List[str] = ()):
+    """Determine which tensors share a buffer because of in-place layers.
+
+    Arguments
+    ---------
+    tensors : list
+        The tensors of the processed model
+    layers : list
+        The layers of the processed model
+    inplace_ops : list
+        Names of layers writing their output into the buffer of their first input
+
+    Returns
+    -------
+    aliases : dict
+        Maps the index of every non-constant tensor to the index of the tensor owning its buffer
+    """
+    sizes = {tensor.idx: tensor_size(tensor) for tensor in tensors if not tensor.is_const}
+    aliases = {idx: idx for idx in sizes}
+    for layer in layers:
+        if layer.name not in inplace_ops or not layer.inputs or len(layer.outputs) != 1:
+            continue
+        source, output = layer.inputs[0], layer.outputs[0]
+        if source in sizes and output in sizes and sizes[source] == sizes[output]:
+            aliases[output] = aliases[source]
+    return aliases
+
+
+def tensor_lifetimes(
+    tensors: List[MyTensor],
+    layers: List[MyLayer],
+    inputs: List[int] = (),
+    outputs: List[int] = (),
+    inplace_ops: List[str] = (),
+):
+    """Determine the first and last layer using each buffer of non-constant tensors.
+
+    Arguments
+    ---------
+    tensors : list
+        The tensors of the processed model
+    layers : list
+        The layers of the processed model in execution order
+    inputs : list
+        Indices of the model input tensors, alive from the first layer on
+    outputs : list
+        Indices of the model output tensors, alive until the last layer
+    inplace_ops : list
+        Names of layers writing their output into the buffer of their first input
+
+    Returns
+    -------
+    lifetimes : dict
+        Maps the index of the tensor owning a buffer to a (first, last) tuple of layer positions
+    """
+    aliases = buffer_aliases(tensors, layers, inplace_ops)
+    lifetimes = {}
+
+    def _use(idx, position):
+        if idx in aliases:
+            first, last = lifetimes.get(aliases[idx], (position, position))
+            lifetimes[aliases[idx]] = (min(first, position), max(last, position))
+
+    for position, layer in enumerate(layers):
+        for idx in layer.inputs + layer.outputs:
+            _use(idx, position)
+    if layers:
+        for idx in inputs:
+            _use(idx, 0)
+        for idx in outputs:
+            _use(idx, len(layers) - 1)
+    return lifetimes
+
+
+def plan_memory(
+    tensors: List[MyTensor],
+    layers: List[MyLayer],
+    inputs: List[int] = (),
+    outputs: List[int] = (),
+    inplace_ops: List[str] = (),
+):
+    """Determine the peak of simultaneously alive buffers and where it occurs.
+
+    A buffer occupies memory from the first to the last layer using it. Adding its size at
+    the first and removing it after the last layer gives the usage per layer as prefix sum.
+
+    Arguments
+    ---------
+    tensors, layers, inputs, outputs, inplace_ops
+        See tensor_lifetimes
 
-    return ram_bytes
\ No newline at end of file
+    Returns
+    -------
+    plan : MemoryPlan
+        The peak usage in bytes, the position of the first layer reaching it (or None for an
+        empty model) and the indices of the buffers alive at that layer
+    """
+    lifetimes = tensor_lifetimes(tensors, layers, inputs, outputs, inplace_ops)
+    if not layers:
+        return MemoryPlan(0, None, [])
+
+    sizes = {tensor.idx: tensor_size(tensor) for tensor in tensors}
+    delta = np.zeros(len(layers) + 1, dtype=np.int64)
+    for idx, (first, last) in lifetimes.items():
+        delta[first] += sizes[idx]
+        delta[last + 1] -= sizes[idx]
+    usage = np.cumsum(delta[:-1])
+
+    peak_layer = int(np.argmax(usage))
+    live_tensors = sorted(
+        idx for idx, (first, last) in lifetimes.items() if first <= peak_layer <= last
+    )
+    return MemoryPlan(int(usage[peak_layer]), peak_layer, live_tensors)
+
+
+def plan_arena(
+    tensors: List[MyTensor],
+    layers: List[MyLayer],
+    inputs: List[int] = (),
+    outputs: List[int] = (),
+    inplace_ops: List[str] = (),
+):
+    """Assign arena offsets to the intermediate tensors, largest tensors first.
+
+    Follows the greedy-by-size strategy of the TFLite Micro memory planner: every buffer is
+    placed at the lowest offset not overlapping any already placed buffer that is alive at the
+    same time. Unlike estimate_ram, the result accounts for gaps that cannot be reused.
+
+    Arguments
+    ---------
+    tensors, layers, inputs, outputs, inplace_ops
+        See tensor_lifetimes
+
+    Returns
+    -------
+    arena_bytes : int
+        Size of the arena holding all planned tensors
+    offsets : dict
+        Maps the tensor index to its offset in the arena, aliased tensors share the offset
+    """
+    lifetimes = tensor_lifetimes(tensors, layers, inputs, outputs, inplace_ops)
+    sizes = {tensor.idx: tensor_size(tensor) for tensor in tensors}
+    order = sorted(lifetimes, key=lambda idx: (-sizes[idx], lifetimes[idx][0]))
+
+    offsets = {}
+    placed = []  # (offset, end, first, last) of the planned buffers
+    for idx in order:
+        first, last = lifetimes[idx]
+        conflicts = sorted(
+            (offset, end)
+            for offset, end, other_first, other_last in placed
+            if other_first <= last and first <= other_last
+        )
+        offset = 0
+        for conflict_offset, conflict_end in conflicts:
+            if offset + sizes[idx] <= conflict_offset:
+                break
+            offset = max(offset, conflict_end)
+        offsets[idx] = offset
+        placed.append((offset, offset + sizes[idx], first, last))
+
+    arena_bytes = max((end for _, end, _, _ in placed), default=0)
+    for idx, owner in buffer_aliases(tensors, layers, inplace_ops).items():
+        if owner in offsets:
+            offsets[idx] = offsets[owner]
+    return arena_bytes, offsets
@@ -0,0 +1,343 @@
+# Copyright 2022 Chair of Electronic Design Automation, TUM
+"""Runs grid or random searches over the train.py flags and model architectures.
+
+The search space is a JSON file mapping train.py flags (without the leading dashes) to lists
+of values, e.g.
+
+    {"model_architecture": ["micro_kws_xs", "lstm"], "learning_rate": ["0.001,0.0001"]}
+
+Every run trains the model, converts it to an int8 TFLite model, tests it and estimates its
+ROM, RAM and MACs. Runs are executed in parallel, each one pinned to its own set of cores,
+and all of them share one dataset cache. The results of all runs are collected in one CSV.
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import itertools
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from queue import Queue
+
+from download import download_and_extract
+from estimate import estimate
+from feasibility import OVER_BUDGET_EXIT_CODE
+
+RESULT_FIELDS = ["run", "status", "accuracy", "rom", "ram", "macs", "duration_s"]
+
+
+def expand_grid(space):
+    """Returns every combination of the search space as list of flag dicts."""
+    names = list(space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def sample_random(space, num_samples, seed=0):
+    """Returns num_samples distinct random combinations of the search space.
+
+    Falls back to the full grid if the space has at most num_samples combinations.
+    """
+    grid = expand_grid(space)
+    if len(grid) <= num_samples:
+        return grid
+    return random.Random(seed).sample(grid, num_samples)
+
+
+def to_args(params):
+    """Turns a flag dict into command line arguments, booleans become store_true flags."""
+    args = []
+    for name, value in params.items():
+        if isinstance(value, bool):
+            if value:
+                args.append(f"--{name}")
+        else:
+            args.extend([f"--{name}", str(value)])
+    return args
+
+
+def read_accuracy(path):
+    """Reads the test accuracy in percent written by convert.py --out."""
+    with open(path, "r") as handle:
+        return float(handle.read().strip().split("=")[1])
+
+
+def core_groups(cores_per_run, num_parallel):
+    """Splits the cores available to this process into num_parallel groups.
+
+    Returns:
+        List of core sets, or a list of None if pinning is not supported on this platform.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * num_parallel
+    cores = sorted(os.sched_getaffinity(0))
+    if cores_per_run is None:
+        cores_per_run = max(len(cores) // num_parallel, 1)
+    groups = []
+    for idx in range(num_parallel):
+        start = (idx * cores_per_run) % len(cores)
+        groups.append({cores[(start + offset) % len(cores)] for offset in range(cores_per_run)})
+    return groups
+
+
+def run_steps(run_dir, params, common_args, cores, budget_args=None):
+    """Trains, converts, tests and estimates one configuration.
+
+    Args:
+        run_dir: Directory receiving the checkpoints, the TFLite model and the log.
+        params: Flags of this run.
+        common_args: Command line arguments passed to all scripts of every run.
+        cores: Set of cores to pin the run to or None.
+        budget_args: Limits passed to feasibility.py. If given, models exceeding them are
+            rejected before training.
+
+    Returns:
+        Dict with the status and metrics of the run.
+    """
+    run_dir.mkdir(parents=True, exist_ok=True)
+    model_name = params.get("model_name", run_dir.name)
+    checkpoint = run_dir / model_name / "best" / f"{model_name}_best_ckpt"
+    tflite_path = run_dir / f"{model_name}.tflite"
+    accuracy_path = run_dir / "accuracy.txt"
+    args = [*common_args, *to_args(params), "--model_name", model_name]
+
+    steps = [
+        ["train.py", *args, "--train_dir", str(run_dir)],
+        [
+            "convert.py",
+            *args,
+            "--checkpoint",
+            str(checkpoint),
+            "--inference_type",
+            "int8",
+            "--tflite_path",
+            str(tflite_path),
+            "--out",
+            str(accuracy_path),
+        ],
+    ]
+    if budget_args:
+        steps.insert(0, ["feasibility.py", *args, *budget_args])
+
+    start = time.time()
+    with open(run_dir / "log.txt", "w") as log:
+        for step in steps:
+            log.write(f"$ {' '.join(step)}\n")
+            log.flush()
+            process = subprocess.Popen(
+                [sys.executable, *step],
+                cwd=Path(__file__).parent,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+            # preexec_fn is not safe in threads. The child is pinned while the interpreter
+            # starts up, before it creates the threads which inherit the affinity.
+            if cores is not None:
+                try:
+                    os.sched_setaffinity(process.pid, cores)
+                except ProcessLookupError:
+                    pass  # Already finished
+            returncode = process.wait()
+            if returncode != 0:
+                # Only models over the budget are rejected, errors of feasibility.py are failures.
+                if step[0] == "feasibility.py" and returncode == OVER_BUDGET_EXIT_CODE:
+                    status = "rejected"
+                else:
+                    status = f"failed ({step[0]})"
+                return {"status": status, "duration_s": round(time.time() - start)}
+
+    try:
+        rom, ram, macs = estimate(str(tflite_path))
+    except AssertionError as error:
+        # The estimator only supports a subset of the TFLite operators.
+        return {
+            "status": f"failed (estimate: {error})",
+            "accuracy": read_accuracy(accuracy_path),
+            "duration_s": round(time.time() - start),
+        }
+    return {
+        "status": "ok",
+        "accuracy": read_accuracy(accuracy_path),
+        "rom": rom,
+        "ram": ram,
+        "macs": macs,
+        "duration_s": round(time.time() - start),
+    }
+
+
+def sweep(configs, out_dir, common_args, num_parallel, cores_per_run=None, budget_args=None):
+    """Runs all configurations and writes the results table as they finish.
+
+    Args:
+        configs: List of flag dicts, one per run.
+        out_dir: Directory receiving one subdirectory per run and results.csv.
+        common_args: Command line arguments passed to all scripts of every run.
+        num_parallel: Number of runs executed at the same time.
+        cores_per_run: Number of cores each run is pinned to, defaults to an even split.
+        budget_args: Limits passed to feasibility.py before each run, see run_steps.
+
+    Returns:
+        List of result dicts in the order of configs.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    param_names = sorted({name for params in configs for name in params})
+    free_cores = Queue()
+    for cores in core_groups(cores_per_run, num_parallel):
+        free_cores.put(cores)
+
+    def _run(idx, params):
+        cores = free_cores.get()
+        try:
+            return run_steps(out_dir / f"run_{idx:03d}", params, common_args, cores, budget_args)
+        finally:
+            free_cores.put(cores)
+
+    results = [None] * len(configs)
+    with ThreadPoolExecutor(num_parallel) as executor, open(
+        out_dir / "results.csv", "w", newline=""
+    ) as handle:
+        fieldnames = [RESULT_FIELDS[0], *param_names, *RESULT_FIELDS[1:]]
+        writer = csv.DictWriter(handle, fieldnames=fieldnames)
+        writer.writeheader()
+        futures = {executor.submit(_run, idx, params): idx for idx, params in enumerate(configs)}
+        for future in as_completed(futures):
+            idx = futures[future]
+            results[idx] = {"run": f"run_{idx:03d}", **configs[idx], **future.result()}
+            writer.writerow(results[idx])
+            handle.flush()
+            print(f"{results[idx]['run']}: {results[idx]['status']} {configs[idx]}")
+    return results
+
+
+def main():
+    with open(FLAGS.space, "r") as handle:
+        space = json.load(handle)
+    if FLAGS.num_samples > 0:
+        configs = sample_random(space, FLAGS.num_samples, FLAGS.seed)
+    else:
+        configs = expand_grid(space)
+
+    out_dir = Path(FLAGS.out_dir)
+    common_args = [
+        *UNPARSED,
+        "--data_url",
+        FLAGS.data_url,
+        "--data_dir",
+        FLAGS.data_dir,
+        "--cache_dir",
+        FLAGS.cache_dir or str(out_dir / "cache"),
+    ]
+    # Download once instead of letting the first runs race for it.
+    download_and_extract(FLAGS.data_url, FLAGS.data_dir)
+
+    print(f"Running {len(configs)} configurations, {FLAGS.num_parallel} at a time...")
+    budget_args = []
+    for name in ["max_rom", "max_ram", "max_macs"]:
+        if getattr(FLAGS, name) is not None:
+            budget_args.extend([f"--{name}", str(getattr(FLAGS, name))])
+    results = sweep(
+        configs, out_dir, common_args, FLAGS.num_parallel, FLAGS.cores_per_run, budget_args
+    )
+
+    print(f"Results written to {out_dir / 'results.csv'}")
+    finished = [result for result in results if result["status"] == "ok"]
+    finished.sort(key=lambda result: -result["accuracy"])
+    for result in finished:
+        print(
+            f"{result['run']}: accuracy={result['accuracy']:.2f}% ROM={result['rom']} "
+            f"RAM={result['ram']} MACs={result['macs']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        epilog="Unknown arguments are passed to train.py and convert.py of every run."
+    )
+    parser.add_argument(
+        "--space",
+        type=str,
+        required=True,
+        help="JSON file mapping train.py flags to the list of values to search.",
+    )
+    parser.add_argument(
+        "--num_samples",
+        type=int,
+        default=0,
+        help="Number of random combinations to run, 0 runs the full grid.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the random search.",
+    )
+    parser.add_argument(
+        "--num_parallel",
+        type=int,
+        default=1,
+        help="Number of runs executed at the same time.",
+    )
+    parser.add_argument(
+        "--cores_per_run",
+        type=int,
+        default=None,
+        help="Number of cores each run is pinned to. Defaults to an even split.",
+    )
+    parser.add_argument(
+        "--max_rom",
+        type=int,
+        default=None,
+        help="Reject models with more bytes of weights before training.",
+    )
+    parser.add_argument(
+        "--max_ram",
+        type=int,
+        default=None,
+        help="Reject models with more bytes of activations before training.",
+    )
+    parser.add_argument(
+        "--max_macs",
+        type=int,
+        default=None,
+        help="Reject models with more MACs per inference before training.",
+    )
+    parser.add_argument(
+        "--out_dir",
+        type=str,
+        default="sweep",
+        help="Directory receiving the runs and results.csv.",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Dataset cache shared by all runs. Defaults to <out_dir>/cache.",
+    )
+    parser.add_argument(
+        "--data_url",
+        type=str,
+        default="http://download.tensorflow.org/data/speech_commands_v0.02.tar.gz",
+        help="Location of speech training data archive on the web.",
+    )
+    try:
+        login = os.getlogin()
+    except:
+        login = "unknown"
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default=os.getenv(
+            "SPEECH_COMMANDS_DIR",
+            default=os.path.join(tempfile.gettempdir(), login, "speech_dataset"),
+        ),
+        help="Where the speech training data is stored, shared by all runs.",
+    )
+
+    FLAGS, UNPARSED = parser.parse_known_args()
+    main()
@@ -94,6 +94,14 @@ if __name__ == "__main__":
         Where to download the speech training data to.
         """,
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="""\
+        Where to persist decoded audio and features between runs. Disabled if not set.
+        """,
+    )
     parser.add_argument(
         "--silence_percentage",
         type=float,
@@ -223,6 +231,7 @@ if __name__ == "__main__":
         testing_percentage=FLAGS.testing_percentage,
         model_settings=model_settings,
         micro=FLAGS.micro,
+        cache_dir=FLAGS.cache_dir,
     )
 
     test(model, audio_processor, model_settings)
@@ -24,9 +24,18 @@ import numpy as np
 import data
 import models
 from test_model import get_accuracy, get_confusion_matrix
-
-
-def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="test"):
+from test_tflite import TFLiteRunner, tflite_predict_sharded
+
+
+def tflite_test(
+    model_settings,
+    audio_processor,
+    tflite_path,
+    out=None,
+    mode="test",
+    batch_size=256,
+    num_workers=1,
+):
     """Calculate accuracy and confusion matrices on the test set.
 
     A TFLite model used for doing testing.
@@ -36,6 +45,9 @@ def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="te
         audio_processor: Audio processor class object.
         tflite_path: Path to TFLite file to use for inference.
         out: File where the determined accuracy should be written to.
+        mode: Which set to evaluate, one of 'test', 'validation' or 'train'.
+        batch_size: Number of samples per interpreter invocation.
+        num_workers: Number of processes to split the inference across.
     """
     if mode == "test":
         mode_ = audio_processor.Modes.TESTING
@@ -46,15 +58,25 @@ def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="te
     else:
         raise RuntimeError(f"Unsupported mode: {mode}")
 
-    test_data = audio_processor.get_data(mode_).batch(1)
-    expected_indices = np.concatenate([y for x, y in test_data])
-    predicted_indices = []
+    test_data = audio_processor.get_data(mode_).batch(batch_size)
 
     print(f"Running testing on {mode} set...")
 
-    for mfcc, label in test_data:
-        prediction = tflite_inference(mfcc, tflite_path)
-        predicted_indices.append(np.squeeze(tf.argmax(prediction, axis=1)))
+    if num_workers > 1:
+        batches = [(mfcc.numpy(), label.numpy()) for mfcc, label in test_data]
+        features = np.concatenate([mfcc for mfcc, label in batches])
+        expected_indices = np.concatenate([label for mfcc, label in batches])
+        predicted_indices = tflite_predict_sharded(tflite_path, features, num_workers, batch_size)
+    else:
+        expected_indices = np.concatenate([y for x, y in test_data])
+        predicted_indices = []
+        runner = TFLiteRunner(tflite_path)
+
+        for mfcc, label in test_data:
+            prediction = runner(mfcc)
+            predicted_indices.append(np.argmax(prediction, axis=1))
+
+        predicted_indices = np.concatenate(predicted_indices)
 
     accuracy = get_accuracy(predicted_indices, expected_indices)
     print(f"{mode} accuracy = {accuracy * 100:.2f}%(N={audio_processor.set_size(mode_)})")
@@ -74,6 +96,8 @@ def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="te
 def tflite_inference(input_data, tflite_path):
     """Call forwards pass of TFLite file and returns the result.
 
+    Loads the model on every call, use TFLiteRunner when running more than one input.
+
     Args:
         input_data: Input data to use on forward pass.
         tflite_path: Path to TFLite file to run.
@@ -81,38 +105,7 @@ def tflite_inference(input_data, tflite_path):
     Returns:
         Output from inference.
     """
-    interpreter = tf.lite.Interpreter(model_path=tflite_path)
-    interpreter.allocate_tensors()
-
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-
-    input_dtype = input_details[0]["dtype"]
-    output_dtype = output_details[0]["dtype"]
-
-    # Check if the input/output type is quantized,
-    # set scale and zero-point accordingly
-    if input_dtype == np.int8:
-        input_scale, input_zero_point = input_details[0]["quantization"]
-    else:
-        input_scale, input_zero_point = 1, 0
-
-    input_data = input_data / input_scale + input_zero_point
-    input_data = np.round(input_data) if input_dtype == np.int8 else input_data
-
-    if output_dtype == np.int8:
-        output_scale, output_zero_point = output_details[0]["quantization"]
-    else:
-        output_scale, output_zero_point = 1, 0
-
-    interpreter.set_tensor(input_details[0]["index"], tf.cast(input_data, input_dtype))
-    interpreter.invoke()
-
-    output_data = interpreter.get_tensor(output_details[0]["index"])
-
-    output_data = output_scale * (output_data.astype(np.float32) - output_zero_point)
-
-    return output_data
+    return TFLiteRunner(tflite_path)(input_data)
 
 
 def main():
@@ -135,9 +128,17 @@ def main():
         testing_percentage=FLAGS.testing_percentage,
         model_settings=model_settings,
         micro=FLAGS.micro,
+        cache_dir=FLAGS.cache_dir,
     )
 
-    tflite_test(model_settings, audio_processor, FLAGS.tflite_path, FLAGS.out, FLAGS.mode)
+    tflite_test(
+        model_settings,
+        audio_processor,
+        FLAGS.tflite_path,
+        FLAGS.out,
+        FLAGS.mode,
+        num_workers=FLAGS.num_workers,
+    )
 
 
 if __name__ == "__main__":
@@ -163,6 +164,14 @@ if __name__ == "__main__":
         Where to download the speech training data to.
         """,
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="""\
+        Where to persist decoded audio and features between runs. Disabled if not set.
+        """,
+    )
     parser.add_argument(
         "--tflite_path",
         type=str,
@@ -252,6 +261,12 @@ if __name__ == "__main__":
         help="File which should contain the determined accuracy",
     )
     parser.add_argument("--mode", choices=["test", "validate", "train"], default="test")
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of processes running inference, each with its own interpreter.",
+    )
 
     FLAGS, _ = parser.parse_known_args()
     main()
@@ -15,6 +15,8 @@
 """Functions to run inference and test keyword spotting models in tflite format."""
 
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 import tensorflow as tf
 import numpy as np
@@ -24,7 +26,15 @@ import models
 from test import get_accuracy, get_confusion_matrix
 
 
-def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="test"):
+def tflite_test(
+    model_settings,
+    audio_processor,
+    tflite_path,
+    out=None,
+    mode="test",
+    batch_size=256,
+    num_workers=1,
+):
     """Calculate accuracy and confusion matrices on the test set.
 
     A TFLite model used for doing testing.
@@ -34,6 +44,9 @@ def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="te
         audio_processor: Audio processor class object.
         tflite_path: Path to TFLite file to use for inference.
         out: File where the determined accuracy should be written to.
+        mode: Which set to evaluate, one of 'test', 'validation' or 'train'.
+        batch_size: Number of samples per interpreter invocation.
+        num_workers: Number of processes to split the inference across.
     """
     if mode == "test":
         mode_ = audio_processor.Modes.TESTING
@@ -44,15 +57,25 @@ def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="te
     else:
         raise RuntimeError(f"Unsupported mode: {mode}")
 
-    test_data = audio_processor.get_data(mode_).batch(1)
-    expected_indices = np.concatenate([y for x, y in test_data])
-    predicted_indices = []
+    test_data = audio_processor.get_data(mode_).batch(batch_size)
 
     print(f"Running testing on {mode} set...")
 
-    for mfcc, label in test_data:
-        prediction = tflite_inference(mfcc, tflite_path)
-        predicted_indices.append(np.squeeze(tf.argmax(prediction, axis=1)))
+    if num_workers > 1:
+        batches = [(mfcc.numpy(), label.numpy()) for mfcc, label in test_data]
+        features = np.concatenate([mfcc for mfcc, label in batches])
+        expected_indices = np.concatenate([label for mfcc, label in batches])
+        predicted_indices = tflite_predict_sharded(tflite_path, features, num_workers, batch_size)
+    else:
+        expected_indices = np.concatenate([y for x, y in test_data])
+        predicted_indices = []
+        runner = TFLiteRunner(tflite_path)
+
+        for mfcc, label in test_data:
+            prediction = runner(mfcc)
+            predicted_indices.append(np.argmax(prediction, axis=1))
+
+        predicted_indices = np.concatenate(predicted_indices)
 
     accuracy = get_accuracy(predicted_indices, expected_indices)
     print(f"{mode} accuracy = {accuracy * 100:.2f}%(N={audio_processor.set_size(mode_)})")
@@ -72,6 +95,8 @@ def tflite_test(model_settings, audio_processor, tflite_path, out=None, mode="te
 def tflite_inference(input_data, tflite_path):
     """Call forwards pass of TFLite file and returns the result.
 
+    Loads the model on every call, use TFLiteRunner when running more than one input.
+
     Args:
         input_data: Input data to use on forward pass.
         tflite_path: Path to TFLite file to run.
@@ -79,38 +104,113 @@ def tflite_inference(input_data, tflite_path):
     Returns:
         Output from inference.
     """
-    interpreter = tf.lite.Interpreter(model_path=tflite_path)
-    interpreter.allocate_tensors()
+    return TFLiteRunner(tflite_path)(input_data)
 
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
 
-    input_dtype = input_details[0]["dtype"]
-    output_dtype = output_details[0]["dtype"]
+def tflite_predict_sharded(tflite_path, features, num_workers, batch_size=256):
+    """Predicts class indices with a pool of processes, each running its own interpreter.
 
-    # Check if the input/output type is quantized,
-    # set scale and zero-point accordingly
-    if input_dtype == np.int8:
-        input_scale, input_zero_point = input_details[0]["quantization"]
-    else:
-        input_scale, input_zero_point = 1, 0
-
-    input_data = input_data / input_scale + input_zero_point
-    input_data = np.round(input_data) if input_dtype == np.int8 else input_data
+    The features are split into one contiguous shard per worker and the predictions are
+    merged in the original order, so the result equals the serial evaluation.
 
-    if output_dtype == np.int8:
-        output_scale, output_zero_point = output_details[0]["quantization"]
-    else:
-        output_scale, output_zero_point = 1, 0
-
-    interpreter.set_tensor(input_details[0]["index"], tf.cast(input_data, input_dtype))
-    interpreter.invoke()
+    Args:
+        tflite_path: Path to TFLite file to run.
+        features: Float input data of shape [samples, ...].
+        num_workers: Number of worker processes.
+        batch_size: Number of samples per interpreter invocation.
 
-    output_data = interpreter.get_tensor(output_details[0]["index"])
+    Returns:
+        Predicted class index for every sample.
+    """
+    shards = np.array_split(features, num_workers)
+    # TensorFlow is not fork-safe once initialized, so the workers are spawned.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as executor:
+        predictions = executor.map(
+            _predict_shard,
+            [str(tflite_path)] * num_workers,
+            shards,
+            [batch_size] * num_workers,
+        )
+        return np.concatenate(list(predictions))
+
+
+def _predict_shard(tflite_path, features, batch_size):
+    runner = TFLiteRunner(tflite_path)
+    predicted_indices = [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(features), batch_size):
+        prediction = runner(features[start : start + batch_size])
+        predicted_indices.append(np.argmax(prediction, axis=1))
+    return np.concatenate(predicted_indices)
+
+
+class TFLiteRunner:
+    """Runs a TFLite model on batches of float inputs, loading the model only once.
+
+    Quantization of the inputs and dequantization of the outputs is handled internally,
+    so the runner can be used as a drop-in replacement for the Keras model.
 
-    output_data = output_scale * (output_data.astype(np.float32) - output_zero_point)
+    Args:
+        tflite_path: Path to TFLite file to run.
+    """
 
-    return output_data
+    def __init__(self, tflite_path):
+        self.interpreter = tf.lite.Interpreter(model_path=str(tflite_path))
+        self.interpreter.allocate_tensors()
+
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.input_index = input_details["index"]
+        self.output_index = output_details["index"]
+        self.input_dtype = input_details["dtype"]
+        self.input_shape = tuple(input_details["shape"][1:])
+        self.batch_size = input_details["shape"][0]
+        self.output_size = output_details["shape"][-1]
+
+        # Check if the input/output type is quantized,
+        # set scale and zero-point accordingly
+        if self.input_dtype == np.int8:
+            self.input_scale, self.input_zero_point = input_details["quantization"]
+        else:
+            self.input_scale, self.input_zero_point = 1, 0
+
+        if output_details["dtype"] == np.int8:
+            self.output_scale, self.output_zero_point = output_details["quantization"]
+        else:
+            self.output_scale, self.output_zero_point = 1, 0
+
+    def __call__(self, input_data):
+        """Runs the forward pass for a batch of inputs.
+
+        Args:
+            input_data: Float input data of shape [batch, ...].
+
+        Returns:
+            Dequantized output of shape [batch, ...].
+        """
+        input_data = np.asarray(input_data, dtype=np.float32)
+        batch_size = input_data.shape[0]
+        if batch_size != self.batch_size:
+            self._resize(batch_size)
+
+        input_data = input_data / self.input_scale + self.input_zero_point
+        if self.input_dtype == np.int8:
+            input_data = np.clip(np.round(input_data), -128, 127)
+
+        self.interpreter.set_tensor(
+            self.input_index,
+            input_data.reshape((batch_size, *self.input_shape)).astype(self.input_dtype),
+        )
+        self.interpreter.invoke()
+
+        output_data = self.interpreter.get_tensor(self.output_index)
+
+        return self.output_scale * (output_data.astype(np.float32) - self.output_zero_point)
+
+    def _resize(self, batch_size):
+        self.interpreter.resize_tensor_input(self.input_index, (batch_size, *self.input_shape))
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch_size
 
 
 def main():
@@ -133,9 +233,17 @@ def main():
         testing_percentage=FLAGS.testing_percentage,
         model_settings=model_settings,
         micro=FLAGS.micro,
+        cache_dir=FLAGS.cache_dir,
     )
 
-    tflite_test(model_settings, audio_processor, FLAGS.tflite_path, FLAGS.out, FLAGS.mode)
+    tflite_test(
+        model_settings,
+        audio_processor,
+        FLAGS.tflite_path,
+        FLAGS.out,
+        FLAGS.mode,
+        num_workers=FLAGS.num_workers,
+    )
 
 
 if __name__ == "__main__":
@@ -154,6 +262,14 @@ if __name__ == "__main__":
         Where to download the speech training data to.
         """,
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="""\
+        Where to persist decoded audio and features between runs. Disabled if not set.
+        """,
+    )
     parser.add_argument(
         "--tflite_path",
         type=str,
@@ -243,6 +359,12 @@ if __name__ == "__main__":
         help="File which should contain the determined accuracy",
     )
     parser.add_argument("--mode", choices=["test", "validate", "train"], default="test")
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of processes running inference, each with its own interpreter.",
+    )
 
     FLAGS, _ = parser.parse_known_args()
     main()
@@ -0,0 +1,38 @@
+import numpy as np
+import tensorflow as tf
+
+from audio_store import PackedAudioStore
+from cache import begin_entry, is_complete, read_index
+
+
+def test_packed_audio_store_roundtrip(tmp_path):
+    rng = np.random.default_rng(0)
+    clips = rng.integers(-32768, 32767, (3, 100), dtype=np.int16)
+    paths = [str(tmp_path / "yes" / f"{idx}_nohash_0.wav") for idx in range(3)]
+    audio = tf.data.Dataset.from_tensor_slices(clips.astype(np.float32)[..., np.newaxis] / 32768)
+
+    store = PackedAudioStore(tmp_path, desired_samples=100)
+    assert not store.contains(paths)
+    store.pack(paths, audio)
+    assert store.contains(paths)
+
+    loaded = list(store.load([paths[2], paths[0], paths[2]], [5, 0, 3], silence_index=0))
+    np.testing.assert_array_equal(loaded[0][0].numpy()[:, 0] * 32768, clips[2])
+    np.testing.assert_array_equal(loaded[1][0].numpy(), 0)
+    assert [label.numpy() for _, label in loaded] == [5, 0, 3]
+
+
+def test_packed_audio_store_replaces_incomplete(tmp_path):
+    clips = np.arange(4 * 10, dtype=np.float32).reshape(4, 10, 1) / 32768
+    paths = [str(tmp_path / f"{idx}.wav") for idx in range(4)]
+    store = PackedAudioStore(tmp_path, desired_samples=10)
+    store.pack(paths[:2], tf.data.Dataset.from_tensor_slices(clips[:2]))
+    assert store.contains(paths[:2]) and not store.contains(paths)
+    # An interrupted pack only leaves its temporary directory behind.
+    assert not is_complete(begin_entry(store.path))
+    assert store.contains(paths[:2])
+
+    store.pack(paths, tf.data.Dataset.from_tensor_slices(clips))
+    assert read_index(store.path)["num_samples"] == 4
+    loaded = np.stack([clip.numpy() for clip, _ in store.load(paths[::-1], [1] * 4, 0)])
+    np.testing.assert_array_equal(loaded, clips[::-1])
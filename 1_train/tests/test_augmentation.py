@@ -0,0 +1,62 @@
+import numpy as np
+import tensorflow as tf
+
+from data import AudioProcessor
+
+MODEL_SETTINGS = {"desired_samples": 200}
+
+
+def _shift(clip, amount):
+    """Pad-and-slice shift of a single clip, as done per sample before."""
+    padded = np.pad(clip, [(max(amount, 0), max(-amount, 0)), (0, 0)])
+    offset = max(-amount, 0)
+    return padded[offset : offset + len(clip)]
+
+
+def test_add_shift_shifts_rows_independently():
+    tf.random.set_seed(0)
+    audio = np.random.default_rng(0).uniform(0.1, 1, (64, 200, 1)).astype(np.float32)
+    shifted, _ = AudioProcessor.add_shift(audio, np.zeros(64), MODEL_SETTINGS, 50)
+    shifted = shifted.numpy()
+
+    amounts = []
+    for clip, result in zip(audio, shifted):
+        matches = [a for a in range(-50, 50) if np.array_equal(_shift(clip, a), result)]
+        assert len(matches) == 1
+        amounts.extend(matches)
+    assert len(set(amounts)) > 10
+
+
+def test_add_shift_disabled():
+    audio = np.ones((4, 200, 1), dtype=np.float32)
+    shifted, _ = AudioProcessor.add_shift(audio, np.zeros(4), MODEL_SETTINGS, 0)
+    np.testing.assert_array_equal(shifted, audio)
+
+
+def test_add_background_draws_noise_per_row():
+    tf.random.set_seed(0)
+    rng = np.random.default_rng(1)
+    noise = [rng.uniform(-1, 1, length).astype(np.float32) for length in [300, 500, 1000]]
+    background_data = tf.ragged.stack([tf.constant(clip) for clip in noise])
+    audio = np.zeros((64, 200, 1), dtype=np.float32)
+
+    mixed, _ = AudioProcessor.add_background(
+        audio, np.zeros(64), MODEL_SETTINGS, 0.5, 0.2, True, background_data
+    )
+    mixed = mixed.numpy()[..., 0]
+
+    segments = set()
+    for row in mixed:
+        if not row.any():
+            continue
+        found = [
+            (idx, offset, row[0] / clip[offset])
+            for idx, clip in enumerate(noise)
+            for offset in range(len(clip) - 200)
+            if np.allclose(row, clip[offset : offset + 200] * (row[0] / clip[offset]), atol=1e-6)
+        ]
+        assert len(found) == 1
+        idx, offset, volume = found[0]
+        assert 0 < volume < 0.2
+        segments.add((idx, offset))
+    assert 10 < len(segments) < 64
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+import cache
+from cache import DatasetCache, begin_entry, cache_key
+
+WORDS = ["_silence_", "_unknown_", "yes", "no"]
+MODEL_SETTINGS = {"desired_samples": 100, "fingerprint_size": 12}
+FILES = [(f"yes/{idx}_nohash_0.wav", 2) for idx in range(11)]
+
+
+@pytest.fixture
+def small_shards(monkeypatch):
+    # 11 clips are split into the shards 4, 4 and 3 and read in chunks of 3.
+    monkeypatch.setattr(cache, "SHARD_SIZE", 4)
+    monkeypatch.setattr(cache, "READ_CHUNK_SIZE", 3)
+
+
+def _cache(tmp_path, split="training", files=FILES):
+    return DatasetCache(tmp_path, split, WORDS, MODEL_SETTINGS, True, files)
+
+
+def test_audio_round_trip(tmp_path, small_shards):
+    rng = np.random.default_rng(0)
+    pcm = rng.integers(-32768, 32767, (len(FILES), 100), dtype=np.int16)
+    labels = rng.integers(0, len(WORDS), len(FILES), dtype=np.int32)
+    audio = pcm.astype(np.float32)[..., np.newaxis] / 32768
+
+    entry = _cache(tmp_path)
+    assert not entry.has_audio()
+    entry.write_audio(tf.data.Dataset.from_tensor_slices((audio, labels)))
+    assert entry.has_audio() and not entry.has_features()
+    assert len(list((entry.path / DatasetCache.AUDIO).glob("data_*.npy"))) == 3
+
+    loaded = list(entry.load_audio())
+    np.testing.assert_array_equal(np.stack([clip for clip, _ in loaded]), audio)
+    np.testing.assert_array_equal([label for _, label in loaded], labels)
+
+
+def test_features_round_trip(tmp_path, small_shards):
+    rng = np.random.default_rng(1)
+    features = rng.normal(size=(len(FILES), 12)).astype(np.float32)
+    labels = np.arange(len(FILES), dtype=np.int32)
+
+    entry = _cache(tmp_path)
+    entry.write_features(tf.data.Dataset.from_tensor_slices((features, labels)))
+    assert entry.has_features() and not entry.has_audio()
+
+    loaded = list(entry.load_features())
+    np.testing.assert_array_equal(np.stack([value for value, _ in loaded]), features)
+    np.testing.assert_array_equal([label for _, label in loaded], labels)
+
+
+def test_cache_key_changes_with_inputs():
+    key = cache_key("training", WORDS, MODEL_SETTINGS, True, FILES)
+    assert key == cache_key("training", list(WORDS), dict(MODEL_SETTINGS), True, list(FILES))
+    assert key != cache_key("validation", WORDS, MODEL_SETTINGS, True, FILES)
+    assert key != cache_key("training", WORDS + ["up"], MODEL_SETTINGS, True, FILES)
+    assert key != cache_key(
+        "training", WORDS, {**MODEL_SETTINGS, "desired_samples": 200}, True, FILES
+    )
+    assert key != cache_key("training", WORDS, MODEL_SETTINGS, True, FILES[:-1])
+    assert key != cache_key("training", WORDS, MODEL_SETTINGS, True, [(FILES[0][0], 3)])
+
+
+def test_interrupted_write_is_incomplete(tmp_path, small_shards):
+    entry = _cache(tmp_path)
+    # A write stopped before the index leaves its shards in the temporary directory only.
+    for kind in [DatasetCache.AUDIO, DatasetCache.FEATURES]:
+        tmp = begin_entry(entry.path / kind)
+        np.save(tmp / "data_00000.npy", np.zeros((4, 100), dtype=np.int16))
+    assert not entry.has_audio()
+    assert not entry.has_features()
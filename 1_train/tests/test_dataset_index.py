@@ -0,0 +1,32 @@
+import os
+
+import tensorflow as tf
+
+from dataset_index import DatasetIndex
+
+
+def _touch(path):
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"")
+
+
+def test_dataset_index_only_hashes_new_files(tmp_path):
+    for word in ["yes", "no"]:
+        for speaker in range(3):
+            _touch(tmp_path / word / f"spk{speaker}_nohash_0.wav")
+    hashed = []
+
+    def _percentage(path):
+        hashed.append(os.path.basename(path))
+        return float(len(hashed))
+
+    paths, words, percentages = DatasetIndex(tmp_path, _percentage).scan()
+    assert paths == tf.io.gfile.glob(str(tmp_path / "*" / "*.wav"))
+    assert words == [os.path.basename(os.path.dirname(path)) for path in paths]
+    assert len(hashed) == 6
+
+    _touch(tmp_path / "yes" / "new_nohash_0.wav")
+    new_paths, _, new_percentages = DatasetIndex(tmp_path, _percentage).scan()
+    assert hashed[6:] == ["new_nohash_0.wav"]
+    assert new_paths == tf.io.gfile.glob(str(tmp_path / "*" / "*.wav"))
+    assert dict(zip(paths, percentages)).items() <= dict(zip(new_paths, new_percentages)).items()
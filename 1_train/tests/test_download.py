@@ -0,0 +1,101 @@
+import hashlib
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from download import COMPLETE_MARKER, INCOMPLETE_MARKER, download_and_extract, fetch, is_extracted
+
+
+def _make_tarball(tmp_path):
+    source = tmp_path / "source"
+    (source / "yes").mkdir(parents=True)
+    (source / "yes" / "a_nohash_0.wav").write_bytes(b"a" * 100)
+    (source / "yes" / "b_nohash_0.wav").write_bytes(b"b" * 100)
+    tarball = tmp_path / "data.tar.gz"
+    with tarfile.open(tarball, "w:gz") as archive:
+        archive.add(source, arcname=".")
+    return tarball
+
+
+def test_download_and_extract_local_tarball(tmp_path):
+    tarball = _make_tarball(tmp_path)
+    sha256 = hashlib.sha256(tarball.read_bytes()).hexdigest()
+    target = tmp_path / "target"
+
+    download_and_extract(f"{tarball}#sha256={sha256}", target)
+    assert (target / "yes" / "b_nohash_0.wav").read_bytes() == b"b" * 100
+    assert (target / COMPLETE_MARKER).exists()
+    assert not (target / INCOMPLETE_MARKER).exists()
+
+
+def test_download_and_extract_redoes_interrupted_run(tmp_path):
+    tarball = _make_tarball(tmp_path)
+    target = tmp_path / "target"
+    (target / "yes").mkdir(parents=True)
+    (target / "yes" / "a_nohash_0.wav").write_bytes(b"truncated")
+    (target / INCOMPLETE_MARKER).touch()
+    assert not is_extracted(target)
+
+    download_and_extract(tarball.as_uri(), target)
+    assert (target / "yes" / "a_nohash_0.wav").read_bytes() == b"a" * 100
+    assert is_extracted(target)
+
+
+def test_download_and_extract_checksum_mismatch(tmp_path):
+    tarball = _make_tarball(tmp_path)
+    with pytest.raises(Exception, match="Checksum mismatch"):
+        download_and_extract(f"{tarball}#sha256=0123", tmp_path / "target")
+    assert not is_extracted(tmp_path / "target")
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        start = 0
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (server.ignore_if_range or if_range in (None, server.etag)):
+            start = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(server.content) - 1}/{len(server.content)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(server.content) - start))
+        self.end_headers()
+        # Simulates a connection dropped after truncate bytes.
+        self.wfile.write(server.content[start:][: server.truncate])
+        server.truncate = None
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.parametrize("ignore_if_range", [False, True])
+def test_fetch_resumes_only_unchanged_files(tmp_path, ignore_if_range):
+    server = HTTPServer(("127.0.0.1", 0), _RangeHandler)
+    server.content, server.etag, server.truncate = b"a" * 5000, '"1"', 1000
+    server.ignore_if_range = ignore_if_range
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/data.tar.gz"
+    try:
+        with pytest.raises(Exception):
+            fetch(url, tmp_path)
+        assert (tmp_path / "data.tar.gz.part").stat().st_size == 1000
+
+        # The remote file changed, so the partial download must not be continued.
+        server.content, server.etag = b"b" * 4000, '"2"'
+        assert fetch(url, tmp_path).read_bytes() == b"b" * 4000
+        assert not (tmp_path / "data.tar.gz.part.json").exists()
+
+        (tmp_path / "data.tar.gz").unlink()
+        server.truncate = 1000
+        with pytest.raises(Exception):
+            fetch(url, tmp_path)
+        assert fetch(url, tmp_path).read_bytes() == b"b" * 4000
+    finally:
+        server.shutdown()
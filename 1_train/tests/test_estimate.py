@@ -4,8 +4,16 @@ from student.estimate import (
     estimate_conv2d_macs,
     estimate_depthwise_conv2d_macs,
     estimate_fully_connected_macs,
+    estimate_lstm_macs,
+    estimate_pool2d_macs,
+    estimate_elementwise_macs,
+    estimate_reduce_macs,
+    estimate_softmax_macs,
     estimate_rom,
     estimate_ram,
+    plan_arena,
+    plan_memory,
+    tensor_lifetimes,
 )
 
 MyTensor = collections.namedtuple("MyTensor", ("idx", "name", "shape", "dtype", "is_const"))
@@ -75,6 +83,20 @@ def test_estimate_macs():
     )
 
 
+def test_estimate_other_macs():
+    # 4 gates on input and recurrent input plus the cell update, for every time step.
+    assert estimate_lstm_macs([1, 49, 40], 64, 64) == 49 * (4 * 64 * (40 + 64) + 3 * 64)
+    assert estimate_lstm_macs([49, 1, 40], 64, 64, time_major=True) == 1313984
+    assert estimate_lstm_macs([1, 1, 8], 4, 2, use_peephole=True, use_projection=True) == (
+        4 * 4 * (8 + 2) + 3 * 4 + 3 * 4 + 4 * 2
+    )
+
+    assert estimate_pool2d_macs(INTERMEDIATE_2.shape, 2, 2) == 16384
+    assert estimate_elementwise_macs(INTERMEDIATE_2.shape) == 4096
+    assert estimate_reduce_macs(INTERMEDIATE_1.shape) == 32768
+    assert estimate_softmax_macs(OUTPUT.shape) == 30
+
+
 def test_estimate_rom():
     # Trivial cases
     assert estimate_rom([MyTensor(0, "foo", [1, 1, 1, 1], "int8", False)]) == 0
@@ -105,3 +127,65 @@ def test_estimate_ram():
 
     # Multi layer
     assert estimate_ram(ALL_TENSORS, ALL_LAYERS) == 36864
+
+
+def test_tensor_lifetimes():
+    assert tensor_lifetimes(ALL_TENSORS, ALL_LAYERS) == {
+        INPUT.idx: (0, 0),
+        INTERMEDIATE_1.idx: (0, 1),
+        INTERMEDIATE_2.idx: (1, 2),
+        INTERMEDIATE_2_.idx: (2, 3),
+        OUTPUT.idx: (3, 3),
+    }
+
+
+def test_plan_arena():
+    arena_bytes, offsets = plan_arena(ALL_TENSORS, ALL_LAYERS)
+    assert arena_bytes == 36864
+    assert offsets[INTERMEDIATE_1.idx] == 0
+    # Tensors alive at the same time must not overlap.
+    assert offsets[INPUT.idx] >= 32768
+    assert offsets[INTERMEDIATE_2.idx] >= 32768
+    assert offsets[INTERMEDIATE_2_.idx] + 4096 <= offsets[INTERMEDIATE_2.idx]
+
+
+def test_plan_memory_branches():
+    # x0 -> a -> x1 -> b -> x2, add(x0, x2) -> x3 -> reshape -> x4: the model input x0 is kept
+    # alive by the residual connection until the ADD layer.
+    x0 = MyTensor(0, "x0", [1, 100], "int8", False)
+    x1 = MyTensor(1, "x1", [1, 300], "int8", False)
+    x2 = MyTensor(2, "x2", [1, 100], "int8", False)
+    x3 = MyTensor(3, "x3", [1, 100], "int8", False)
+    shape = MyTensor(4, "s", [2], "int32", True)
+    x4 = MyTensor(5, "x4", [1, 100], "int8", False)
+    tensors = [x0, x1, x2, x3, shape, x4]
+    layers = [
+        MyLayer(0, "FULLY_CONNECTED", [0], [1]),
+        MyLayer(1, "FULLY_CONNECTED", [1], [2]),
+        MyLayer(2, "ADD", [0, 2], [3]),
+        MyLayer(3, "RESHAPE", [3, 4], [5]),
+    ]
+
+    plan = plan_memory(tensors, layers, inputs=[0], outputs=[5])
+    assert plan.peak_bytes == 500
+    assert plan.peak_layer == 1
+    assert plan.live_tensors == [0, 1, 2]
+    assert estimate_ram(tensors, layers, [0], [5]) == 500
+
+    # Inputs are alive from the start even if consumed late, outputs until the end.
+    late_input = [MyLayer(0, "FULLY_CONNECTED", [1], [2]), MyLayer(1, "ADD", [0, 2], [3])]
+    assert tensor_lifetimes(tensors, late_input, inputs=[0], outputs=[2]) == {
+        0: (0, 1),
+        1: (0, 0),
+        2: (0, 1),
+        3: (1, 1),
+    }
+
+    # An in-place RESHAPE shares the buffer of its input.
+    lifetimes = tensor_lifetimes(tensors, layers, [0], [5], inplace_ops=["RESHAPE"])
+    assert 5 not in lifetimes and lifetimes[3] == (2, 3)
+    assert plan_memory(tensors, layers[3:], [3], [5]).peak_bytes == 200
+    assert plan_memory(tensors, layers[3:], [3], [5], ["RESHAPE"]).peak_bytes == 100
+    arena_bytes, offsets = plan_arena(tensors, layers, [0], [5], ["RESHAPE"])
+    assert offsets[5] == offsets[3]
+    assert arena_bytes == 500
@@ -0,0 +1,45 @@
+import collections
+
+from execution_order import OrderSearch, optimize_order
+from student.estimate import estimate_ram
+
+MyTensor = collections.namedtuple("MyTensor", ("idx", "name", "shape", "dtype", "is_const"))
+MyLayer = collections.namedtuple("MyLayer", ("idx", "name", "inputs", "outputs"))
+
+# x0 -> a -> a2 and x0 -> b -> b2 joined by a concatenation. The converter order runs both
+# wide layers first, so a and b are alive at the same time.
+TENSORS = [
+    MyTensor(0, "x0", [1, 100], "int8", False),
+    MyTensor(1, "a", [1, 400], "int8", False),
+    MyTensor(2, "b", [1, 400], "int8", False),
+    MyTensor(3, "a2", [1, 10], "int8", False),
+    MyTensor(4, "b2", [1, 10], "int8", False),
+    MyTensor(5, "y", [1, 20], "int8", False),
+]
+LAYERS = [
+    MyLayer(0, "FULLY_CONNECTED", [0], [1]),
+    MyLayer(1, "FULLY_CONNECTED", [0], [2]),
+    MyLayer(2, "FULLY_CONNECTED", [1], [3]),
+    MyLayer(3, "FULLY_CONNECTED", [2], [4]),
+    MyLayer(4, "CONCATENATION", [3, 4], [5]),
+]
+
+
+def test_converter_order_matches_estimate_ram():
+    search = OrderSearch(TENSORS, LAYERS, [0], [5])
+    assert search.peak(range(len(LAYERS))) == estimate_ram(TENSORS, LAYERS, [0], [5]) == 900
+
+
+def test_optimize_order():
+    layers, peak, exact = optimize_order(TENSORS, LAYERS, [0], [5])
+    assert exact
+    assert peak == 510
+    assert [layer.idx for layer in layers] in ([0, 2, 1, 3, 4], [1, 3, 0, 2, 4])
+    assert estimate_ram(TENSORS, layers, [0], [5]) == 510
+
+
+def test_truncated_search_is_never_worse():
+    layers, peak, exact = optimize_order(TENSORS, LAYERS, [0], [5], max_states=1)
+    assert not exact
+    assert peak <= 900
+    assert estimate_ram(TENSORS, layers, [0], [5]) == peak
@@ -0,0 +1,38 @@
+import tensorflow as tf
+
+import models
+from feasibility import check_feasibility, estimate_keras
+
+MODEL_SETTINGS = models.prepare_model_settings(12, 16000, 1000, 30, 20, 40)
+
+
+def test_matches_tflite_estimate():
+    # ROM/RAM/MACs reported by estimate.py for the int8 TFLite model of micro_kws_xs.
+    model = models.get_model(MODEL_SETTINGS, "micro_kws_xs")
+    assert estimate_keras(model) == (24168, 4000, 64036)
+
+
+def test_lstm_matches_tflite_estimate():
+    # The converted model has 304 bytes less ROM: the converter drops the all-zero biases of
+    # the dense layers of an untrained model.
+    model = models.get_model(MODEL_SETTINGS, "lstm")
+    assert estimate_keras(model) == (43616, 5384, 1923652)
+
+
+def test_rejects_over_budget():
+    model = models.get_model(MODEL_SETTINGS, "micro_kws_xs")
+    assert check_feasibility(model, max_rom=30000, max_ram=4000, max_macs=64036)[0]
+
+    feasible, estimates, violations = check_feasibility(model, max_ram=3999, max_macs=1000)
+    assert not feasible
+    assert estimates == (24168, 4000, 64036)
+    assert violations == ["RAM 4000 > 3999", "MACs 64036 > 1000"]
+
+
+def test_rejects_unsupported_layers():
+    inputs = tf.keras.Input(shape=(49, 40))
+    outputs = tf.keras.layers.GRU(8)(inputs)
+    feasible, estimates, violations = check_feasibility(tf.keras.Model(inputs, outputs))
+    assert not feasible
+    assert estimates is None
+    assert violations == ["Unsupported layer type: GRU"]
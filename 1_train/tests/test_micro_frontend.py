@@ -0,0 +1,62 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.lite.experimental.microfrontend.python.ops import (
+    audio_microfrontend_op as frontend_op,
+)
+
+from data import AudioProcessor
+from micro_frontend import MicroFrontend
+
+RNG = np.random.default_rng(0)
+AUDIO = np.stack(
+    [
+        (RNG.normal(0, 3000, 16000)).clip(-32768, 32767).astype(np.int16),
+        (8000 * np.sin(np.arange(16000) * 2 * np.pi * 440 / 16000)).astype(np.int16),
+        np.zeros(16000, dtype=np.int16),
+        np.where(np.arange(16000) % 40 < 20, 32767, -32768).astype(np.int16),
+    ]
+)
+
+
+def reference(audio, **kwargs):
+    return frontend_op.audio_microfrontend(
+        tf.constant(audio),
+        sample_rate=16000,
+        window_size=30,
+        window_step=20,
+        num_channels=40,
+        out_scale=1,
+        out_type=tf.uint16,
+        **kwargs,
+    ).numpy()
+
+
+def test_micro_frontend_matches_op():
+    features, _ = MicroFrontend(window_size=30, window_step=20, num_channels=40)(AUDIO)
+    assert features.shape == (4, 49, 40)
+    for audio, result in zip(AUDIO, features):
+        np.testing.assert_array_equal(result, reference(audio))
+
+
+def test_micro_frontend_without_pcan():
+    frontend = MicroFrontend(window_size=30, window_step=20, num_channels=40, enable_pcan=False)
+    features, _ = frontend(AUDIO)
+    for audio, result in zip(AUDIO, features):
+        np.testing.assert_array_equal(result, reference(audio, enable_pcan=False))
+
+
+def test_batched_features_match_per_sample():
+    model_settings = {
+        "window_size_samples": 480,
+        "window_stride_samples": 320,
+        "dct_coefficient_count": 40,
+    }
+    # Clips of half a second, the length is taken from the input.
+    audio = AUDIO[:, :8000, np.newaxis].astype(np.float32) / 32768
+    labels = np.arange(len(audio))
+
+    features, _ = AudioProcessor.create_features_batch(audio, labels, model_settings)
+    assert features.shape == (4, 24 * 40)
+    for clip, label, result in zip(audio, labels, features):
+        expected, _ = AudioProcessor.create_features(clip, label, model_settings, micro=True)
+        np.testing.assert_array_equal(result, expected)
@@ -0,0 +1,89 @@
+import csv
+import json
+
+import numpy as np
+import tensorflow as tf
+
+from estimate import (
+    ModelArrays,
+    estimate,
+    estimate_batch,
+    estimate_model_macs,
+    estimate_model_ram,
+    estimate_model_rom,
+    load_model,
+    write_rows,
+)
+
+
+def _save_lstm_model(path):
+    inputs = tf.keras.Input(shape=(3, 8), batch_size=1, name="input")
+    x = tf.keras.layers.LSTM(units=4)(inputs)
+    output = tf.keras.layers.Dense(units=2, activation="softmax")(x)
+    model = tf.keras.Model(inputs, output)
+
+    def _rep_dataset():
+        for x in np.random.default_rng(0).uniform(-1, 1, (10, 1, 3, 8)).astype(np.float32):
+            yield [x]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = _rep_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    path.write_bytes(converter.convert())
+    return path
+
+
+def test_model_arrays_match_interpreter(tmp_path):
+    path = _save_lstm_model(tmp_path / "lstm.tflite")
+    arrays = ModelArrays(load_model(path))
+    interpreter = tf.lite.Interpreter(model_path=str(path))
+
+    tensors = arrays.get_tensors()
+    for details in interpreter.get_tensor_details():
+        assert tensors[details["index"]].shape == details["shape"].tolist()
+
+    layers = arrays.get_layers()
+    assert [layer.name for layer in layers] == [
+        "UNIDIRECTIONAL_SEQUENCE_LSTM",
+        "STRIDED_SLICE",
+        "FULLY_CONNECTED",
+        "SOFTMAX",
+    ]
+    # Omitted optional inputs are dropped, the LSTM states persist between invocations.
+    assert all(idx >= 0 for layer in layers for idx in layer.inputs)
+    inputs, outputs = arrays.get_io()
+    assert len(arrays.variables) == 2
+    assert set(arrays.variables) <= set(inputs) & set(outputs)
+
+    # The options needed for the MACs are read in the same pass.
+    assert arrays.ops["has_options"].tolist() == [True, False, False, False]
+    assert estimate_model_macs(arrays) == 3 * (4 * 4 * (8 + 4) + 3 * 4) + 4 * 2 + 3 * 2
+    # The estimators give the same results on a shared and on separate parses.
+    assert estimate(path) == (
+        estimate_model_rom(load_model(path)),
+        estimate_model_ram(load_model(path)),
+        estimate_model_macs(load_model(path)),
+    )
+
+
+def test_estimate_batch(tmp_path):
+    path = _save_lstm_model(tmp_path / "lstm.tflite")
+    broken = tmp_path / "broken.tflite"
+    broken.write_bytes(b"junk")
+
+    rows = estimate_batch([path, broken], num_workers=2)
+    rom, ram, macs = estimate(path)
+    assert rows[0] == {"model": str(path), "rom": rom, "ram": ram, "macs": macs}
+    assert rows[1].keys() == {"model", "error"}
+    assert rows[1]["error"].startswith("Unreadable model: error(")
+
+    write_rows(rows, str(tmp_path / "out.json"))
+    assert json.loads((tmp_path / "out.json").read_text()) == rows
+    write_rows(rows, str(tmp_path / "out.csv"))
+    with open(tmp_path / "out.csv", newline="") as handle:
+        table = list(csv.DictReader(handle))
+    assert list(table[0].keys()) == ["model", "rom", "ram", "macs", "error"]
+    assert table[0]["macs"] == str(macs) and table[1]["error"] == rows[1]["error"]
@@ -0,0 +1,36 @@
+import numpy as np
+
+from posterior import PosteriorHandler, score_detections, sweep_detections
+
+
+def test_sweep_matches_handler():
+    rng = np.random.default_rng(0)
+    posteriors = rng.integers(0, 256, (400, 4)).astype(np.uint8)
+    posteriors[rng.integers(0, 400, 60), 2] = 255
+    times_ms = np.cumsum(rng.integers(50, 150, 400))
+
+    combinations, detections = sweep_detections(
+        posteriors, times_ms, [1, 3, 7], [120, 140, 200], [0, 300, 1000]
+    )
+    for (history_length, threshold, suppression_ms), (steps, classes) in zip(
+        combinations, detections
+    ):
+        handler = PosteriorHandler(history_length, threshold, suppression_ms, 4)
+        expected = [
+            (step, top)
+            for step, (posterior, time_ms) in enumerate(zip(posteriors, times_ms))
+            for top, trigger in [handler.handle(posterior, time_ms)]
+            if trigger
+        ]
+        assert list(zip(steps, classes)) == expected
+
+
+def test_score_detections():
+    false_accepts, misses = score_detections(
+        detection_times_ms=np.array([500, 1200, 5000, 9000, 9100]),
+        detection_classes=np.array([2, 2, 3, 0, 2]),
+        reference_times_ms=np.array([1000, 4000, 8000]),
+        reference_classes=np.array([2, 3, 3]),
+        tolerance_ms=1500,
+    )
+    assert (false_accepts, misses) == (2, 1)
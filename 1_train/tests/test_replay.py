@@ -0,0 +1,46 @@
+import json
+import struct
+
+import numpy as np
+
+from posterior import quantize_posteriors
+from replay import PACKET_LOG_MAGIC, load_posteriors
+
+
+def test_load_csv_posteriors(tmp_path):
+    path = tmp_path / "posteriors.csv"
+    path.write_text("time,silence,yes\n0.1,0.9,0.1\n0.2,0.2,0.8\n")
+    labels, times_ms, posteriors = load_posteriors(path, "float")
+    assert labels == ["silence", "yes"]
+    np.testing.assert_array_equal(times_ms, [100, 200])
+    np.testing.assert_array_equal(
+        posteriors, quantize_posteriors(np.array([[0.9, 0.1], [0.2, 0.8]]))
+    )
+
+    # A quiet stream of device values must not be taken for probabilities.
+    path.write_text("time,silence,yes\n0.1,1,0\n0.2,0,1\n")
+    _, _, posteriors = load_posteriors(path, "uint8")
+    np.testing.assert_array_equal(posteriors, [[1, 0], [0, 1]])
+
+
+def test_load_packet_log(tmp_path):
+    path = tmp_path / "soak.log"
+    metadata = {
+        "feature_height": 2,
+        "feature_width": 3,
+        "standard_labels": ["silence", "unknown"],
+        "category_labels": ["yes"],
+        "payload_size": 6 + 3 + 1,
+    }
+    # Written like 4_debug/packet_log.PacketLogWriter, the last record is cut off.
+    header = json.dumps(metadata).encode()
+    data = PACKET_LOG_MAGIC + struct.pack("<I", len(header)) + header
+    for idx in range(5):
+        data += struct.pack("<d", 1000.0 + idx * 0.1) + bytes(6) + bytes([idx, 10, 20, 0])
+    path.write_bytes(data + struct.pack("<d", 2000.0))
+
+    labels, times_ms, posteriors = load_posteriors(path)
+    assert labels == ["silence", "unknown", "yes"]
+    np.testing.assert_array_equal(times_ms, [0, 100, 200, 300, 400])
+    np.testing.assert_array_equal(posteriors[:, 0], np.arange(5))
+    assert posteriors.dtype == np.uint8 and posteriors.shape == (5, 3)
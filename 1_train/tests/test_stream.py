@@ -0,0 +1,25 @@
+import numpy as np
+
+from micro_frontend import MicroFrontend
+from stream import SliceRingBuffer, StreamingFrontend
+
+AUDIO = np.random.default_rng(0).normal(0, 2000, 16000).astype(np.int16)
+
+
+def test_streaming_frontend_matches_whole_clip():
+    frontend = MicroFrontend(window_size=30, window_step=20, num_channels=40)
+    expected, _ = frontend(AUDIO[np.newaxis])
+
+    streaming = StreamingFrontend(frontend)
+    chunks = np.split(AUDIO, [100, 150, 1000, 1003, 7000])
+    features = np.concatenate([streaming.process(chunk) for chunk in chunks])
+
+    np.testing.assert_array_equal(features, expected[0])
+
+
+def test_slice_ring_buffer_window():
+    ring = SliceRingBuffer(num_slices=3, num_channels=2)
+    for idx in range(7):
+        ring.push([idx, idx])
+
+    np.testing.assert_array_equal(ring.window(), [[4, 4], [5, 5], [6, 6]])
@@ -0,0 +1,47 @@
+from sweep import core_groups, expand_grid, run_steps, sample_random, to_args
+
+
+def test_expand_grid():
+    space = {"model_architecture": ["micro_kws_xs", "lstm"], "batch_size": [50, 100, 200]}
+    configs = expand_grid(space)
+    assert len(configs) == 6
+    assert configs[0] == {"model_architecture": "micro_kws_xs", "batch_size": 50}
+    assert len({tuple(config.items()) for config in configs}) == 6
+
+
+def test_sample_random():
+    space = {"batch_size": [50, 100, 200], "learning_rate": ["0.01", "0.001", "0.0001"]}
+    configs = sample_random(space, 4, seed=1)
+    assert len(configs) == 4
+    assert len({tuple(config.items()) for config in configs}) == 4
+    assert configs == sample_random(space, 4, seed=1)
+    assert len(sample_random(space, 20)) == 9
+
+
+def test_to_args():
+    params = {"batch_size": 100, "jit": True, "mixed_precision": False}
+    assert to_args(params) == ["--batch_size", "100", "--jit"]
+
+
+def test_core_groups():
+    groups = core_groups(None, 2)
+    assert len(groups) == 2
+    if groups[0] is not None:
+        assert all(len(group) >= 1 for group in groups)
+
+
+def test_run_steps_rejects_over_budget(tmp_path):
+    result = run_steps(
+        tmp_path / "over_budget",
+        {"model_architecture": "micro_kws_xs"},
+        [],
+        None,
+        ["--max_ram", "1"],
+    )
+    assert result["status"] == "rejected"
+
+    # Errors of the check are no rejections.
+    result = run_steps(
+        tmp_path / "error", {"model_architecture": "unknown"}, [], None, ["--max_ram", "1"]
+    )
+    assert result["status"] == "failed (feasibility.py)"
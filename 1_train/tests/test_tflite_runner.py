@@ -0,0 +1,70 @@
+import numpy as np
+import tensorflow as tf
+
+from test_tflite import TFLiteRunner, tflite_predict_sharded
+
+
+def _save_model(path, quantize):
+    inputs = tf.keras.Input(shape=(8,), name="input")
+    output = tf.keras.layers.Dense(units=3, activation="softmax")(inputs)
+    model = tf.keras.Model(inputs, output)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize:
+
+        def _rep_dataset():
+            for x in np.random.default_rng(0).uniform(-1, 1, (20, 1, 8)).astype(np.float32):
+                yield [x]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = _rep_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    path.write_bytes(converter.convert())
+    return path
+
+
+def _reference_inference(input_data, tflite_path):
+    # The single example inference test_tflite.py used before TFLiteRunner, kept independent
+    # of it on purpose.
+    interpreter = tf.lite.Interpreter(model_path=str(tflite_path))
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+
+    if input_details["dtype"] == np.int8:
+        input_scale, input_zero_point = input_details["quantization"]
+    else:
+        input_scale, input_zero_point = 1, 0
+    input_data = input_data / input_scale + input_zero_point
+    input_data = np.round(input_data) if input_details["dtype"] == np.int8 else input_data
+
+    if output_details["dtype"] == np.int8:
+        output_scale, output_zero_point = output_details["quantization"]
+    else:
+        output_scale, output_zero_point = 1, 0
+
+    interpreter.set_tensor(input_details["index"], tf.cast(input_data, input_details["dtype"]))
+    interpreter.invoke()
+    output_data = interpreter.get_tensor(output_details["index"])
+    return output_scale * (output_data.astype(np.float32) - output_zero_point)
+
+
+def test_tflite_runner_matches_single_inference(tmp_path):
+    inputs = np.random.default_rng(1).uniform(-1, 1, (10, 8)).astype(np.float32)
+    for quantize in [False, True]:
+        path = _save_model(tmp_path / f"model_{quantize}.tflite", quantize)
+        runner = TFLiteRunner(path)
+        expected = np.concatenate([_reference_inference(x[None], path) for x in inputs])
+
+        np.testing.assert_array_equal(runner(inputs), expected)
+        np.testing.assert_array_equal(runner(inputs[:3]), expected[:3])
+
+
+def test_tflite_predict_sharded_matches_serial(tmp_path):
+    inputs = np.random.default_rng(2).uniform(-1, 1, (25, 8)).astype(np.float32)
+    path = _save_model(tmp_path / "model.tflite", quantize=True)
+    expected = np.argmax(TFLiteRunner(path)(inputs), axis=1)
+
+    np.testing.assert_array_equal(tflite_predict_sharded(path, inputs, 3, batch_size=4), expected)
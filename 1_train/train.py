@@ -15,8 +15,13 @@
 """Functions for training simple keyword spotting models."""
 
 import os
+import sys
 import glob
+import json
+import time
+import socket
 import shutil
+import subprocess
 import argparse
 import tempfile
 from pathlib import Path
@@ -26,6 +31,7 @@ import numpy as np
 
 import data
 import models
+from download import download_and_extract
 from student.callbacks import get_student_callbacks
 
 
@@ -44,26 +50,12 @@ def train(model, audio_processor):
         boundaries=lr_boundary_list, values=learning_rates_list
     )
 
-    # Specify the optimizer configurations.
-    optimizer = tf.keras.optimizers.Adam(learning_rate=lr_schedule)
-
-    # Compile the model.
-    model.compile(
-        optimizer=optimizer,
-        loss=tf.keras.losses.SparseCategoricalCrossentropy(),
-        metrics=["accuracy"],
-    )
+    compile_model(model, lr_schedule)
 
     # Prepare/split the dataset.
-    train_data = audio_processor.get_data(
-        audio_processor.Modes.TRAINING,
-        FLAGS.background_frequency,
-        FLAGS.background_volume,
-        int((FLAGS.time_shift_ms * FLAGS.sample_rate) / 1000),
-    )
-    train_data = train_data.repeat().batch(FLAGS.batch_size).prefetch(tf.data.AUTOTUNE)
+    train_data = get_train_data(audio_processor)
     val_data = audio_processor.get_data(audio_processor.Modes.VALIDATION)
-    val_data = val_data.batch(FLAGS.batch_size).prefetch(tf.data.AUTOTUNE)
+    val_data = shard_by_data(val_data.batch(FLAGS.batch_size).prefetch(tf.data.AUTOTUNE))
 
     # We train for a max number of iterations so need to calculate how many 'epochs' this will be.
     training_steps_max = np.sum(training_steps_list)
@@ -87,16 +79,21 @@ def train(model, audio_processor):
         epochs=training_epoch_max,
         validation_data=val_data,
         callbacks=[model_checkpoint_callback, *get_student_callbacks()],
+        verbose=1 if is_chief(model.distribute_strategy) else 0,
     )
 
     # Test and save the model.
     test_data = audio_processor.get_data(audio_processor.Modes.TESTING)
-    test_data = test_data.batch(FLAGS.batch_size)
+    test_data = shard_by_data(test_data.batch(FLAGS.batch_size))
 
     # Evaluate the model performace.
     test_loss, test_acc = model.evaluate(x=test_data)
     print(f"Final test accuracy: {test_acc*100:.2f}%")
 
+    # Only the chief writes to train_dir, the other workers checkpoint to temporary directories.
+    if not is_chief(model.distribute_strategy):
+        return
+
     # Extract best checkpoint
     latest = tf.train.latest_checkpoint(Path(FLAGS.train_dir) / FLAGS.model_name / "best")
     latest_name = Path(latest).name
@@ -107,6 +104,154 @@ def train(model, audio_processor):
         shutil.copy(src, dest)
 
 
+def compile_model(model, learning_rate):
+    """Compiles the model with Adam, optionally XLA compiling the train step."""
+    # Specify the optimizer configurations.
+    optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+
+    # Compile the model.
+    model.compile(
+        optimizer=optimizer,
+        loss=tf.keras.losses.SparseCategoricalCrossentropy(),
+        metrics=["accuracy"],
+        jit_compile=FLAGS.jit,
+    )
+
+
+def get_train_data(audio_processor):
+    """Returns the augmented, endlessly repeated training set in batches."""
+    train_data = audio_processor.get_data(
+        audio_processor.Modes.TRAINING,
+        FLAGS.background_frequency,
+        FLAGS.background_volume,
+        int((FLAGS.time_shift_ms * FLAGS.sample_rate) / 1000),
+    )
+    return shard_by_data(train_data.repeat().batch(FLAGS.batch_size).prefetch(tf.data.AUTOTUNE))
+
+
+def shard_by_data(dataset):
+    """Lets every worker keep its share of the batches when training on several workers.
+
+    The AudioProcessor datasets are not read from files, so they are sharded by element. Their
+    order is deterministic, thus the workers see disjoint parts of the data. Without a
+    multi-worker strategy this has no effect.
+    """
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+    return dataset.with_options(options)
+
+
+def get_strategy(name, num_replicas):
+    """Returns the distribution strategy to train with.
+
+    Args:
+        name: "default" for a single replica, "mirrored" for num_replicas replicas on the CPU
+            of this process or "multi_worker" for one replica per worker described in TF_CONFIG.
+        num_replicas: Number of replicas of the mirrored strategy.
+    """
+    if name == "mirrored":
+        cpu = tf.config.list_physical_devices("CPU")[0]
+        tf.config.set_logical_device_configuration(
+            cpu, [tf.config.LogicalDeviceConfiguration()] * num_replicas
+        )
+        devices = [device.name for device in tf.config.list_logical_devices("CPU")]
+        return tf.distribute.MirroredStrategy(
+            devices, cross_device_ops=tf.distribute.ReductionToOneDevice()
+        )
+    if name == "multi_worker":
+        return tf.distribute.MultiWorkerMirroredStrategy()
+    return tf.distribute.get_strategy()
+
+
+def is_chief(strategy):
+    """Whether this process is the chief worker, always true without a multi-worker strategy."""
+    resolver = getattr(strategy, "cluster_resolver", None)
+    if resolver is None or resolver.task_type is None:
+        return True
+    return resolver.task_type == "chief" or (
+        resolver.task_type == "worker"
+        and resolver.task_id == 0
+        and "chief" not in resolver.cluster_spec().as_dict()
+    )
+
+
+def launch_local_workers(num_workers):
+    """Runs this script in num_workers local processes forming one multi-worker cluster.
+
+    Returns:
+        Exit code, non-zero if any worker failed.
+    """
+    ports = []
+    for _ in range(num_workers):
+        with socket.socket() as sock:
+            sock.bind(("localhost", 0))
+            ports.append(sock.getsockname()[1])
+    cluster = {"worker": [f"localhost:{port}" for port in ports]}
+
+    workers = []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        task = {"type": "worker", "index": index}
+        env["TF_CONFIG"] = json.dumps({"cluster": cluster, "task": task})
+        workers.append(subprocess.Popen([sys.executable, *sys.argv], env=env))
+    return max(worker.wait() for worker in workers)
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Records the wall time of every epoch."""
+
+    def __init__(self):
+        super().__init__()
+        self.durations = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.durations.append(time.perf_counter() - self.start)
+
+
+def benchmark(model, audio_processor, steps):
+    """Measures the training throughput in steps per second, including the input pipeline.
+
+    Runs one warm-up epoch of the given number of steps, which also covers tracing and XLA
+    compilation, followed by the measured epoch. No validation or checkpointing is done.
+    """
+    compile_model(model, float(FLAGS.learning_rate.split(",")[0]))
+    timer = EpochTimer()
+    model.fit(
+        x=get_train_data(audio_processor),
+        steps_per_epoch=steps,
+        epochs=2,
+        callbacks=[timer],
+        verbose=0,
+    )
+    print(
+        f"Training throughput: {steps / timer.durations[1]:.2f} steps/sec "
+        f"(warm-up {steps / timer.durations[0]:.2f} steps/sec, jit={FLAGS.jit}, "
+        f"policy={tf.keras.mixed_precision.global_policy().name})"
+    )
+
+
+def bfloat16_supported():
+    """Whether the CPU has native bfloat16 instructions (AVX512_BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo", "r") as handle:
+            cpuinfo = handle.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in cpuinfo or "amx_bf16" in cpuinfo
+
+
+def with_float32_output(model):
+    """Casts the output of a mixed precision model to float32 for a numerically stable loss.
+
+    The added layer has no weights, so checkpoints stay loadable into the plain model.
+    """
+    output = tf.keras.layers.Activation("linear", dtype="float32")(model.output)
+    return tf.keras.Model(model.inputs, output, name=model.name)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -130,6 +275,14 @@ if __name__ == "__main__":
         Where to download the speech training data to.
         """,
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="""\
+        Where to persist decoded audio and features between runs. Disabled if not set.
+        """,
+    )
     parser.add_argument(
         "--background_volume",
         type=float,
@@ -273,6 +426,68 @@ if __name__ == "__main__":
         dest="micro",
         action="store_false",
     )
+    parser.add_argument(
+        "--batch_frontend",
+        action="store_true",
+        default=False,
+        help="""\
+        Compute micro frontend features per batch with the NumPy implementation instead of
+        per sample with the TFLite micro op. Results are identical.
+        """,
+    )
+    parser.add_argument(
+        "--packed_audio",
+        action="store_true",
+        default=False,
+        help="""\
+        Pack all decoded clips into one memory-mapped array inside the data directory and read
+        the audio from there instead of decoding one wav file per clip.
+        """,
+    )
+
+    parser.add_argument(
+        "--jit",
+        action="store_true",
+        default=False,
+        help="Compile the train step with XLA.",
+    )
+    parser.add_argument(
+        "--mixed_precision",
+        action="store_true",
+        default=False,
+        help="""\
+        Compute in bfloat16 while keeping float32 weights. Ignored if the CPU has no native
+        bfloat16 support.
+        """,
+    )
+    parser.add_argument(
+        "--benchmark_steps",
+        type=int,
+        default=0,
+        help="""\
+        If set, only measure the training throughput over this many steps and report steps/sec
+        instead of training.
+        """,
+    )
+
+    parser.add_argument(
+        "--strategy",
+        type=str,
+        default="default",
+        choices=["default", "mirrored", "multi_worker"],
+        help="""\
+        Distribution strategy. "mirrored" trains --num_replicas replicas on the CPU of one
+        process. "multi_worker" trains one replica per worker of the cluster in TF_CONFIG, or
+        starts --num_replicas local worker processes if TF_CONFIG is not set. --batch_size is the
+        global batch size split across all replicas.
+        """,
+    )
+    parser.add_argument(
+        "--num_replicas",
+        type=int,
+        default=2,
+        help="Number of replicas for the mirrored strategy or of local multi-worker processes.",
+    )
 
     FLAGS, _ = parser.parse_known_args()
 
@@ -285,7 +500,24 @@ if __name__ == "__main__":
         FLAGS.dct_coefficient_count,
     )
 
-    model = models.get_model(model_settings, FLAGS.model_architecture, model_name=FLAGS.model_name)
+    if FLAGS.strategy == "multi_worker" and "TF_CONFIG" not in os.environ:
+        # Download once before the workers start to read the dataset.
+        download_and_extract(FLAGS.data_url, FLAGS.data_dir)
+        sys.exit(launch_local_workers(FLAGS.num_replicas))
+    strategy = get_strategy(FLAGS.strategy, FLAGS.num_replicas)
+
+    if FLAGS.mixed_precision and not bfloat16_supported():
+        print("This CPU has no native bfloat16 support, training in float32.")
+        FLAGS.mixed_precision = False
+    if FLAGS.mixed_precision:
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+
+    with strategy.scope():
+        model = models.get_model(
+            model_settings, FLAGS.model_architecture, model_name=FLAGS.model_name
+        )
+        if FLAGS.mixed_precision:
+            model = with_float32_output(model)
 
     num_classes = len(FLAGS.wanted_words.split(",")) + 2
 
@@ -305,6 +537,12 @@ if __name__ == "__main__":
         testing_percentage=FLAGS.testing_percentage,
         model_settings=model_settings,
         micro=FLAGS.micro,
+        cache_dir=FLAGS.cache_dir,
+        batch_frontend=FLAGS.batch_frontend,
+        packed_audio=FLAGS.packed_audio,
     )
 
-    train(model, audio_processor)
+    if FLAGS.benchmark_steps > 0:
+        benchmark(model, audio_processor, FLAGS.benchmark_steps)
+    else:
+        train(model, audio_processor)
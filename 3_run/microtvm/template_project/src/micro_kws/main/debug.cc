@@ -62,6 +62,8 @@ typedef struct __attribute__((packed)) {
   uint8_t category_data[category_count];
   uint8_t top_category_index;
 #else   // CONFIG_MICRO_KWS_MODE_DEBUG_AUDIO
+  // Counts the audio packets, so the host can detect lost packets.
+  uint32_t sequence_number;
   uint8_t audio_data[AUDIO_PACKET_SIZE];
 #endif  // CONFIG_MICRO_KWS_MODE_DEBUG_AUDIO
 } debug_data_t;
@@ -262,7 +264,11 @@ esp_err_t DebugRunAudio(int8_t* audio_data) {
   last_time = this_time;
   printf("\n");
 
+  // Packets which can not be sent still use up a number and show up as gap.
+  static uint32_t sequence_number = 0;
+
   debug_data_t debug_data;
+  debug_data.sequence_number = sequence_number++;
   memcpy(debug_data.audio_data, audio_data, AUDIO_PACKET_SIZE);
 
   if (xRingbufferSend(buf_handle, (void*)&debug_data, sizeof(debug_data), pdMS_TO_TICKS(500)) !=
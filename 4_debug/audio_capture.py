@@ -0,0 +1,140 @@
+"""Capture of the audio packets sent by the target software in the microphone debugger mode.
+
+Every audio packet starts with a little-endian uint32 sequence number followed by 16 bit
+samples. The samples are collected in a preallocated chunk, which is appended to the WAV file
+whenever it is full. The header of the file is updated after every chunk, so the file is valid
+during the whole recording and a crash only loses the last chunk. Lost packets are detected
+from gaps in the sequence numbers and replaced by silence to keep the timing.
+"""
+
+import struct
+
+import numpy as np
+
+AUDIO_HEADER_SIZE = 4  # Bytes of the sequence number in front of the samples.
+WAV_HEADER_SIZE = 44
+
+
+class WavWriter:
+    """Streams 16 bit mono PCM samples to a WAV file.
+
+    Args:
+        path: Path of the file, an existing file is replaced.
+        sample_rate: Samples per second.
+    """
+
+    def __init__(self, path, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.data_bytes = 0
+        self._handle = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        self._handle.seek(0)
+        self._handle.write(
+            struct.pack(
+                "<4sI4s4sIHHIIHH4sI",
+                b"RIFF",
+                WAV_HEADER_SIZE - 8 + self.data_bytes,
+                b"WAVE",
+                b"fmt ",
+                16,  # Size of the format chunk
+                1,  # PCM
+                1,  # Channels
+                self.sample_rate,
+                2 * self.sample_rate,  # Bytes per second
+                2,  # Bytes per frame
+                16,  # Bits per sample
+                b"data",
+                self.data_bytes,
+            )
+        )
+        self._handle.seek(0, 2)
+
+    def write(self, samples):
+        """Appends int16 samples and updates the header."""
+        self._handle.write(np.asarray(samples, dtype="<i2").tobytes())
+        self.data_bytes += 2 * len(samples)
+        self._write_header()
+        self._handle.flush()
+
+    def close(self):
+        self._handle.close()
+
+
+class AudioCapture:
+    """Writes the samples of audio packets to a WAV file in constant memory.
+
+    Args:
+        path: Path of the WAV file.
+        packet_samples: Number of samples per packet.
+        total_samples: Length of the recording in samples, None records until closed.
+        sample_rate: Samples per second.
+        chunk_packets: Number of packets collected before they are written to the file.
+    """
+
+    def __init__(
+        self, path, packet_samples, total_samples=None, sample_rate=16000, chunk_packets=10
+    ):
+        self.packet_samples = packet_samples
+        self.total_samples = total_samples
+        self.wav = WavWriter(path, sample_rate)
+        self._chunk = np.zeros(chunk_packets * packet_samples, dtype=np.int16)
+        self._chunk_size = 0
+
+        self.samples = 0  # Samples captured so far, including the silence of lost packets.
+        self.next_sequence = 0  # Sequence number of the next packet expected.
+        self.packets = 0  # Packets received.
+        self.lost_packets = 0  # Packets missing in the sequence.
+        self.duplicate_packets = 0  # Packets with a sequence number seen before.
+
+    @property
+    def payload_size(self):
+        return AUDIO_HEADER_SIZE + 2 * self.packet_samples
+
+    @property
+    def done(self):
+        return self.total_samples is not None and self.samples >= self.total_samples
+
+    def add_packet(self, payload):
+        """Adds the payload of one packet as uint8 array.
+
+        Returns:
+            Number of packets lost in front of this one.
+        """
+        sequence = int(payload[:AUDIO_HEADER_SIZE].view("<u4")[0])
+        if sequence < self.next_sequence:
+            self.duplicate_packets += 1
+            return 0
+        lost = sequence - self.next_sequence
+        self.lost_packets += lost
+        self._add(None, lost * self.packet_samples)
+        self._add(payload[AUDIO_HEADER_SIZE:].view("<i2"), self.packet_samples)
+        self.next_sequence = sequence + 1
+        self.packets += 1
+        return lost
+
+    def _add(self, samples, count):
+        # Without samples, silence is added.
+        if self.total_samples is not None:
+            count = min(count, self.total_samples - self.samples)
+        offset = 0
+        while offset < count:
+            size = min(count - offset, len(self._chunk) - self._chunk_size)
+            target = self._chunk[self._chunk_size : self._chunk_size + size]
+            target[:] = 0 if samples is None else samples[offset : offset + size]
+            self._chunk_size += size
+            offset += size
+            if self._chunk_size == len(self._chunk):
+                self.flush()
+        self.samples += count
+
+    def flush(self):
+        """Writes the collected samples to the file."""
+        if self._chunk_size:
+            self.wav.write(self._chunk[: self._chunk_size])
+            self._chunk_size = 0
+
+    def close(self):
+        self.flush()
+        self.wav.close()
@@ -3,7 +3,6 @@
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
-import matplotlib.animation as anim
 import matplotlib.gridspec as gridspec
 import argparse
 import serial
@@ -12,13 +11,16 @@ import sys
 import os
 import threading
 import warnings
-import scipy.io.wavfile
+
+from audio_capture import AudioCapture
+from frame_buffer import FrameBuffer
+from framer import PacketFramer, UART_PACKET_FOOTER
+from history import HistoryBuffer
+from packet_log import PacketLog, PacketLogWriter
 
 # Ignore matplotlib warnings
 warnings.filterwarnings("ignore")
 
-UART_PACKET_FOOTER = b"\x00\x01\x02\x03\x04\x05\x06\x07"
-
 
 class LoopRunner:
     def __init__(self, args: argparse.Namespace, ser: serial.Serial):
@@ -26,13 +28,16 @@ class LoopRunner:
         self.ser = ser  # serial port object
 
         self.start_time = time.perf_counter()  # get start time of plotter
-        self.animation = None  # animation object used by matplotlib
+        self.timer = None  # timer of the render loop
         self.run = False
         self.threads = []  # list of threads
         # The screen needs to be updated from the main Thread on MacOS
         # self.run_plotter_thread = threading.Thread(target=self.run_plotter)
         # self.threads.append(self.run_plotter_thread)
-        self.run_loop_thread = threading.Thread(target=self.run_loop)
+        # Packets either come from the serial port or from a recorded log
+        self.run_loop_thread = threading.Thread(
+            target=self.replay_loop if self.args.replay else self.run_loop
+        )
         self.threads.append(self.run_loop_thread)
 
         ##########################  Packet  ####################################
@@ -41,19 +46,44 @@ class LoopRunner:
         #   1960 Byte        4 Byte     1 Byte       8 Byte                    #
         ########################################################################
 
-        self.feature_size = self.args.feature_height * self.args.feature_width
-        self.feature_data = np.zeros((self.args.feature_width, self.args.feature_height))
-        self.feature_data.setflags(write=1)
+        self.feature_height = int(self.args.feature_height)
+        self.feature_width = int(self.args.feature_width)
+        self.feature_size = self.feature_height * self.feature_width
 
         self.labels = self.args.standard_labels + self.args.category_labels
 
+        # The reader thread hands the latest packet to the plotter without locking
+        self.frames = FrameBuffer(
+            np.dtype(
+                [
+                    ("features", np.int8, (self.feature_width, self.feature_height)),
+                    ("categories", np.uint8, (len(self.labels),)),
+                    ("top", np.uint8),
+                ]
+            )
+        )
+
         self.top_category_index = 0
 
         self.packet_footer = UART_PACKET_FOOTER
         self.packet_size = self.feature_size + len(self.labels) + 1 + len(self.packet_footer)
-
-        self.category_array = np.zeros((2, len(self.labels)))
-        self.time_array = [0]
+        self.framer = PacketFramer(self.packet_size - len(self.packet_footer), self.packet_footer)
+
+        # Only the shown history is kept, so long sessions run in constant memory
+        self.history = HistoryBuffer(int(self.args.category_history), len(self.labels), np.uint8)
+
+        self.recorder = None
+        if self.args.record:
+            self.recorder = PacketLogWriter(
+                self.args.record,
+                self.framer.payload_size,
+                {
+                    "feature_height": self.feature_height,
+                    "feature_width": self.feature_width,
+                    "standard_labels": self.args.standard_labels,
+                    "category_labels": self.args.category_labels,
+                },
+            )
 
     def start(self):
         self.run = True
@@ -62,51 +92,73 @@ class LoopRunner:
 
     def stop(self):
         self.run = False
-        if self.animation is not None and self.animation.event_source is not None:
-            self.animation.event_source.stop()
+        if self.timer is not None:
+            self.timer.stop()
         plt.close("all")
         for x in self.threads:
             x.join()
+        if self.recorder is not None:
+            self.recorder.close()
 
     def get_current_runtime(self):
         return round(time.perf_counter() - self.start_time, 4)
 
-    def run_loop(self):
-        while self.run:
-            # TODO(fabianpedd): Do parsing differently and cleanup array indexing
-            # Read data from serial port until footer and parse as numpy array
-            raw_data = self.ser.read_until(self.packet_footer)
-            data_as_int = np.frombuffer(raw_data, dtype=np.int8).copy()
-            data_as_uint = np.frombuffer(raw_data, dtype=np.uint8).copy()
-
-            # Check if data len machtes expected packet size
-            if len(data_as_int) == self.packet_size:
-                # Parse feature data
-                self.feature_data = data_as_int[: -(self.packet_size - self.feature_size)].reshape(
-                    self.args.feature_height, -1
-                )
-                self.feature_data = np.transpose(self.feature_data)
-
-                # Parse category data and append to category array
-                self.category_array = np.vstack(
-                    (
-                        self.category_array,
-                        data_as_uint[self.feature_size : (self.feature_size + len(self.labels))],
-                    )
-                )
+    def handle_packet(self, payload, timestamp):
+        # The payload is a view into the framer, copy what is kept
+        features = payload[: self.feature_size].view(np.int8)
+        categories = payload[self.feature_size : (self.feature_size + len(self.labels))]
+        top_category_index = int(payload[self.feature_size + len(self.labels)])
 
-                self.top_category_index = data_as_uint[
-                    self.feature_size + len(self.labels) : self.feature_size + len(self.labels) + 1
-                ]
-                # print(self.labels[int(self.top_category_index)])
+        frame = self.frames.back()
+        np.copyto(frame["features"], features.reshape(self.feature_height, -1).T)
+        frame["categories"] = categories
+        frame["top"] = top_category_index
+        self.frames.publish()
 
-                # Append time stamp to time array
-                self.time_array.append(self.get_current_runtime())
+        if self.args.headless and top_category_index != self.top_category_index:
+            print("%.2f s: Detected %s" % (timestamp, self.labels[top_category_index]))
+        self.top_category_index = top_category_index
 
-            else:
-                print("Wrong packet size:", data_as_int.size, "but expected", self.packet_size)
+        # Append category data with time stamp to the history
+        self.history.append(timestamp, categories)
 
-    def run_plotter(self):
+    def run_loop(self):
+        dropped_packets = 0
+        while self.run:
+            for payload in self.framer.read_packets(self.ser):
+                if self.recorder is not None:
+                    self.recorder.append(time.time(), payload)
+                self.handle_packet(payload, self.get_current_runtime())
+
+            if self.framer.dropped_packets != dropped_packets:
+                dropped_packets = self.framer.dropped_packets
+                print(
+                    "Resynchronized: %d packets received, %d dropped (%d bytes)"
+                    % (self.framer.packets, dropped_packets, self.framer.dropped_bytes)
+                )
+
+    def replay_loop(self):
+        log = PacketLog(self.args.replay)
+        assert log.payload_size == self.framer.payload_size, "Log does not match the model"
+        footer = bytes(self.packet_footer)
+        speed = self.args.replay_speed
+        start_time = time.perf_counter()
+        for timestamp, payload in zip(log.times - log.times[:1], log.records["payload"]):
+            if not self.run:
+                break
+            # Sleep until the packet is due, a speed of 0 replays as fast as possible
+            if speed > 0:
+                time.sleep(max(timestamp / speed - (time.perf_counter() - start_time), 0))
+            # Pass the packet through the framer like the bytes of the serial port
+            for parsed in self.framer.feed(payload.tobytes() + footer):
+                self.handle_packet(parsed, round(float(timestamp), 4))
+
+        print("Replayed %d packets" % self.framer.packets)
+        # The plotter keeps showing the last state until its window is closed
+        if self.args.headless:
+            self.run = False
+
+    def setup_plotter(self):
         # TODO(@PhilippvK): it would be cool if the colors in the debugger GPU
         # match the RGB values of the onboard LED
         colors = [
@@ -122,6 +174,9 @@ class LoopRunner:
             "tab:cyan",
         ]
 
+        # Copy of the latest frame owned by the plotter
+        self.frame = np.zeros((), dtype=self.frames.back().dtype)
+
         fig = plt.figure(figsize=(8, 6))
         gs = gridspec.GridSpec(2, 2, width_ratios=[3, 2])
         fig.canvas.manager.set_window_title("Micro-KWS Debugger")
@@ -130,11 +185,12 @@ class LoopRunner:
         # Create feature graph
         ax1 = fig.add_subplot(gs[0, 0])
         feature_graph = ax1.imshow(
-            self.feature_data,
+            self.frame["features"],
             aspect="auto",
             cmap="gray",
             vmin=self.args.feature_min,
             vmax=self.args.feature_max,
+            animated=True,
         )
         ax1.set_facecolor("xkcd:light grey")
         ax1.set_xlabel(r"Time bins")
@@ -143,10 +199,11 @@ class LoopRunner:
         ax2 = fig.add_subplot(gs[0, 1])
         bar_plot = ax2.bar(
             range(len(self.labels)),
-            self.category_array[-1],
+            np.zeros(len(self.labels)),
             bottom=self.args.category_min,
             tick_label=self.labels,
             color=colors,
+            animated=True,
         )
         ax2.set_xticklabels(self.labels, rotation=45, ha="right")
         ax2.set_ylim(self.args.category_min, self.args.category_max + 5)
@@ -156,7 +213,9 @@ class LoopRunner:
         ax3 = fig.add_subplot(gs[1, :])
         category_graphs = []
         for i, l in enumerate(self.labels):
-            category_graphs.append(ax3.plot([], [], color=colors[i], linewidth=1.5, label=l)[0])
+            category_graphs.append(
+                ax3.plot([], [], color=colors[i], linewidth=1.5, label=l, animated=True)[0]
+            )
         ax3.set_ylim(self.args.category_min - 5, self.args.category_max + 5)
         ax3.set_xlabel(r"Time [s]")
         ax3.set_ylabel(r"Confidence")
@@ -167,51 +226,128 @@ class LoopRunner:
         top_category_text = fig.text(
             0.1,
             0.485,
-            "Detected:" + self.labels[int(self.top_category_index)],
+            "Detected:" + self.labels[int(self.frame["top"])],
             weight="semibold",
             size="large",
+            animated=True,
         )
+        stats_text = fig.text(0.99, 0.01, "", ha="right", size="small", animated=True)
 
         plt.tight_layout()
 
-        self.animation = anim.FuncAnimation(
-            fig,
-            self.plotter,
-            fargs=([feature_graph, bar_plot, category_graphs, top_category_text, ax1, ax2, ax3]),
-            interval=100,
-        )
+        self.fig = fig
+        self.feature_graph = feature_graph
+        self.bar_plot = bar_plot
+        self.category_graphs = category_graphs
+        self.top_category_text = top_category_text
+        self.stats_text = stats_text
+        # Animated artists of every axes, these are blitted separately
+        self.blit_artists = {ax1: [feature_graph], ax2: list(bar_plot), ax3: category_graphs}
+        self.backgrounds = None
+        fig.canvas.mpl_connect("draw_event", self.on_draw)
+
+        self.rendered = 0  # Published frame shown last
+        self.rendered_history = 0  # History count shown last
+        self.render_stats = {"time": time.perf_counter(), "published": 0, "frames": 0}
+        self.frames_rendered = 0  # Frames drawn so far
+        self.frames_skipped = 0  # Published frames replaced before they were drawn
+
+    def run_plotter(self):
+        self.setup_plotter()
+
+        # The render loop only draws what has changed since the last frame
+        self.timer = self.fig.canvas.new_timer(interval=1000 / self.args.max_fps)
+        self.timer.add_callback(self.render)
+        self.timer.start()
 
-        # Start animation until window is closed
+        # Start rendering until window is closed
         plt.show()
 
         # When we return from show, end the simulation
         self.run = False
 
-    def plotter(
-        self, frame, feature_graph, bar_plot, category_graphs, top_category_text, ax1, ax2, ax3
-    ):
-        # Set feature data
-        feature_graph.set_data(self.feature_data)
-
-        # Set bar plot category data
-        for bar, d in zip(bar_plot, self.category_array[-1]):
-            bar.set_height(d - self.args.category_min)
-
-        # Determine how many past category values we can actually print
-        plot_count = min(
-            self.args.category_history, min(len(self.category_array), len(self.time_array))
-        )
-        # and set limits accordingly
-        ax3.set_xlim(
-            min(self.time_array[-plot_count:], default=0),
-            max(self.time_array[-plot_count:], default=0),
+    def on_draw(self, event):
+        # A full redraw leaves out the animated artists, which gives the blitting backgrounds
+        canvas = self.fig.canvas
+        self.backgrounds = {None: canvas.copy_from_bbox(self.fig.bbox)}
+        for ax in self.blit_artists:
+            self.backgrounds[ax] = canvas.copy_from_bbox(ax.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for artists in self.blit_artists.values():
+            for artist in artists:
+                self.fig.draw_artist(artist)
+        self.fig.draw_artist(self.top_category_text)
+        self.fig.draw_artist(self.stats_text)
+
+    def update_stats(self, published):
+        # Returns whether the statistics text changed
+        now = time.perf_counter()
+        elapsed = now - self.render_stats["time"]
+        if elapsed < 1.0:
+            return False
+        self.stats_text.set_text(
+            "%.0f FPS | %.0f packets/s | %d frames skipped"
+            % (
+                (self.frames_rendered - self.render_stats["frames"]) / elapsed,
+                (published - self.render_stats["published"]) / elapsed,
+                self.frames_skipped,
+            )
         )
-
-        # Set category data
-        for i, g in enumerate(category_graphs):
-            g.set_data(self.time_array[-plot_count:], self.category_array[-plot_count:, i])
-
-        top_category_text.set_text("Detected: %s" % self.labels[int(self.top_category_index)])
+        self.render_stats = {"time": now, "published": published, "frames": self.frames_rendered}
+        return True
+
+    def render(self):
+        canvas = self.fig.canvas
+        if self.backgrounds is None:
+            canvas.draw()
+            return
+
+        # Packets arriving faster than the frame rate are skipped, the reader never waits
+        top_category_index = int(self.frame["top"])
+        published = self.frames.read(self.frame)
+        full_redraw = self.update_stats(published)
+        changed = []
+        if published != self.rendered:
+            self.frames_skipped += published - self.rendered - 1
+            self.frames_rendered += 1
+            self.rendered = published
+            self.feature_graph.set_data(self.frame["features"])
+            for bar, d in zip(self.bar_plot, self.frame["categories"]):
+                bar.set_height(d - self.args.category_min)
+            changed += [self.feature_graph.axes, self.bar_plot[0].axes]
+            if int(self.frame["top"]) != top_category_index:
+                self.top_category_text.set_text(
+                    "Detected: %s" % self.labels[int(self.frame["top"])]
+                )
+                full_redraw = True
+
+        if self.history.count != self.rendered_history:
+            self.rendered_history = self.history.count
+            time_data, category_data = self.history.snapshot()
+            for i, g in enumerate(self.category_graphs):
+                g.set_data(time_data, category_data[:, i])
+            ax3 = self.category_graphs[0].axes
+            changed.append(ax3)
+            # Moving the time axis needs new ticks, so it only moves in steps
+            left, right = ax3.get_xlim()
+            if time_data[-1] > right or time_data[0] < left:
+                span = max(time_data[-1] - time_data[0], 1.0)
+                ax3.set_xlim(time_data[0], time_data[-1] + span / 2)
+                canvas.draw()
+                return
+
+        if full_redraw:
+            canvas.restore_region(self.backgrounds[None])
+            self.draw_animated()
+            canvas.blit(self.fig.bbox)
+        else:
+            for ax in changed:
+                canvas.restore_region(self.backgrounds[ax])
+                for artist in self.blit_artists[ax]:
+                    self.fig.draw_artist(artist)
+                canvas.blit(ax.bbox)
 
 
 def main():
@@ -288,6 +424,9 @@ def main():
         default=20,
         help="How many past category values to show.",
     )
+    parser.add_argument(
+        "-fps", "--max-fps", type=float, default=30, help="Maximum frame rate of the plotter."
+    )
 
     # Audio recording parameters
     parser.add_argument(
@@ -298,7 +437,7 @@ def main():
         "--audio-total-length",
         type=float,
         default=2.0,
-        help="How long the total audio recording will be [in seconds].",
+        help="How long the total audio recording will be [in seconds], 0 records until CTRL+C.",
     )
     parser.add_argument(
         "-apl",
@@ -315,55 +454,94 @@ def main():
         help="Name of the audio file to create (needs to end in .wav).",
     )
 
+    # Recording and replay parameters
+    parser.add_argument(
+        "-r", "--record", type=str, default=None, help="Log every received packet to this file."
+    )
+    parser.add_argument(
+        "-rp",
+        "--replay",
+        type=str,
+        default=None,
+        help="Replay a log written by --record instead of reading from the UART device.",
+    )
+    parser.add_argument(
+        "-rs",
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="Speed factor of the replay, 0 replays as fast as possible.",
+    )
+    parser.add_argument(
+        "-hl",
+        "--headless",
+        default=False,
+        action="store_true",
+        help="Do not open the plotter window, e.g. to record on machines without display.",
+    )
+
     # Parse arguments
     args = parser.parse_args()
-
-    # Initalize UART connection
-    print("Starting UART connection on %s with %d baud." % (args.port, args.baudrate))
-    ser = serial.Serial(args.port, args.baudrate, timeout=0.75)
-    ser.reset_input_buffer()
+    if args.audio and args.replay:
+        parser.error("--replay can not be combined with --audio")
+
+    ser = None
+    if args.replay:
+        # The log knows the shape of the packets it was recorded with
+        metadata = PacketLog(args.replay).metadata
+        for name in ["feature_height", "feature_width", "standard_labels", "category_labels"]:
+            setattr(args, name, metadata[name])
+    else:
+        # Initalize UART connection
+        print("Starting UART connection on %s with %d baud." % (args.port, args.baudrate))
+        ser = serial.Serial(args.port, args.baudrate, timeout=0.75)
+        ser.reset_input_buffer()
 
     if args.audio:
-        audio_buffer = np.array([], dtype=np.int16)
-        audio_received_bytes = 0
-        audio_total_bytes = int(2 * 16000 * args.audio_total_length)
-        audio_payload_bytes = int(2 * 16000 * args.audio_packet_length)
-        audio_packet_bytes = audio_payload_bytes + len(UART_PACKET_FOOTER)
+        audio_total_samples = int(16000 * args.audio_total_length) or None
+        capture = AudioCapture(
+            args.audio_file_name, int(16000 * args.audio_packet_length), audio_total_samples
+        )
+        framer = PacketFramer(capture.payload_size, UART_PACKET_FOOTER)
         last_packet_time = 0
+        last_print_time = 0
         print("Waiting for audio data...")
-        while audio_received_bytes < audio_total_bytes and (
-            last_packet_time == 0 or time.perf_counter() - last_packet_time < 2
-        ):
-            raw_data = ser.read_until(UART_PACKET_FOOTER)
-            if len(raw_data) != audio_packet_bytes:
-                print("Received", len(raw_data), "bytes. Waiting for audio data...")
-                continue
-            last_packet_time = time.perf_counter()
-            audio_data = np.frombuffer(raw_data[:audio_payload_bytes], dtype=np.int16).copy()
-            audio_buffer = np.append(audio_buffer, audio_data)
-            # TODO(fabianpedd): Use getsizeof instead
-            audio_received_bytes += len(audio_data) * 2
-            print(
-                "Received",
-                len(audio_data) * 2,
-                "bytes,",
-                audio_total_bytes - audio_received_bytes,
-                "bytes remaining...",
-            )
-
-        if audio_received_bytes < audio_total_bytes:
+        # Without total length the recording ends on CTRL+C or when no data comes in anymore
+        try:
+            while not capture.done and (
+                last_packet_time == 0 or time.perf_counter() - last_packet_time < 2
+            ):
+                for payload in framer.read_packets(ser):
+                    last_packet_time = time.perf_counter()
+                    lost = capture.add_packet(payload)
+                    if lost:
+                        print("Lost", lost, "packets in front of packet", capture.next_sequence - 1)
+                    if capture.done:
+                        break
+
+                # Print the progress once per second instead of once per packet
+                if time.perf_counter() - last_print_time > 1 and capture.packets:
+                    last_print_time = time.perf_counter()
+                    print("Received", 2 * capture.samples, "bytes...")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            capture.close()
+
+        if not capture.done and audio_total_samples is not None:
             print(
                 "Received only",
-                audio_received_bytes,
+                2 * capture.samples,
                 "of total",
-                audio_total_bytes,
+                2 * audio_total_samples,
                 "bytes. But quit receiving prematurely due to time reasons.",
             )
-        else:
-            print("Received full", audio_received_bytes, "bytes.")
-
-        scipy.io.wavfile.write(args.audio_file_name, 16000, audio_buffer)
-        print("Wrote", audio_received_bytes, "bytes to", args.audio_file_name)
+        if capture.lost_packets or framer.dropped_packets:
+            print(
+                "Replaced %d lost packets with silence, %d damaged packets were dropped."
+                % (capture.lost_packets, framer.dropped_packets)
+            )
+        print("Wrote", capture.wav.data_bytes, "bytes to", args.audio_file_name)
 
         sys.exit(0)
 
@@ -375,13 +553,17 @@ def main():
         lr.start()
 
         while lr.run:
-            lr.run_plotter()
+            if args.headless:
+                time.sleep(0.1)
+            else:
+                lr.run_plotter()
 
         raise KeyboardInterrupt
 
     except KeyboardInterrupt as e:
         lr.stop()
-        ser.close()
+        if ser is not None:
+            ser.close()
         print("Exiting program ...")
         os._exit(0)  # hard exit, sys.exit(0) gets hung up
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Fake serial device emulating the debug output of the target software on a pseudo terminal.
+
+Start it and pass the printed port to the debugger, e.g.
+
+    python fake_serial.py --category-labels yes no
+    python debug.py --port /dev/pts/5 --category-labels yes no
+
+With --audio it sends a sine tone like the microphone debugger mode instead.
+"""
+
+import os
+import tty
+import time
+import argparse
+
+import numpy as np
+
+from framer import UART_PACKET_FOOTER
+
+
+class FakeSerialDevice:
+    """Pseudo terminal whose other end behaves like the UART of the board.
+
+    Args:
+        footer: Footer appended to every packet.
+    """
+
+    def __init__(self, footer=UART_PACKET_FOOTER):
+        self.footer = footer
+        self.master_fd, self.slave_fd = os.openpty()
+        # Raw mode, the line discipline would otherwise translate the binary data.
+        tty.setraw(self.master_fd)
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+    def write(self, data):
+        """Writes raw bytes to the port."""
+        view = memoryview(data)
+        while len(view):
+            view = view[os.write(self.master_fd, view) :]
+
+    def write_packet(self, payload):
+        """Writes a payload followed by the footer."""
+        self.write(bytes(payload) + self.footer)
+
+    def close(self):
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def debug_payload(features, categories, top_category_index):
+    """Packs a debug packet payload like DebugWorker of the target software."""
+    return (
+        np.asarray(features, dtype=np.int8).tobytes()
+        + np.asarray(categories, dtype=np.uint8).tobytes()
+        + bytes([top_category_index])
+    )
+
+
+def audio_payload(sequence_number, samples):
+    """Packs an audio packet payload like DebugRunAudio of the target software."""
+    sequence_number = np.asarray(sequence_number, dtype="<u4")
+    return sequence_number.tobytes() + np.asarray(samples, dtype="<i2").tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "-fh", "--feature-height", type=int, default=49, help="Height of feature image."
+    )
+    parser.add_argument(
+        "-fw", "--feature-width", type=int, default=40, help="Width of feature image."
+    )
+    parser.add_argument(
+        "-cl",
+        "--category-labels",
+        nargs="+",
+        default=["yes", "no"],
+        help="The category labels, excluding silence and unknown.",
+    )
+    parser.add_argument(
+        "-i", "--interval", type=float, default=0.1, help="Seconds between two packets."
+    )
+    parser.add_argument(
+        "-c",
+        "--corrupt-probability",
+        type=float,
+        default=0.0,
+        help="Probability of sending a packet with missing bytes, to test resynchronization.",
+    )
+    parser.add_argument(
+        "-a", "--audio", action="store_true", help="Send audio packets instead of debug data."
+    )
+    parser.add_argument(
+        "-apl",
+        "--audio-packet-length",
+        type=float,
+        default=0.1,
+        help="Length of each audio packet [in seconds].",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng()
+    category_count = len(args.category_labels) + 2
+    with FakeSerialDevice() as device:
+        print("Serving fake %s data on" % ("audio" if args.audio else "debug"), device.port)
+        packet_samples = int(16000 * args.audio_packet_length)
+        sequence_number = 0
+        while True:
+            if args.audio:
+                # 440 Hz tone, continuous over the packets
+                sample_index = sequence_number * packet_samples + np.arange(packet_samples)
+                samples = 8000 * np.sin(2 * np.pi * 440 * sample_index / 16000)
+                payload = audio_payload(sequence_number, samples)
+                sequence_number += 1
+            else:
+                features = rng.integers(-128, 128, args.feature_height * args.feature_width)
+                categories = rng.dirichlet(np.ones(category_count)) * 255
+                payload = debug_payload(features, categories, int(np.argmax(categories)))
+            if rng.random() < args.corrupt_probability:
+                payload = payload[: rng.integers(len(payload))]
+            device.write_packet(payload)
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
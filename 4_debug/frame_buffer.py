@@ -0,0 +1,42 @@
+"""Lock-free handoff of the latest debug frame from the serial reader to the plotter."""
+
+import numpy as np
+
+
+class FrameBuffer:
+    """Double buffer passing the latest frame from one writing to one reading thread.
+
+    The writer fills the back frame and publishes it by flipping the front index, so it never
+    waits for the reader. The reader copies the front frame and retries if a frame was
+    published meanwhile, because the writer could have started to overwrite the copied one.
+
+    Args:
+        dtype: Structured dtype of a frame.
+    """
+
+    def __init__(self, dtype):
+        self._frames = np.zeros(2, dtype=dtype)
+        self._front = 0
+        self.published = 0  # Number of frames published so far.
+
+    def back(self):
+        """Returns the frame to fill next as 0-d view, all fields have to be written."""
+        return self._frames[1 - self._front, ...]
+
+    def publish(self):
+        """Makes the back frame the latest frame."""
+        self._front = 1 - self._front
+        # Readers check the counter after copying, so it is increased after the flip.
+        self.published += 1
+
+    def read(self, out):
+        """Copies the latest frame into the 0-d array out.
+
+        Returns:
+            Number of frames published up to the copied frame, 0 if there is none yet.
+        """
+        while True:
+            published = self.published
+            np.copyto(out, self._frames[self._front, ...])
+            if self.published == published:
+                return published
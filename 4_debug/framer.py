@@ -0,0 +1,114 @@
+"""Streaming framer for the binary UART packets of the target software.
+
+Every packet is a fixed size payload followed by UART_PACKET_FOOTER. The framer collects
+the received bytes in a preallocated ring buffer and only accepts a packet if the footer sits
+exactly behind the payload, so payload bytes matching the footer do not matter. After damaged
+packets it resynchronizes on the next footer. While it is not synchronized, e.g. after
+connecting in the middle of the stream, the bytes in front of a footer are taken as packet if
+there are enough of them.
+"""
+
+import numpy as np
+
+UART_PACKET_FOOTER = b"\x00\x01\x02\x03\x04\x05\x06\x07"
+
+
+class PacketFramer:
+    """Splits a byte stream into the payloads of fixed size packets.
+
+    The ring buffer is stored twice in a row, so every unparsed range is contiguous and
+    payloads can be returned as views without copying them.
+
+    Args:
+        payload_size: Number of bytes in front of the footer.
+        footer: Byte sequence terminating every packet.
+        capacity: Size of the ring buffer in bytes, defaults to four packets.
+    """
+
+    def __init__(self, payload_size, footer=UART_PACKET_FOOTER, capacity=None):
+        self.payload_size = payload_size
+        self.footer = np.frombuffer(footer, dtype=np.uint8)
+        self.packet_size = payload_size + len(footer)
+        self.capacity = capacity or 4 * self.packet_size
+        assert self.capacity >= 2 * self.packet_size, "Ring buffer must hold two packets"
+        self._buffer = np.zeros(2 * self.capacity, dtype=np.uint8)
+        self._start = 0  # Position of the first unparsed byte in the first half.
+        self._size = 0  # Number of unparsed bytes.
+        self._synchronized = False  # Whether the first unparsed byte starts a packet.
+
+        self.packets = 0  # Packets received intact.
+        self.dropped_packets = 0  # Damaged packets skipped while resynchronizing.
+        self.dropped_bytes = 0  # Bytes of the skipped packets.
+        self.resyncs = 0  # Footers found at an unexpected position.
+
+    def feed(self, data):
+        """Adds received bytes and yields the payloads of all completed packets.
+
+        The payloads are uint8 views into the ring buffer. They stay valid until the
+        generator is resumed, consumers keeping them longer have to copy them.
+        """
+        data = np.frombuffer(data, dtype=np.uint8)
+        while len(data):
+            count = min(len(data), self.capacity - self._size)
+            self._write(data[:count])
+            data = data[count:]
+            yield from self._parse()
+
+    def read_packets(self, ser):
+        """Reads what the serial port has received, waiting at most for its timeout.
+
+        Returns:
+            Generator of payloads, see feed.
+        """
+        return self.feed(ser.read(ser.in_waiting or 1))
+
+    def _write(self, data):
+        end = (self._start + self._size) % self.capacity
+        first = min(len(data), self.capacity - end)
+        for offset in [0, self.capacity]:
+            self._buffer[offset + end : offset + end + first] = data[:first]
+            self._buffer[offset : offset + len(data) - first] = data[first:]
+        self._size += len(data)
+
+    def _consume(self, count):
+        self._start = (self._start + count) % self.capacity
+        self._size -= count
+
+    def _parse(self):
+        footer_size = len(self.footer)
+        while self._size >= self.packet_size:
+            window = self._buffer[self._start : self._start + self._size]
+            if np.array_equal(window[self.payload_size : self.packet_size], self.footer):
+                self.packets += 1
+                self._synchronized = True
+                self._consume(self.packet_size)
+                yield window[: self.payload_size]
+                continue
+
+            matches = np.all(
+                np.lib.stride_tricks.sliding_window_view(window, footer_size) == self.footer,
+                axis=1,
+            )
+            found = np.flatnonzero(matches)
+            if len(found) == 0:
+                # Keep the bytes which could be the beginning of a packet whose footer has
+                # not arrived yet.
+                count = self._size - (self.packet_size - 1)
+                self.dropped_bytes += count
+                self._synchronized = False
+                self._consume(count)
+                continue
+            self.resyncs += 1
+            if not self._synchronized and found[0] >= self.payload_size:
+                # Skip the bytes in front of the packet ending with the footer.
+                count = found[0] - self.payload_size
+                self.dropped_bytes += count
+                self._synchronized = True
+                self._consume(count)
+                continue
+            # The footer ends a damaged packet, the next packet starts behind it.
+            count = found[0] + footer_size
+            self.dropped_packets += 1
+            self.dropped_bytes += count
+            self._synchronized = True
+            self._consume(count)
@@ -0,0 +1,56 @@
+"""Fixed capacity history of the posteriors received by the debugger."""
+
+import numpy as np
+
+
+class HistoryBuffer:
+    """Ring buffer of timestamps and rows of values with O(1) appends.
+
+    Like the ring buffer of the PacketFramer, the rows are stored twice in a row, so the
+    history is always available as contiguous view.
+
+    Args:
+        capacity: Number of rows kept, older rows are overwritten.
+        width: Number of values per row.
+        dtype: Type of the values.
+    """
+
+    def __init__(self, capacity, width, dtype=np.float64):
+        self.capacity = capacity
+        self._times = np.zeros(2 * capacity)
+        self._values = np.zeros((2 * capacity, width), dtype=dtype)
+        self.count = 0  # Number of rows appended so far.
+        self._sequence = 0  # Odd while a row is written.
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, values):
+        position = self.count % self.capacity
+        self._sequence += 1
+        for offset in [0, self.capacity]:
+            self._times[position + offset] = timestamp
+            self._values[position + offset] = values
+        # The row is only published after it has been written.
+        self.count += 1
+        self._sequence += 1
+
+    def view(self):
+        """Returns views of the timestamps and values of the kept rows, oldest first."""
+        count = self.count
+        size = min(count, self.capacity)
+        start = (count - size) % self.capacity
+        return self._times[start : start + size], self._values[start : start + size]
+
+    def snapshot(self):
+        """Returns copies of the kept rows, consistent while another thread appends.
+
+        Once the buffer is full, an append overwrites the oldest row of the view, so the copy
+        is repeated if a row was written meanwhile.
+        """
+        while True:
+            sequence = self._sequence
+            if sequence % 2 == 0:
+                times, values = (array.copy() for array in self.view())
+                if self._sequence == sequence:
+                    return times, values
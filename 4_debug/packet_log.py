@@ -0,0 +1,100 @@
+"""Append-only binary log of the packets received by the debugger.
+
+A log starts with a magic number, the length of a JSON header and the header itself, which
+describes the payload (size, feature shape and labels). It is followed by records of a fixed
+size, each one the host timestamp as float64 and the raw payload. Record i starts at
+header_size + i * record_size, so the fixed size serves as index and the reader can memory map
+all records as one structured array. A record cut off by a crash is ignored.
+
+1_train/replay.py reads the same layout without importing this module, so changes to the
+format have to be made in both places.
+"""
+
+import json
+import time
+import struct
+
+import numpy as np
+
+LOG_MAGIC = b"MKWSLOG1"
+FLUSH_INTERVAL = 1.0  # Seconds between flushes of the writer.
+
+
+def record_dtype(payload_size):
+    return np.dtype([("time", "<f8"), ("payload", np.uint8, (payload_size,))])
+
+
+class PacketLogWriter:
+    """Writes received payloads to a new log.
+
+    Args:
+        path: Path of the log, an existing file is replaced.
+        payload_size: Number of bytes of every payload.
+        metadata: Dict stored in the header, e.g. the feature shape and labels.
+    """
+
+    def __init__(self, path, payload_size, metadata=None):
+        self.payload_size = payload_size
+        self.count = 0
+        header = json.dumps({**(metadata or {}), "payload_size": payload_size}).encode()
+        self._handle = open(path, "wb")
+        self._handle.write(LOG_MAGIC + struct.pack("<I", len(header)) + header)
+        self._last_flush = time.perf_counter()
+
+    def append(self, timestamp, payload):
+        assert len(payload) == self.payload_size, "Payload size does not match the log"
+        self._handle.write(struct.pack("<d", timestamp))
+        self._handle.write(payload)
+        self.count += 1
+        # Flush regularly, so a crash only loses the last moments.
+        if time.perf_counter() - self._last_flush > FLUSH_INTERVAL:
+            self._handle.flush()
+            self._last_flush = time.perf_counter()
+
+    def close(self):
+        self._handle.close()
+
+
+class PacketLog:
+    """Reads a log written by PacketLogWriter.
+
+    Args:
+        path: Path of the log.
+
+    Attributes:
+        metadata: The header of the log.
+        records: Structured array with the fields time and payload of all complete records.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as handle:
+            magic = handle.read(len(LOG_MAGIC))
+            if magic != LOG_MAGIC:
+                raise ValueError(f"{path} is not a packet log")
+            (header_size,) = struct.unpack("<I", handle.read(4))
+            self.metadata = json.loads(handle.read(header_size))
+            offset = handle.tell()
+            handle.seek(0, 2)
+            file_size = handle.tell()
+
+        dtype = record_dtype(self.metadata["payload_size"])
+        count = (file_size - offset) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def payload_size(self):
+        return self.metadata["payload_size"]
+
+    @property
+    def times(self):
+        return self.records["time"]
+
+    def find(self, timestamp):
+        """Returns the index of the first record at or after the timestamp."""
+        return int(np.searchsorted(self.times, timestamp))
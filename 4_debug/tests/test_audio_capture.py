@@ -0,0 +1,53 @@
+import numpy as np
+import scipy.io.wavfile
+
+from audio_capture import AudioCapture
+from fake_serial import audio_payload
+from framer import PacketFramer, UART_PACKET_FOOTER
+
+PACKET_SAMPLES = 100
+
+
+def _packets(sequence_numbers):
+    return [
+        audio_payload(idx, np.arange(PACKET_SAMPLES) + 1000 * idx) + UART_PACKET_FOOTER
+        for idx in sequence_numbers
+    ]
+
+
+def _capture(capture, packets):
+    framer = PacketFramer(capture.payload_size)
+    for packet in packets:
+        for payload in framer.feed(packet):
+            capture.add_packet(payload)
+
+
+def test_capture_fills_lost_packets(tmp_path):
+    path = tmp_path / "audio.wav"
+    capture = AudioCapture(path, PACKET_SAMPLES, 8 * PACKET_SAMPLES, chunk_packets=3)
+    # Packets 2 and 3 are lost, the first packet arrives twice.
+    _capture(capture, _packets([0, 0, 1, 4, 5, 6]))
+    assert not capture.done and capture.lost_packets == 2 and capture.duplicate_packets == 1
+
+    # Completed chunks are readable during the recording.
+    rate, samples = scipy.io.wavfile.read(path)
+    assert rate == 16000 and len(samples) == 6 * PACKET_SAMPLES
+
+    # Samples beyond the total length are dropped.
+    _capture(capture, _packets([7, 8]))
+    assert capture.done
+    capture.close()
+    _, samples = scipy.io.wavfile.read(path)
+    expected = np.concatenate([np.arange(PACKET_SAMPLES) + 1000 * idx for idx in range(8)])
+    expected[2 * PACKET_SAMPLES : 4 * PACKET_SAMPLES] = 0
+    np.testing.assert_array_equal(samples, expected)
+
+
+def test_capture_without_length(tmp_path):
+    path = tmp_path / "audio.wav"
+    capture = AudioCapture(path, PACKET_SAMPLES, chunk_packets=4)
+    _capture(capture, _packets(range(1000)))
+    assert not capture.done and capture.samples == 1000 * PACKET_SAMPLES
+    capture.close()
+    _, samples = scipy.io.wavfile.read(path)
+    assert len(samples) == 1000 * PACKET_SAMPLES
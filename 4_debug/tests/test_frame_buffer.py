@@ -0,0 +1,65 @@
+import threading
+
+import matplotlib
+
+matplotlib.use("Agg")
+import numpy as np
+
+from debug import LoopRunner
+from fake_serial import debug_payload
+from frame_buffer import FrameBuffer
+from history import HistoryBuffer
+from test_packet_log import _args
+
+DTYPE = np.dtype([("values", np.int64, (256,)), ("index", np.int64)])
+
+
+def test_frame_buffer_reads_whole_frames():
+    frames = FrameBuffer(DTYPE)
+    history = HistoryBuffer(8, 256, np.int64)
+    out = np.zeros((), dtype=DTYPE)
+    assert frames.read(out) == 0
+    count = 20000
+
+    def _write():
+        for idx in range(1, count + 1):
+            frame = frames.back()
+            frame["values"] = idx
+            frame["index"] = idx
+            frames.publish()
+            history.append(idx, np.full(256, idx))
+
+    writer = threading.Thread(target=_write)
+    writer.start()
+    last = 0
+    while writer.is_alive() or last < count:
+        published = frames.read(out)
+        # Frames are never torn and never go back in time.
+        assert np.all(out["values"] == out["index"])
+        assert out["index"] == published >= last
+        last = published
+        times, values = history.snapshot()
+        np.testing.assert_array_equal(values, np.repeat(times[:, None], 256, axis=1))
+    writer.join()
+
+
+def test_render_blits_changed_frames():
+    runner = LoopRunner(_args(headless=False, max_fps=30), None)
+    runner.setup_plotter()
+    runner.render()
+    assert runner.backgrounds is not None
+
+    features = np.arange(12) - 6
+    for idx in range(3):
+        payload = np.frombuffer(debug_payload(features, [idx, 1, 2, 3], 2), dtype=np.uint8)
+        runner.handle_packet(payload, idx * 0.1)
+    runner.render()
+    assert runner.rendered == 3 and runner.frames_rendered == 1 and runner.frames_skipped == 2
+    np.testing.assert_array_equal(runner.feature_graph.get_array(), features.reshape(4, 3).T)
+    assert runner.bar_plot[0].get_height() == 2
+    assert runner.top_category_text.get_text() == "Detected: yes"
+    np.testing.assert_allclose(runner.category_graphs[0].get_xdata(), [0, 0.1, 0.2])
+
+    # Nothing new, nothing is drawn.
+    runner.render()
+    assert runner.frames_rendered == 1
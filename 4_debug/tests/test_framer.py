@@ -0,0 +1,89 @@
+import numpy as np
+import serial
+
+from fake_serial import FakeSerialDevice
+from framer import PacketFramer, UART_PACKET_FOOTER
+
+PAYLOAD_SIZE = 20
+
+
+def _payloads(count, seed=0):
+    payloads = np.random.default_rng(seed).integers(0, 256, (count, PAYLOAD_SIZE), dtype=np.uint8)
+    # Payload bytes equal to the footer must not be mistaken for the end of the packet.
+    payloads[0, 4:12] = np.frombuffer(UART_PACKET_FOOTER, dtype=np.uint8)
+    return payloads
+
+
+def _stream(payloads):
+    return b"".join(payload.tobytes() + UART_PACKET_FOOTER for payload in payloads)
+
+
+def test_framer_in_chunks():
+    payloads = _payloads(50)
+    stream = _stream(payloads)
+    framer = PacketFramer(PAYLOAD_SIZE, capacity=2 * (PAYLOAD_SIZE + len(UART_PACKET_FOOTER)))
+    received = []
+    rng = np.random.default_rng(1)
+    start = 0
+    while start < len(stream):
+        end = start + int(rng.integers(1, 100))
+        received.extend(payload.copy() for payload in framer.feed(stream[start:end]))
+        start = end
+
+    np.testing.assert_array_equal(received, payloads)
+    assert (framer.packets, framer.dropped_packets, framer.resyncs) == (50, 0, 0)
+
+
+def test_framer_resynchronizes():
+    payloads = _payloads(6)
+    # Leading garbage, a truncated and an overlong packet.
+    stream = (
+        b"\xff" * 7
+        + _stream(payloads[:2])
+        + payloads[2, :5].tobytes()
+        + UART_PACKET_FOOTER
+        + _stream(payloads[3:4])
+        + payloads[4].tobytes()
+        + b"\xff\xff"
+        + UART_PACKET_FOOTER
+        + _stream(payloads[5:])
+    )
+    framer = PacketFramer(PAYLOAD_SIZE)
+    received = [payload.copy() for payload in framer.feed(stream)]
+
+    # The first packet is lost with the garbage, the footer bytes inside of it cost one
+    # additional resynchronization.
+    np.testing.assert_array_equal(received, payloads[[1, 3, 5]])
+    assert framer.packets == 3
+    assert framer.dropped_packets == framer.resyncs == 4
+
+
+def test_framer_keeps_packet_behind_garbage():
+    # Without footer bytes inside the payloads.
+    payloads = _payloads(4)[1:]
+    # Connecting in the middle of a packet, the garbage has no footer.
+    stream = b"\xff" * 10 + _stream(payloads)
+    framer = PacketFramer(PAYLOAD_SIZE)
+    received = []
+    for start in range(0, len(stream), 16):
+        received.extend(payload.copy() for payload in framer.feed(stream[start : start + 16]))
+
+    np.testing.assert_array_equal(received, payloads)
+    assert framer.packets == 3 and framer.dropped_packets == 0
+    assert framer.dropped_bytes == 10
+
+
+def test_framer_reads_fake_serial_device():
+    payloads = _payloads(10)
+    with FakeSerialDevice() as device:
+        ser = serial.Serial(device.port, timeout=0.5)
+        for payload in payloads:
+            device.write_packet(payload)
+
+        framer = PacketFramer(PAYLOAD_SIZE)
+        received = []
+        while len(received) < len(payloads):
+            received.extend(payload.copy() for payload in framer.read_packets(ser))
+        ser.close()
+
+    np.testing.assert_array_equal(received, payloads)
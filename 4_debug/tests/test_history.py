@@ -0,0 +1,19 @@
+import numpy as np
+
+from history import HistoryBuffer
+
+
+def test_history_keeps_last_rows():
+    history = HistoryBuffer(capacity=4, width=2, dtype=np.uint8)
+    times, values = history.view()
+    assert len(history) == 0 and times.shape == (0,) and values.shape == (0, 2)
+
+    for idx in range(10):
+        history.append(idx * 0.1, [idx, 2 * idx])
+        times, values = history.view()
+        kept = np.arange(max(idx - 3, 0), idx + 1)
+        np.testing.assert_allclose(times, kept * 0.1)
+        np.testing.assert_array_equal(values, np.stack([kept, 2 * kept], axis=1))
+    assert len(history) == 4 and history.count == 10
+    # The views share the memory of the buffer.
+    assert np.shares_memory(values, history._values)
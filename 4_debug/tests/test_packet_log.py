@@ -0,0 +1,71 @@
+import argparse
+
+import matplotlib
+
+matplotlib.use("Agg")
+import numpy as np
+
+from debug import LoopRunner
+from fake_serial import debug_payload
+from packet_log import PacketLog, PacketLogWriter
+
+
+def _args(**kwargs):
+    args = dict(
+        feature_height=4,
+        feature_width=3,
+        feature_min=-128,
+        feature_max=127,
+        standard_labels=["silence", "unknown"],
+        category_labels=["yes", "no"],
+        category_min=0,
+        category_max=255,
+        category_history=20,
+        record=None,
+        replay=None,
+        replay_speed=1.0,
+        headless=True,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_log_round_trip(tmp_path):
+    path = tmp_path / "packets.log"
+    payloads = np.random.default_rng(0).integers(0, 256, (10, 7), dtype=np.uint8)
+    writer = PacketLogWriter(path, 7, {"feature_height": 2})
+    for idx, payload in enumerate(payloads):
+        writer.append(100.0 + idx / 2, payload.tobytes())
+    writer.close()
+    # A record cut off while writing is ignored.
+    with open(path, "ab") as handle:
+        handle.write(b"\x00" * 9)
+
+    log = PacketLog(path)
+    assert len(log) == 10
+    assert log.metadata == {"feature_height": 2, "payload_size": 7}
+    np.testing.assert_array_equal(log.records["payload"], payloads)
+    np.testing.assert_allclose(log.times, 100.0 + np.arange(10) / 2)
+    assert log.find(102.2) == 5
+
+
+def test_replay(tmp_path):
+    path = tmp_path / "packets.log"
+    features = np.arange(12) - 6
+    writer = PacketLogWriter(path, 12 + 4 + 1)
+    for idx in range(30):
+        writer.append(1000.0 + idx / 10, debug_payload(features, [idx, 1, 2, 3], idx % 4))
+    writer.close()
+
+    runner = LoopRunner(_args(replay=str(path), replay_speed=0), None)
+    runner.start()
+    runner.run_loop_thread.join()
+
+    assert not runner.run
+    times, categories = runner.history.view()
+    np.testing.assert_allclose(times, np.arange(10, 30) / 10)
+    np.testing.assert_array_equal(categories[:, 0], np.arange(10, 30))
+    assert runner.top_category_index == 29 % 4
+    frame = np.zeros((), dtype=runner.frames.back().dtype)
+    assert runner.frames.read(frame) == 30
+    np.testing.assert_array_equal(frame["features"], features.reshape(4, 3).T)